@@ -1,61 +1,119 @@
 from input_generation import BaseInputGenerator
 from test_validation import TestValidator as BaseTestValidator
+from test_discovery import TestDiscovery, TestDiscoveryGroup
 import os
 import utils
 import glob
+import seed_generation
 from harness_generation import HarnessCreator
 
 bin_dir = os.path.abspath('./afl/bin')
-findings_dir = utils.get_file_path('findings', temp_dir=True)
+test_pattern = 'id:*'
 name = 'afl-fuzz'
 
 
-def get_test_name(test_file):
-    return os.path.basename(test_file)
+def get_findings_dir():
+    return utils.get_file_path('findings', temp_dir=True)
+
+
+def get_instance_name(instance):
+    return 'fuzzer' + str(instance)
 
 
-def get_test_cases(exclude=[]):
+def get_queue_dir(instance=None):
+    """Returns the queue directory of the given AFL instance.
+    If no instance is given, it is the queue of a single AFL that runs without sync directory."""
     # 'crashes' and 'hangs' cannot lead to an error as long as we don't abort in __VERIFIER_error()
-    interesting_subdirs = ['queue']
-    tcs = list()
-    for s in interesting_subdirs:
-        abs_dir = os.path.join(findings_dir, s)
-        for t in glob.glob(abs_dir + '/id:*'):
-            test_name = get_test_name(t)
-            if test_name not in exclude:
-                with open(t, 'rb') as inp:
-                    content = inp.read()
-                tcs.append(utils.TestCase(test_name, t, content))
-    return tcs
+    if instance is None:
+        return os.path.join(get_findings_dir(), 'queue')
+    return os.path.join(get_findings_dir(), get_instance_name(instance), 'queue')
+
+
+def get_queue_dirs(instances=1):
+    if instances == 1:
+        return [get_queue_dir()]
+    return [get_queue_dir(i) for i in range(instances)]
+
+
+def get_test_name(test_file):
+    # With several instances, the queues contain tests with the same names
+    queue_dir = os.path.dirname(test_file)
+    instance_dir = os.path.dirname(queue_dir)
+    if os.path.normpath(instance_dir) == os.path.normpath(get_findings_dir()):
+        return os.path.basename(test_file)
+    return os.path.basename(instance_dir) + '.' + os.path.basename(test_file)
+
+
+def is_synced(test_file):
+    """Returns whether the given test was copied from the queue of another instance.
+    The original test is in the queue of that instance, so the copy does not have to be looked at."""
+    return ',sync:' in os.path.basename(test_file)
+
+
+def get_test_case(test_file):
+    with open(test_file, 'rb') as inp:
+        content = inp.read()
+    return utils.TestCase(get_test_name(test_file), test_file, content)
+
+
+def get_test_cases(exclude=[], instances=1):
+    all_tests = list()
+    for queue_dir in get_queue_dirs(instances):
+        all_tests += [t for t in glob.glob(os.path.join(queue_dir, test_pattern)) if not is_synced(t)]
+    return [get_test_case(t) for t in all_tests if get_test_name(t) not in exclude]
 
 
 class InputGenerator(BaseInputGenerator):
 
+    def __init__(self, timelimit, machine_model, log_verbose, instances=1):
+        super().__init__(timelimit, machine_model, log_verbose)
+        self.instances = instances
+        self._cores = self._get_cores(instances) if instances > 1 else []
+        self.statistics.add_value('Number of AFL instances', utils.Constant(instances))
+        self.number_initial_tests = utils.Constant()
+        self.statistics.add_value('Number of initial test cases', self.number_initial_tests)
+
     def create_input_generation_cmds(self, program_file):
-        instrumented_program = 'tested.out'
+        instrumented_program = utils.get_file_path('tested.out', temp_dir=True)
         compile_cmd = [os.path.join(bin_dir, 'afl-gcc'),
                        self.machine_model.compile_parameter,
                        '-o', instrumented_program,
                        program_file]
+        compile_cmd = utils.CompileCommand(compile_cmd, instrumented_program, [program_file])
 
         testcase_dir = self._create_testcase_dir()
-        input_gen_cmd = [os.path.join(bin_dir, 'afl-fuzz'),
-                         '-i', testcase_dir,
-                         '-o', findings_dir,
-                         '--',
-                         os.path.abspath(instrumented_program)]
+        if self.instances == 1:
+            input_gen_cmd = self._get_fuzz_cmd(testcase_dir, instrumented_program)
+        else:
+            # All instances share the findings directory as sync directory.
+            # The first one is the master, which does the deterministic checks
+            input_gen_cmd = utils.ParallelCommands()
+            for instance in range(self.instances):
+                instance_args = ['-M' if instance == 0 else '-S', get_instance_name(instance)]
+                fuzz_cmd = self._get_fuzz_cmd(testcase_dir, instrumented_program, instance_args)
+                input_gen_cmd.append(self._pin_to_core(fuzz_cmd, self._cores, instance))
         return [compile_cmd, input_gen_cmd]
 
+    def _get_fuzz_cmd(self, testcase_dir, instrumented_program, instance_args=[]):
+        return [os.path.join(bin_dir, 'afl-fuzz'),
+                '-i', testcase_dir,
+                '-o', get_findings_dir()] \
+               + instance_args \
+               + ['--', os.path.abspath(instrumented_program)]
+
     def _create_testcase_dir(self):
         testcase_dir = utils.get_file_path('initial_testcases', temp_dir=True)
         os.mkdir(testcase_dir)
-        initial_testcase = os.path.join(testcase_dir, '0.afl-test')
-        with open(initial_testcase, 'w+') as outp:
-            outp.write(1000 * '0\n')  # FIXME: This is an unreliable first test case
+        seeds = seed_generation.get_seeds(self.program_file, self.machine_model)
+        for number, seed in enumerate(seeds):
+            initial_testcase = os.path.join(testcase_dir, str(number) + '.afl-test')
+            with open(initial_testcase, 'w+') as outp:
+                outp.write(seed)
+        self.number_initial_tests.value = len(seeds)
         return testcase_dir
 
     def get_test_count(self):
-        files = get_test_cases()
+        files = get_test_cases(instances=self.instances)
         if not files:
             raise utils.InputGenerationError("No test files generated")
         return len(files)
@@ -68,6 +126,9 @@ class InputGenerator(BaseInputGenerator):
         env['AFL_PATH'] = bin_dir
         env['AFL_I_DONT_CARE_ABOUT_MISSING_CRASHES'] = 'true'
         env['AFL_SKIP_CPUFREQ'] = 'true'
+        if self._cores:
+            # The instances are pinned to their cores with taskset
+            env['AFL_NO_AFFINITY'] = 'true'
         return env
 
     def prepare(self, filecontent, nondet_methods_used):
@@ -80,11 +141,23 @@ class InputGenerator(BaseInputGenerator):
 
 class AflTestValidator(BaseTestValidator):
 
+    def __init__(self, validation_config, instances=1):
+        super().__init__(validation_config)
+        self.instances = instances
+
     def get_name(self):
         return name
 
     def get_test_cases(self, exclude):
-        return get_test_cases(exclude)
+        return get_test_cases(exclude, self.instances)
+
+    def create_test_discovery(self):
+        if self.instances == 1:
+            return TestDiscovery(get_queue_dir(), test_pattern)
+        return TestDiscoveryGroup([TestDiscovery(d, test_pattern) for d in get_queue_dirs(self.instances)])
+
+    def get_test_cases_from(self, test_files, exclude):
+        return [get_test_case(t) for t in test_files if not is_synced(t) and get_test_name(t) not in exclude]
 
     def get_test_vector(self, test_case):
         vector = utils.TestVector(test_case.name, test_case.origin)
@@ -0,0 +1,223 @@
+import hashlib
+import logging
+import os
+import pickle
+import shutil
+import tempfile
+from collections import OrderedDict
+from threading import Lock
+
+import utils
+
+# The cache used by all components. It is None if no cache is configured.
+cache = None
+
+# Number of python objects that are kept in memory by load and store.
+# Only small objects should be kept in memory, since a process may run many tasks
+memory_cache_size = 16
+_memory_cache = OrderedDict()
+_memory_cache_lock = Lock()
+
+
+def configure(directory, max_size):
+    """Sets up the cache in the given directory, with a maximum size of max_size MB."""
+    global cache
+    if directory:
+        cache = ArtifactCache(directory, max_size * 1024 * 1024)
+    else:
+        cache = None
+
+
+class ArtifactCache(object):
+    """
+    Content-addressed on-disk cache of files created from the program under test,
+    like prepared sources, bitcode and compiled executables.
+
+    Each file is stored under a key that is computed from everything that determines its content.
+    The cache can be shared by multiple runs, also concurrently: files enter the cache through an atomic rename.
+    If the cache grows larger than max_size bytes, the least recently used files are removed
+    until it is at most target_ratio times max_size large.
+
+    The size of the cache is tracked in memory, so that the directory is only listed when files have to be removed.
+    Files stored by other runs are only noticed then.
+    """
+
+    target_ratio = 0.9
+
+    def __init__(self, directory, max_size):
+        self.directory = os.path.abspath(directory)
+        self.max_size = max_size
+        self._lock = Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        self._size = sum(e[1] for e in self._get_entries())
+
+    @staticmethod
+    def get_key(*components):
+        key = hashlib.sha1()
+        for component in components:
+            key.update(str(component).encode())
+            key.update(b'\0')
+        return key.hexdigest()
+
+    def _get_entry(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, key, target_file):
+        """Copies the file cached for the given key to target_file.
+        Returns whether such a file existed in the cache."""
+        entry = self._get_entry(key)
+        try:
+            shutil.copy(entry, target_file)
+            os.utime(entry)  # The modification time orders the entries for eviction
+        except FileNotFoundError:
+            return False
+        logging.debug("Reusing cached file for %s", target_file)
+        return True
+
+    def put(self, key, source_file):
+        """Stores a copy of source_file in the cache under the given key."""
+        fd, tmp_entry = tempfile.mkstemp(dir=self.directory, prefix='.')
+        os.close(fd)
+        entry = self._get_entry(key)
+        try:
+            shutil.copy(source_file, tmp_entry)
+            size = os.path.getsize(tmp_entry)
+            try:
+                replaced_size = os.path.getsize(entry)
+            except FileNotFoundError:
+                replaced_size = 0
+            os.replace(tmp_entry, entry)
+        except OSError as e:
+            logging.warning("Can't store %s in cache: %s", source_file, e)
+            if os.path.exists(tmp_entry):
+                os.remove(tmp_entry)
+            return
+        with self._lock:
+            self._size += size - replaced_size
+            if self._size > self.max_size:
+                self._evict()
+
+    def get_object(self, key):
+        """Returns the python object cached for the given key, or None if there is none."""
+        entry = self._get_entry(key)
+        try:
+            with open(entry, 'rb') as inp:
+                obj = pickle.load(inp)
+            os.utime(entry)
+        except FileNotFoundError:
+            return None
+        except (OSError, pickle.UnpicklingError, EOFError) as e:
+            logging.warning("Can't read cache entry %s: %s", key, e)
+            return None
+        return obj
+
+    def put_object(self, key, obj):
+        """Stores the given python object in the cache under the given key."""
+        fd, tmp_file = tempfile.mkstemp(dir=self.directory, prefix='.')
+        try:
+            with os.fdopen(fd, 'wb') as outp:
+                pickle.dump(obj, outp)
+            self.put(key, tmp_file)
+        finally:
+            os.remove(tmp_file)
+
+    def _get_entries(self):
+        """Returns the modification time, size and path of each file in the cache."""
+        entries = list()
+        for name in os.listdir(self.directory):
+            if name.startswith('.'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue  # Evicted by another run
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _evict(self):
+        # Other runs may have changed the cache, so its actual size is determined here
+        entries = self._get_entries()
+        total_size = sum(e[1] for e in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.target_ratio * self.max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+        self._size = total_size
+
+
+def load(key, remember=True):
+    """
+    Returns the python object stored for the given key, or None if there is none.
+    Objects are looked up in memory first and in the configured cache afterwards.
+    If remember is not set, an object loaded from the configured cache is not kept in memory.
+    """
+    with _memory_cache_lock:
+        if key in _memory_cache:
+            _memory_cache.move_to_end(key)
+            return _memory_cache[key]
+    obj = cache.get_object(key) if cache else None
+    if obj is not None and remember:
+        _remember(key, obj)
+    return obj
+
+
+def store(key, obj, persistent=True, remember=True):
+    """Stores the given python object for the given key. If persistent is set,
+    it is also stored in the configured cache, so that other runs can use it.
+    If remember is set, it is kept in memory, too."""
+    if remember:
+        _remember(key, obj)
+    if persistent and cache:
+        cache.put_object(key, obj)
+
+
+def _remember(key, obj):
+    with _memory_cache_lock:
+        _memory_cache[key] = obj
+        _memory_cache.move_to_end(key)
+        while len(_memory_cache) > memory_cache_size:
+            _memory_cache.popitem(last=False)
+
+
+def get_file_key(file_name):
+    """Returns a key that identifies the content of the given file."""
+    return utils.get_program_info(file_name).hash
+
+
+def get_command_key(cmd, output_file, input_files):
+    """
+    Returns the cache key for the output_file created by the given command.
+    The key is computed from the arguments of the command, with each of the input files
+    replaced by the hash of its content.
+    """
+    input_keys = {f: get_file_key(f) for f in input_files}
+    arguments = list()
+    for arg in cmd:
+        if arg == output_file:
+            arguments.append('<output>')
+        else:
+            arguments.append(input_keys.get(arg, arg))
+    return ArtifactCache.get_key(*arguments)
+
+
+def execute_cached(cmd, output_file, input_files, **kwargs):
+    """
+    Runs the given command that creates output_file from the given input files,
+    unless the output file is in the cache already.
+    All keyword arguments are passed to utils.execute.
+    """
+    if not cache:
+        return utils.execute(cmd, **kwargs)
+
+    key = get_command_key(cmd, output_file, input_files)
+    if cache.get(key, output_file):
+        return utils.ExecutionResult(0, '', None)
+    result = utils.execute(cmd, **kwargs)
+    if result.returncode == 0 and os.path.exists(output_file):
+        cache.put(key, output_file)
+    return result
@@ -977,4 +977,72 @@ class FuncDeclCollector(a.NodeVisitor):
         pass  # Don't go deeper so we don't collect function pointer
 
     def visit_Typedef(self, node):
-        pass  # Don't go deeper so we don't collect typedef functions
\ No newline at end of file
+        pass  # Don't go deeper so we don't collect typedef functions
+
+
+def get_integer_value(node):
+    """Returns the value of the given node if it is an integer constant, and None otherwise."""
+    if type(node) is a.Constant:
+        if node.type == 'char':
+            literal = node.value[1:-1]
+            return ord(literal) if len(literal) == 1 else None
+        if node.type not in ('int', 'unsigned int', 'long int', 'unsigned long int',
+                             'long long int', 'unsigned long long int'):
+            return None
+        literal = node.value.rstrip('uUlL')
+        try:
+            if literal[:2].lower() in ('0x', '0b'):
+                return int(literal, 0)
+            elif len(literal) > 1 and literal[0] == '0':
+                return int(literal, 8)
+            else:
+                return int(literal)
+        except ValueError:
+            return None
+    elif type(node) is a.UnaryOp and node.op == '-':
+        value = get_integer_value(node.expr)
+        return -value if value is not None else None
+    elif type(node) is a.Cast:
+        return get_integer_value(node.expr)
+    return None
+
+
+class ComparisonConstantCollector(a.NodeVisitor):
+    """
+    Collects the integer constants that expressions are compared to, and the labels of switch cases.
+    Each constant is stored together with the name of the function it appears in.
+    The functions that call one of the given nondet methods are collected, too.
+    """
+
+    comparison_operators = ('==', '!=', '<', '<=', '>', '>=')
+
+    def __init__(self, nondet_method_names):
+        self.nondet_method_names = set(nondet_method_names)
+        self.constants = []
+        self.nondet_functions = set()
+        self.current_function = None
+
+    def visit_FuncDef(self, node):
+        self.current_function = get_name(node.decl)
+        self.generic_visit(node)
+        self.current_function = None
+
+    def visit_FuncCall(self, node):
+        if type(node.name) is a.ID and node.name.name in self.nondet_method_names:
+            self.nondet_functions.add(self.current_function)
+        self.generic_visit(node)
+
+    def visit_BinaryOp(self, node):
+        if node.op in self.comparison_operators:
+            for operand, other in ((node.left, node.right), (node.right, node.left)):
+                value = get_integer_value(operand)
+                # Comparisons of two constants don't depend on any input
+                if value is not None and get_integer_value(other) is None:
+                    self.constants.append((self.current_function, value))
+        self.generic_visit(node)
+
+    def visit_Case(self, node):
+        value = get_integer_value(node.expr)
+        if value is not None:
+            self.constants.append((self.current_function, value))
+        self.generic_visit(node)
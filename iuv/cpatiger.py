@@ -1,5 +1,6 @@
 from input_generation import BaseInputGenerator
 from test_validation import TestValidator
+from test_discovery import TestDiscovery
 import utils
 import os
 import logging
@@ -7,24 +8,46 @@ import logging
 base_dir = os.path.abspath('./cpatiger')
 binary_dir = os.path.join(base_dir, 'scripts')
 binary = os.path.join(binary_dir, 'cpa.sh')
-tests_dir = os.path.join(utils.tmp, 'output')
-tests_file = os.path.join(tests_dir, 'testsuite.txt')
 input_method = 'input'
 name = 'cpatiger'
 
 
+def get_tests_dir():
+    return utils.get_file_path('output', temp_dir=True)
+
+
+def get_tests_file():
+    return os.path.join(get_tests_dir(), 'testsuite.txt')
+
+
+class TestSuiteParser(object):
+    """Parses the tests that were appended to the test suite of CPATiger since the last call."""
+
+    def __init__(self):
+        self.tests_file = get_tests_file()
+        self._reader = utils.IncrementalFileReader(self.tests_file)
+        self._count = 0
+
+    def read_new_test_cases(self, final=False):
+        try:
+            lines = self._reader.read_new_lines(final)
+        except ValueError as e:
+            logging.warning("%s. Reading it again.", e)
+            self._reader.reset()
+            self._count = 0
+            lines = self._reader.read_new_lines(final)
+
+        test_cases = list()
+        for line in [l.strip() for l in lines]:
+            if line.startswith('[') and line.endswith(']'):
+                test_cases.append(utils.TestCase(str(self._count), self.tests_file, line))
+                self._count += 1
+        return test_cases
+
+
 def get_test_cases(exclude=[]):
-    if os.path.exists(tests_file):
-        with open(tests_file, 'r') as inp:
-            tests = [l.strip() for l in inp.readlines()
-                     if l.strip().startswith('[') and l.strip().endswith(']')]
-        tests = [t for i, t in enumerate(tests) if str(i) not in exclude]
-        tcs = list()
-        for i, t in enumerate(tests):
-            tcs.append(utils.TestCase(str(i), tests_file, t))
-        return tcs
-    else:
-        return []
+    test_cases = TestSuiteParser().read_new_test_cases(final=True)
+    return [t for t in test_cases if t.name not in exclude]
 
 
 class InputGenerator(BaseInputGenerator):
@@ -76,7 +99,7 @@ class InputGenerator(BaseInputGenerator):
         if self.timelimit > 0:
             input_generation_cmd += ['-timelimit', str(self.timelimit)]
         input_generation_cmd += ['-tiger-variants',
-                                 '-outputpath', tests_dir,
+                                 '-outputpath', get_tests_dir(),
                                  '-spec', utils.spec_file,
                                  filename]
 
@@ -103,3 +126,12 @@ class CpaTigerTestValidator(TestValidator):
 
     def get_test_cases(self, exclude=[]):
         return get_test_cases(exclude)
+
+    def create_test_discovery(self):
+        self._test_suite_parser = TestSuiteParser()
+        return TestDiscovery(get_tests_dir(), os.path.basename(self._test_suite_parser.tests_file),
+                             report_changes=True)
+
+    def get_test_cases_from(self, test_files, exclude):
+        final = self._test_discovery.is_finished()
+        return [t for t in self._test_suite_parser.read_new_test_cases(final) if t.name not in exclude]
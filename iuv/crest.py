@@ -1,5 +1,6 @@
 from input_generation import BaseInputGenerator
 from test_validation import TestValidator
+from test_discovery import TestDiscovery
 import utils
 import os
 import logging
@@ -12,14 +13,15 @@ name = 'crest'
 test_name_pattern = re.compile('input[0-9]+$')
 
 
-def get_test_cases(exclude=[]):
-    all_tests = [t for t in os.listdir('.') if test_name_pattern.match(utils.get_file_name(t))]
-    tcs = list()
-    for t in [t for t in all_tests if utils.get_file_name(t) not in exclude]:
-        with open(t, 'r') as inp:
-            content = inp.read()
-        tcs.append(utils.TestCase(utils.get_file_name(t), t, content))
-    return tcs
+def get_test_case(test_file):
+    with open(test_file, 'r') as inp:
+        content = inp.read()
+    return utils.TestCase(utils.get_file_name(test_file), test_file, content)
+
+
+def get_test_cases(exclude=[], directory='.'):
+    all_tests = [os.path.join(directory, t) for t in os.listdir(directory) if test_name_pattern.match(t)]
+    return [get_test_case(t) for t in all_tests if utils.get_file_name(t) not in exclude]
 
 
 class InputGenerator(BaseInputGenerator):
@@ -40,7 +42,7 @@ class InputGenerator(BaseInputGenerator):
         return self._run_env
 
     def get_test_count(self):
-        files = get_test_cases()
+        files = get_test_cases(directory=self.working_dir or '.')
         if not files:
             raise utils.InputGenerationError('No test files generated.')
         return len(files)
@@ -140,4 +142,11 @@ class CrestTestValidator(TestValidator):
         return test_vector
 
     def get_test_cases(self, exclude=[]):
-        return get_test_cases(exclude)
+        return get_test_cases(exclude, self.working_dir or '.')
+
+    def create_test_discovery(self):
+        # Crest writes its tests to the working directory of the input generation
+        return TestDiscovery(os.path.abspath(self.working_dir or '.'), test_name_pattern)
+
+    def get_test_cases_from(self, test_files, exclude):
+        return [get_test_case(t) for t in test_files if utils.get_file_name(t) not in exclude]
@@ -1,42 +1,70 @@
 import os
+import logging
 import utils
 from input_generation import BaseInputGenerator
 from test_validation import TestValidator
+from test_discovery import TestDiscovery
 
 name = "fshell"
 fshell_dir = os.path.abspath("./fshell")
 bin_dir = os.path.join(fshell_dir, "bin")
 fshell_binary = os.path.join(bin_dir, "fshell")
 query_file = os.path.join(fshell_dir, "query-block-coverage")
-tests_file = utils.get_file_path('testsuite.txt', temp_dir=True)
 
 
-def get_test_cases(exclude=[]):
-    if os.path.exists(tests_file):
-        with open(tests_file, 'r') as inp:
-            content = [l.strip() for l in inp.readlines()]
-        if len([l for l in content if "Test Suite" in l]) > 1:
-            raise AssertionError("More than one test suite exists in " + tests_file)
+def get_tests_file():
+    return utils.get_file_path('testsuite.txt', temp_dir=True)
+
+
+class TestSuiteParser(object):
+    """Parses the tests that were appended to the test suite of FShell since the last call."""
+
+    def __init__(self):
+        self.tests_file = get_tests_file()
+        self._reader = utils.IncrementalFileReader(self.tests_file)
+        self._reset()
+
+    def _reset(self):
+        self._reader.reset()
+        self._test_suite_found = False
+        self._curr_test = list()
+        self._count = 1
+
+    def read_new_test_cases(self, final=False):
+        """
+        Returns the new tests. A test is only complete when the next test starts,
+        so the last test is only returned if final is set.
+        """
+        try:
+            lines = self._reader.read_new_lines(final)
+        except ValueError as e:
+            logging.warning("%s. Reading it again.", e)
+            self._reset()
+            lines = self._reader.read_new_lines(final)
 
-        curr_test = list()
         test_cases = list()
-        count = 1
-        for line in content:
+        for line in [l.strip() for l in lines]:
+            if "Test Suite" in line:
+                if self._test_suite_found:
+                    raise AssertionError("More than one test suite exists in " + self.tests_file)
+                self._test_suite_found = True
             if line.startswith("IN:"):
-                test_name = str(count)
-                if test_name not in exclude:
-                    test_cases.append(utils.TestCase(test_name, tests_file, curr_test))
-                curr_test = list()
-                count += 1
+                test_cases.append(utils.TestCase(str(self._count), self.tests_file, self._curr_test))
+                self._curr_test = list()
+                self._count += 1
             if line.startswith("strto"):
                 test_value = line.split("=")[1]
-                curr_test.append(test_value)
-        test_name = str(count)
-        if curr_test and test_name not in exclude:
-            test_cases.append(utils.TestCase(test_name, tests_file, curr_test))
+                self._curr_test.append(test_value)
+        if final and self._curr_test:
+            test_cases.append(utils.TestCase(str(self._count), self.tests_file, self._curr_test))
+            self._curr_test = list()
+            self._count += 1
         return test_cases
-    else:
-        return []
+
+
+def get_test_cases(exclude=[]):
+    test_cases = TestSuiteParser().read_new_test_cases(final=True)
+    return [t for t in test_cases if t.name not in exclude]
 
 
 class InputGenerator(BaseInputGenerator):
@@ -99,7 +127,7 @@ class InputGenerator(BaseInputGenerator):
 
         input_generation_cmd = [fshell_binary,
                                 mm_arg,
-                                "--outfile", tests_file,
+                                "--outfile", get_tests_file(),
                                 "--query-file", query_file,
                                 filename]
 
@@ -117,6 +145,15 @@ class FshellTestValidator(TestValidator):
     def get_name(self):
         return name
 
+    def create_test_discovery(self):
+        self._test_suite_parser = TestSuiteParser()
+        tests_file = self._test_suite_parser.tests_file
+        return TestDiscovery(os.path.dirname(tests_file), os.path.basename(tests_file), report_changes=True)
+
+    def get_test_cases_from(self, test_files, exclude):
+        final = self._test_discovery.is_finished()
+        return [t for t in self._test_suite_parser.read_new_test_cases(final) if t.name not in exclude]
+
     def _get_test_vector(self, test):
         vector = utils.TestVector(test.name, test.origin)
         for tv in test.content:
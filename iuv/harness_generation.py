@@ -65,20 +65,36 @@ class HarnessCreator(object):
         preamble += self._get_vector_read_method()
         return preamble
 
-    def _get_error_definition(self, method_name):
-        definition = 'void {0}() {{\n'.format(method_name)
+    def _get_error_definition(self, method_name, fork_server=False):
+        definition = ''
+        if fork_server:
+            definition += 'extern volatile int * __fs_error_flag;\n'
+        definition += 'void {0}() {{\n'.format(method_name)
         definition += '    fprintf(stderr, \"{0}\\n\");\n'.format(utils.error_string)
+        if fork_server:
+            # The fork server doesn't see the output of its children, so it is told through shared memory
+            definition += '    if (__fs_error_flag) {\n'
+            definition += '        *__fs_error_flag = 1;\n'
+            definition += '    }\n'
         definition += '    exit(1);\n}\n\n'
         return definition.encode()
 
-    def _get_nondet_method_definitions(self, nondet_methods, test_vector):
+    def _get_nondet_method_definitions(self, nondet_methods, test_vector, binary_vectors=False):
         definitions = b''
         if test_vector is not None:
             definitions += b'unsigned int access_counter = 0;\n\n'
         for method in nondet_methods:
             definitions += utils.get_method_head(method['name'], method['type'], method['params']).encode()
             definitions += b' {\n'
-            if method['type'] != 'void':
+            if method['type'] != 'void' and test_vector is None and binary_vectors:
+                # See utils.get_binary_input_vector for the format
+                definitions += b''.join([b'    ', method['type'].encode(), b' value;\n',
+                                         b'    if (fread(&value, sizeof(value), 1, stdin) != 1) {\n',
+                                         b'        fprintf(stderr, "Missing input\\n");\n',
+                                         b'        abort();\n',
+                                         b'    }\n',
+                                         b'    return value;\n'])
+            elif method['type'] != 'void':
                 definitions += "    unsigned int inp_size = 3000;\n".encode()
                 definitions += "    char * inp_var = malloc(inp_size);\n".encode()
                 if test_vector is None:  # Build generic harness
@@ -99,10 +115,154 @@ class HarnessCreator(object):
             definitions += b'}\n\n'
         return definitions
 
-    def create_harness(self, nondet_methods, error_method, test_vector=None):
+    def create_harness(self, nondet_methods, error_method, test_vector=None, fork_server=False, binary_vectors=False):
+        """Creates the source of the harness. If no test vector is given, the harness reads test vectors
+        from stdin: in the binary format of utils.get_binary_input_vector if binary_vectors is set,
+        and as text otherwise."""
         harness = b''
         harness += self._get_preamble()
-        harness += self._get_error_definition(error_method)
-        harness += self._get_nondet_method_definitions(nondet_methods, test_vector)
+        harness += self._get_error_definition(error_method, fork_server)
+        harness += self._get_nondet_method_definitions(nondet_methods, test_vector, binary_vectors)
 
-        return harness
\ No newline at end of file
+        return harness
+
+    def create_nondet_stubs(self, method_names):
+        """
+        Creates the source of weak definitions of the given nondet methods. They let the program under test
+        link even if it calls nondet methods that the harness doesn't define. Calls of them abort,
+        since no test vector provides their values.
+        """
+        stubs = b''
+        for method_name in method_names:
+            stubs += b''.join([b'__attribute__((weak)) void ', method_name.encode(), b'(void) {\n',
+                               b'    __builtin_abort();\n',
+                               b'}\n\n'])
+        return stubs
+
+    def create_fork_server(self):
+        """
+        Creates the source of the fork server that can be linked to the generic harness.
+        The fork server runs as a constructor before main. It reads length-prefixed test vectors
+        from the file descriptor named by the environment variable utils.fork_server_ctl_var,
+        forks one child per vector and feeds the vector to the child's stdin. The child returns
+        from the constructor and runs main as usual. For each vector, the server first reports
+        the pid of the child, then its wait status and then whether it called the error method
+        to the file descriptor named by utils.fork_server_status_var. If these variables are not set,
+        the program behaves like the plain harness.
+        """
+        fork_server = b"""#include <stdlib.h>
+#include <stdint.h>
+#include <unistd.h>
+#include <signal.h>
+#include <sys/types.h>
+#include <sys/wait.h>
+#include <sys/mman.h>
+
+/* Set by the error method of the harness, see HarnessCreator._get_error_definition */
+volatile int * __fs_error_flag = NULL;
+
+static int __fs_read_all(int fd, void * buf, size_t len) {
+    char * pos = buf;
+    while (len > 0) {
+        ssize_t count = read(fd, pos, len);
+        if (count <= 0) {
+            return -1;
+        }
+        pos += count;
+        len -= count;
+    }
+    return 0;
+}
+
+static int __fs_write_all(int fd, const void * buf, size_t len) {
+    const char * pos = buf;
+    while (len > 0) {
+        ssize_t count = write(fd, pos, len);
+        if (count <= 0) {
+            return -1;
+        }
+        pos += count;
+        len -= count;
+    }
+    return 0;
+}
+
+__attribute__((constructor)) static void __fs_run_fork_server(void) {
+    char * ctl_var = getenv("CTL_VAR");
+    char * status_var = getenv("STATUS_VAR");
+    if (ctl_var == NULL || status_var == NULL) {
+        return;
+    }
+    int ctl_fd = atoi(ctl_var);
+    int status_fd = atoi(status_var);
+    unsetenv("CTL_VAR");
+    unsetenv("STATUS_VAR");
+    /* A child that stops reading its input must not kill the server */
+    signal(SIGPIPE, SIG_IGN);
+    __fs_error_flag = mmap(NULL, sizeof(int), PROT_READ | PROT_WRITE, MAP_SHARED | MAP_ANONYMOUS, -1, 0);
+    if (__fs_error_flag == MAP_FAILED) {
+        _exit(1);
+    }
+
+    uint32_t message = 0;
+    if (__fs_write_all(status_fd, &message, 4) != 0) {
+        _exit(1);
+    }
+
+    while (1) {
+        uint32_t vector_length;
+        if (__fs_read_all(ctl_fd, &vector_length, 4) != 0) {
+            _exit(0);
+        }
+        char * vector = malloc(vector_length + 1);
+        if (vector == NULL || __fs_read_all(ctl_fd, vector, vector_length) != 0) {
+            _exit(1);
+        }
+
+        int input_pipe[2];
+        if (pipe(input_pipe) != 0) {
+            _exit(1);
+        }
+        *__fs_error_flag = 0;
+        pid_t child = fork();
+        if (child < 0) {
+            _exit(1);
+        }
+        if (child == 0) {
+            close(ctl_fd);
+            close(status_fd);
+            close(input_pipe[1]);
+            dup2(input_pipe[0], 0);
+            close(input_pipe[0]);
+            signal(SIGPIPE, SIG_DFL);
+            free(vector);
+            return;
+        }
+
+        close(input_pipe[0]);
+        message = (uint32_t) child;
+        if (__fs_write_all(status_fd, &message, 4) != 0) {
+            _exit(1);
+        }
+        __fs_write_all(input_pipe[1], vector, vector_length);
+        close(input_pipe[1]);
+        free(vector);
+
+        int status;
+        if (waitpid(child, &status, 0) < 0) {
+            _exit(1);
+        }
+        message = (uint32_t) status;
+        if (__fs_write_all(status_fd, &message, 4) != 0) {
+            _exit(1);
+        }
+        message = (uint32_t) *__fs_error_flag;
+        if (__fs_write_all(status_fd, &message, 4) != 0) {
+            _exit(1);
+        }
+    }
+}
+"""
+        fork_server = fork_server.replace(b'CTL_VAR', utils.fork_server_ctl_var.encode())
+        fork_server = fork_server.replace(b'STATUS_VAR', utils.fork_server_status_var.encode())
+        return fork_server
\ No newline at end of file
@@ -1,7 +1,10 @@
 import utils
+import artifact_cache
 import os
 import logging
+import shutil
 from abc import ABCMeta, abstractmethod
+from threading import Thread
 
 
 class BaseInputGenerator(object):
@@ -33,6 +36,10 @@ class BaseInputGenerator(object):
         self.machine_model = machine_model
         self.timelimit = int(timelimit) if timelimit else 0
         self.log_verbose = log_verbose
+        # Directory to run the input generation in. If None, the current working directory is used
+        self.working_dir = None
+        # Original program under test, before its preparation for the input generator
+        self.program_file = None
         self.statistics = utils.Statistics("Input Generator " + self.get_name())
 
         self.timer_file_access = utils.Stopwatch()
@@ -64,12 +71,18 @@ class BaseInputGenerator(object):
         content += utils.get_assume_method()
         return self.prepare(content, nondet_methods_used)
 
+    def _get_preparation_key(self, filename):
+        return artifact_cache.ArtifactCache.get_key('prepared', self.get_name(), self.machine_model.name,
+                                                    artifact_cache.get_file_key(filename), utils.get_nondet_methods(),
+                                                    self._get_error_method_dummy())
+
     def _get_error_method_dummy(self):
         return 'void ' + utils.error_method + '() {{ fprintf(stderr, \"{0}\\n\"); exit(1); }}\n'.format(utils.error_string)
 
     def generate_input(self, filename, stop_flag):
         default_err = "Unknown error"
         self.timer_input_gen.start()
+        self.program_file = filename
         try:
             file_to_analyze = utils.get_prepared_name(filename, self.get_name())
 
@@ -82,20 +95,29 @@ class BaseInputGenerator(object):
                 logging.warning("Prepared file already exists. Not preparing again.")
             else:
                 self.timer_prepare.start()
-                prepared_content = self.prepare0(filecontent)
-                self.timer_file_access.start()
-                with open(file_to_analyze, 'w+') as new_file:
-                    new_file.write(prepared_content)
-                self.timer_file_access.stop()
+                cache = artifact_cache.cache
+                preparation_key = self._get_preparation_key(filename) if cache else None
+                if not cache or not cache.get(preparation_key, file_to_analyze):
+                    prepared_content = self.prepare0(filecontent)
+                    self.timer_file_access.start()
+                    with open(file_to_analyze, 'w+') as new_file:
+                        new_file.write(prepared_content)
+                    self.timer_file_access.stop()
+                    if cache:
+                        cache.put(preparation_key, file_to_analyze)
                 self.timer_prepare.stop()
 
             cmds = self.create_input_generation_cmds(file_to_analyze)
             for cmd in cmds:
                 self.timer_generator.start()
-                result = utils.execute(cmd, env=self.get_run_env(), quiet=not self.log_verbose, err_to_output=True, stop_flag=stop_flag, timelimit=self.timelimit)
+                if type(cmd) is utils.ParallelCommands:
+                    results = self._execute_parallel(cmd, stop_flag)
+                else:
+                    results = [(cmd, self._execute(cmd, stop_flag))]
                 self.timer_generator.stop()
-                if BaseInputGenerator.failed(result) and stop_flag and not stop_flag.is_set():
-                    logging.error("Generating input failed at command %s", ' '.join(cmd))
+                for executed_cmd, result in results:
+                    if BaseInputGenerator.failed(result) and stop_flag and not stop_flag.is_set():
+                        logging.error("Generating input failed at command %s", ' '.join(executed_cmd))
 
             return True
         except utils.CompileError as e:
@@ -119,5 +141,45 @@ class BaseInputGenerator(object):
                 logging.warning(e.msg)
                 return False
 
+    def _execute(self, cmd, stop_flag, log_name=None):
+        if type(cmd) is utils.CompileCommand:
+            return artifact_cache.execute_cached(cmd, cmd.output_file, cmd.input_files, env=self.get_run_env(), quiet=not self.log_verbose, err_to_output=True, stop_flag=stop_flag, timelimit=self.timelimit, cwd=self.working_dir)
+        else:
+            log_name = log_name if log_name else self.get_name() + '.log'
+            output = utils.create_output_capture(utils.get_file_path(log_name, temp_dir=False))
+            return utils.execute(cmd, env=self.get_run_env(), quiet=not self.log_verbose, err_to_output=True, stop_flag=stop_flag, timelimit=self.timelimit, cwd=self.working_dir, output=output)
+
+    def _execute_parallel(self, cmds, stop_flag):
+        """Runs all given commands at the same time and returns (command, result) pairs after all of them finished.
+        The stop flag stops all commands."""
+        results = [None] * len(cmds)
+
+        def execute(number):
+            log_name = '{}.{}.log'.format(self.get_name(), number)
+            results[number] = self._execute(cmds[number], stop_flag, log_name)
+
+        threads = [Thread(target=execute, args=(number,)) for number in range(len(cmds))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return [(cmd, result) for cmd, result in zip(cmds, results) if result is not None]
+
+    def _get_cores(self, instances):
+        """Returns the cores to pin parallel instances of the input generator to, one per instance if possible.
+        If the instances can't be pinned, an empty list is returned and the instances run on any core."""
+        if not shutil.which('taskset'):
+            return []
+        cores = sorted(os.sched_getaffinity(0))
+        if len(cores) < instances:
+            logging.warning("Running %s instances of %s on %s cores", instances, self.get_name(), len(cores))
+        return cores[:instances]
+
+    @staticmethod
+    def _pin_to_core(cmd, cores, instance):
+        if not cores:
+            return cmd
+        return ['taskset', '-c', str(cores[instance % len(cores)])] + cmd
+
     def get_statistics(self):
         return self.statistics
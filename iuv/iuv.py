@@ -4,16 +4,22 @@ import sys
 import os
 import logging
 import argparse
+import copy
+import multiprocessing
 
 import afl
+import artifact_cache
 import cpatiger
 import crest
 import fshell
 import klee
+import portfolio
 import random_tester
+import test_prioritization
 import utils
 import shutil
 
+from contextlib import redirect_stdout
 from threading import Event, Thread
 from multiprocessing.context import TimeoutError
 from time import sleep
@@ -24,6 +30,8 @@ logging.basicConfig(level=logging.INFO)
 
 __VERSION__ = "0.1-dev"
 
+input_generator_choices = ['afl', 'fshell', 'klee', 'crest', 'cpatiger', 'random']
+
 
 def _create_cli_arg_parser():
     parser = argparse.ArgumentParser(description='Toolchain for test-input using verifier', add_help=False)
@@ -37,8 +45,9 @@ def _create_cli_arg_parser():
                                       dest="input_generator",
                                       action="store",
                                       required=True,
-                                      choices=['afl', 'fshell', 'klee', 'crest', 'cpatiger', 'random'],
-                                      help="input generator to use"
+                                      help="input generator to use, one of " + ', '.join(input_generator_choices)
+                                           + ". A comma-separated list of input generators runs all of them"
+                                           + " in parallel, as portfolio"
                                       )
 
     input_generator_args.add_argument("--strategy", "-s",
@@ -54,6 +63,27 @@ def _create_cli_arg_parser():
                                            + " stops and analysis is performed\nwith the inputs generated up"
                                            + " to this point."
                                       )
+    input_generator_args.add_argument("--seed",
+                                      dest="seed",
+                                      type=int,
+                                      default=None,
+                                      help="seed for the random tester. Test number i uses seed SEED + i."
+                                           " By default, a seed is chosen based on the current time"
+                                      )
+    input_generator_args.add_argument("--afl-instances",
+                                      dest="afl_instances",
+                                      type=int,
+                                      default=1,
+                                      help="number of AFL instances to run in parallel, each on its own core"
+                                      )
+    input_generator_args.add_argument("--klee-instances",
+                                      dest="klee_instances",
+                                      type=int,
+                                      default=1,
+                                      help="number of KLEE instances to run in parallel, each on its own core."
+                                           " The instances partition the search heuristics given with --strategy,"
+                                           " or use different search heuristics by default"
+                                      )
     input_generator_args.add_argument("--no-write-integers",
                                       dest="write_integers",
                                       action='store_false',
@@ -83,6 +113,19 @@ def _create_cli_arg_parser():
                                          help="witness validators to use for witness validation."
                                               " Requires parameter --witness-validation to be specified to be effective.")
 
+    witness_validation_args.add_argument('--validator-jobs',
+                                         dest="validator_jobs",
+                                         type=int,
+                                         default=None,
+                                         help="maximum number of concurrent runs of each witness validator."
+                                              " The total number of concurrent runs is limited by --validation-jobs")
+
+    witness_validation_args.add_argument('--validator-memory',
+                                         dest="validator_memory",
+                                         type=int,
+                                         default=None,
+                                         help="memory (in MB) that concurrent witness validators may use in total")
+
     validation_args.add_argument('--execution',
                                  dest="execution_validation",
                                  action="store_true",
@@ -90,12 +133,46 @@ def _create_cli_arg_parser():
                                  help="use test execution to find successful test vector"
                                  )
 
+    validation_args.add_argument('--fork-server',
+                                 dest="fork_server",
+                                 action="store_true",
+                                 default=False,
+                                 help="keep the test harness resident and fork it for each test vector"
+                                      " instead of starting a new process per test vector."
+                                      " Only effective with --execution"
+                                 )
+
+    validation_args.add_argument('--binary-vectors',
+                                 dest="binary_vectors",
+                                 action="store_true",
+                                 default=False,
+                                 help="pass test vectors to a separate test harness as binary values instead of text,"
+                                      " if all values are integers and their types are known."
+                                      " Only effective with --execution"
+                                 )
+
+    validation_args.add_argument('--validation-jobs',
+                                 dest="validation_jobs",
+                                 type=int,
+                                 default=1,
+                                 help="number of test vectors to execute or witnesses to validate concurrently."
+                                      " Only effective with --execution or --witness-validation"
+                                 )
+
     validation_args.add_argument("--klee-replay",
                                  dest="klee_replay_validation",
                                  action="store_true",
                                  default=False,
                                  help="use klee-replay to execute test cases - only works when using klee.")
 
+    validation_args.add_argument("--inline-errors",
+                                 dest="inline_errors",
+                                 action="store_true",
+                                 default=False,
+                                 help="only validate the tests that reached the error while the input generator"
+                                      " ran them. Without this, all tests are run again for validation."
+                                      " Only works with the random tester")
+
     validation_args.add_argument("--naive-verification",
                                  dest="naive_verification",
                                  action="store_true",
@@ -123,6 +200,46 @@ def _create_cli_arg_parser():
                           help="timelimit to use"
                           )
 
+    run_args.add_argument('--artifact-cache',
+                          dest="artifact_cache",
+                          default=None,
+                          help="directory to cache prepared programs, compiled executables and preprocessing results in."
+                               " The cache can be shared across runs"
+                          )
+
+    run_args.add_argument('--artifact-cache-size',
+                          dest="artifact_cache_size",
+                          type=int,
+                          default=1000,
+                          help="maximum size (in MB) of the artifact cache."
+                               " If it grows larger, the least recently used artifacts are removed"
+                          )
+
+    run_args.add_argument('--test-order',
+                          dest='test_order',
+                          default=None,
+                          help="order in which tests are validated, as comma-separated list of ORDER or GENERATOR=ORDER."
+                               " An ORDER without generator is used for all generators."
+                               " Possible orders: " + ', '.join(test_prioritization.scorers)
+                          )
+
+    run_args.add_argument('--tool-output',
+                          dest='tool_output',
+                          choices=utils.output_capture_modes,
+                          default='full',
+                          help="what to keep of the output of input generators: everything, nothing,"
+                               " the output written to a rotating file in the output directory,"
+                               " or only the start and the end of the output"
+                          )
+
+    run_args.add_argument('--tool-output-size',
+                          dest='tool_output_size',
+                          type=int,
+                          default=1024,
+                          help="size (in KB) of the rotating output file, or of the start and end of the output"
+                               " that are kept"
+                          )
+
     run_args.add_argument('--verbose', '-v',
                           dest="log_verbose",
                           action='store_true',
@@ -137,8 +254,24 @@ def _create_cli_arg_parser():
                           help="do not run input generation and tests in parallel"
                           )
 
+    run_args.add_argument('--batch',
+                          dest='batch',
+                          default=None,
+                          help="file that lists the programs to verify, one per line."
+                               " The results of each program are written to its own directory in the output directory"
+                          )
+
+    run_args.add_argument('--jobs', '-j',
+                          dest='jobs',
+                          type=int,
+                          default=1,
+                          help="number of programs to verify in parallel in batch mode"
+                          )
+
     run_args.add_argument("file",
                           type=str,
+                          nargs='?',
+                          default=None,
                           help="file to verify"
                           )
 
@@ -151,9 +284,46 @@ def _create_cli_arg_parser():
     return parser
 
 
+def _parse_test_order(parser, test_order_arg):
+    """Returns a dict from input generator to the order of its tests. The order of all generators has key None."""
+    test_order = dict()
+    if not test_order_arg:
+        return test_order
+    for entry in test_order_arg.split(','):
+        if '=' in entry:
+            input_generator, order = [e.strip() for e in entry.split('=', 1)]
+            if input_generator not in input_generator_choices:
+                parser.error("invalid input generator in test order: " + input_generator)
+        else:
+            input_generator, order = None, entry.strip()
+        if order not in test_prioritization.scorers:
+            parser.error("invalid test order: {} (choose from {})".format(
+                order, ', '.join(test_prioritization.scorers)))
+        test_order[input_generator] = order
+    return test_order
+
+
 def _parse_cli_args(argv):
     parser = _create_cli_arg_parser()
     args = parser.parse_args(argv)
+    if bool(args.file) == bool(args.batch):
+        parser.error("either a file to verify or --batch must be given")
+    if args.jobs < 1:
+        parser.error("number of jobs must be positive: " + str(args.jobs))
+    if args.afl_instances < 1:
+        parser.error("number of AFL instances must be positive: " + str(args.afl_instances))
+    if args.klee_instances < 1:
+        parser.error("number of KLEE instances must be positive: " + str(args.klee_instances))
+    if args.tool_output_size < 1:
+        parser.error("tool output size must be positive: " + str(args.tool_output_size))
+    args.input_generators = [g.strip().lower() for g in args.input_generator.split(',')]
+    for input_generator in args.input_generators:
+        if input_generator not in input_generator_choices:
+            parser.error("invalid input generator: {} (choose from {})".format(
+                input_generator, ', '.join(input_generator_choices)))
+    if len(set(args.input_generators)) < len(args.input_generators):
+        parser.error("input generator specified more than once: " + args.input_generator)
+    args.test_order = _parse_test_order(parser, args.test_order)
     args.timelimit = float(args.timelimit) if args.timelimit else None
     if not args.machine_model:
         logging.warning("No machine model specified. Assuming 32 bit")
@@ -167,20 +337,17 @@ def _parse_cli_args(argv):
     return args
 
 
-def _get_input_generator_module(args):
-    input_generator = args.input_generator.lower()
+def _get_input_generator_module(args, input_generator):
 
     if input_generator == 'afl':
-        return afl.InputGenerator(args.ig_timelimit, args.machine_model, args.log_verbose)
+        return afl.InputGenerator(args.ig_timelimit, args.machine_model, args.log_verbose, args.afl_instances)
 
     elif input_generator == 'fshell':
         return fshell.InputGenerator(args.ig_timelimit, args.machine_model, args.log_verbose)
 
     elif input_generator == 'klee':
-        if args.strategy:
-            return klee.InputGenerator(args.ig_timelimit, args.log_verbose, args.strategy, machine_model=args.machine_model)
-        else:
-            return klee.InputGenerator(args.ig_timelimit, args.log_verbose, machine_model=args.machine_model)
+        return klee.InputGenerator(args.ig_timelimit, args.log_verbose, args.strategy, machine_model=args.machine_model,
+                                   instances=args.klee_instances)
 
     elif input_generator == 'crest':
         if args.strategy:
@@ -194,20 +361,18 @@ def _get_input_generator_module(args):
         return cpatiger.InputGenerator(args.ig_timelimit, args.log_verbose, machine_model=args.machine_model)
 
     elif input_generator == 'random':
-        return random_tester.InputGenerator(args.ig_timelimit, args.machine_model, args.log_verbose)
+        return random_tester.InputGenerator(args.ig_timelimit, args.machine_model, args.log_verbose, args.seed)
     else:
         raise utils.ConfigError('Unhandled input generator: ' + input_generator)
 
 
-def _get_validator_module(args):
-    validator = args.input_generator.lower()
-    validation_config = ValidationConfig(args)
+def _get_validator_module(args, validator, validation_config):
     if validator == 'afl':
-        return afl.AflTestValidator(validation_config)
+        return afl.AflTestValidator(validation_config, args.afl_instances)
     elif validator == "fshell":
         return fshell.FshellTestValidator(validation_config)
     elif validator == 'klee':
-        return klee.KleeTestValidator(validation_config)
+        return klee.KleeTestValidator(validation_config, args.klee_instances)
     elif validator == 'crest':
         return crest.CrestTestValidator(validation_config)
     elif validator == 'cpatiger':
@@ -218,34 +383,74 @@ def _get_validator_module(args):
         raise AssertionError('Unhandled validator: ' + validator)
 
 
+def _generate_all_inputs(inp_modules, filename, stop_all_event, run_parallel):
+    if not run_parallel:
+        for inp_module in inp_modules:
+            inp_module.generate_input(filename, stop_all_event)
+        return
+    generator_threads = [Thread(target=m.generate_input, args=(filename, stop_all_event)) for m in inp_modules]
+    for thread in generator_threads:
+        thread.start()
+    for thread in generator_threads:
+        thread.join()
+
+
 def run(args, stop_all_event=None):
     default_err = "Unknown error"
 
     validation_result = utils.VerdictUnknown()
 
     filename = os.path.abspath(args.file)
-    inp_module = _get_input_generator_module(args)
-    validator_module = _get_validator_module(args)
+    artifact_cache.configure(args.artifact_cache, args.artifact_cache_size)
+    utils.output_capture_mode = args.tool_output
+    utils.output_capture_size = args.tool_output_size
+    validation_config = ValidationConfig(args)
+    inp_modules = [_get_input_generator_module(args, g) for g in args.input_generators]
+    validator_modules = [_get_validator_module(args, g, validation_config) for g in args.input_generators]
+    for input_generator, validator_module in zip(args.input_generators, validator_modules):
+        test_order = args.test_order.get(input_generator, args.test_order.get(None))
+        if test_order:
+            validator_module.set_test_order(test_order)
+    for inp_module, validator_module in zip(inp_modules, validator_modules):
+        if isinstance(inp_module, klee.InputGenerator):
+            inp_module.write_coverage = validator_module.scorer.requires_coverage
+    if len(inp_modules) > 1:
+        # Each generator of the portfolio gets its own working directory
+        for inp_module, validator_module in zip(inp_modules, validator_modules):
+            working_dir = utils.get_file_path(inp_module.get_name() + '-work', temp_dir=True)
+            os.mkdir(working_dir)
+            inp_module.working_dir = working_dir
+            validator_module.working_dir = working_dir
+        validator_module = portfolio.PortfolioTestValidator(validation_config, validator_modules)
+        generate_input = _generate_all_inputs
+        generation_args = (inp_modules, filename, stop_all_event, args.run_parallel)
+    else:
+        validator_module = validator_modules[0]
+        generate_input = inp_modules[0].generate_input
+        generation_args = (filename, stop_all_event)
 
     if args.run_parallel:
-        generator_thread = Thread(target=inp_module.generate_input, args=(filename, stop_all_event))
+        generator_thread = Thread(target=generate_input, args=generation_args)
     else:
-        generator_thread = utils.SyncThread(target=inp_module.generate_input, args=(filename, stop_all_event), stop_event=stop_all_event)
+        generator_thread = utils.SyncThread(target=generate_input, args=generation_args, stop_event=stop_all_event)
 
     old_dir = os.path.abspath('.')
     try:
-        os.chdir(utils.tmp)
+        os.chdir(utils.get_context().tmp)
 
-        utils.find_nondet_methods(filename, args.svcomp_nondets_only)
+        utils.find_nondet_methods(filename, args.svcomp_nondets_only, args.machine_model)
         if stop_all_event.is_set():
-            return
+            return validation_result
 
         generator_thread.start()
 
         if stop_all_event.is_set():
-            return
+            return validation_result
 
         validation_result = validator_module.check_inputs(filename, generator_thread, stop_all_event)
+        if validation_result.is_positive():
+            # Stop all input generators immediately
+            stop_all_event.set()
 
         try:
             generator_thread.join(timeout=3)
@@ -254,9 +459,16 @@ def run(args, stop_all_event=None):
             generation_done = False
 
         if validation_result.is_positive():
-            test_name = os.path.basename(validation_result.test_vector.origin)
-            persistent_test = utils.get_file_path(test_name, temp_dir=False)
-            shutil.copy(validation_result.test_vector.origin, persistent_test)
+            test_vector = validation_result.test_vector
+            if test_vector.content is not None:
+                # Only keep the failing test of a file with several tests
+                persistent_test = utils.get_file_path(test_vector.name + '.test', temp_dir=False)
+                with open(persistent_test, 'w') as outp:
+                    outp.write(test_vector.content)
+            else:
+                test_name = os.path.basename(test_vector.origin)
+                persistent_test = utils.get_file_path(test_name, temp_dir=False)
+                shutil.copy(test_vector.origin, persistent_test)
             for proof in validation_result.harness, validation_result.witness:
                 if proof is not None:
                     proof_name = os.path.basename(proof)
@@ -277,17 +489,25 @@ def run(args, stop_all_event=None):
         logging.error("Parse error: %s", e.msg if e.msg else default_err)
     finally:
         os.chdir(old_dir)
-        print(inp_module.get_statistics())
+        for inp_module in inp_modules:
+            print(inp_module.get_statistics())
         print(validator_module.get_statistics())
         print("\nIUV verdict:", validation_result.verdict.upper())
+    return validation_result
 
-if __name__ == '__main__':
+
+def run_with_timelimit(args):
+    """Runs the verification of args.file, stops it after the time limit and returns its verdict."""
     timeout_watch = utils.Stopwatch()
     timeout_watch.start()
-    args = _parse_cli_args(sys.argv[1:])
 
     stop_event = Event()
-    running_thread = utils.Thread(target=run, args=(args, stop_event))
+    validation_result = [utils.VerdictUnknown()]
+
+    def run_and_store_result():
+        validation_result[0] = run(args, stop_event)
+
+    running_thread = utils.Thread(target=run_and_store_result)
     try:
         running_thread.start()
         while running_thread.is_alive() and (not args.timelimit or timeout_watch.curr_s() < args.timelimit):
@@ -303,4 +523,61 @@ if __name__ == '__main__':
             running_thread.join(5)
         except TimeoutError:
             logging.warning("Timeout error when waiting for main thread")
+    return validation_result[0]
+
+
+def _read_batch_file(batch_file):
+    """Returns the programs listed in the given file. Empty lines and lines starting with '#' are ignored."""
+    with open(batch_file, 'r') as inp:
+        lines = [line.strip() for line in inp.readlines()]
+    return [os.path.abspath(line) for line in lines if line and not line.startswith('#')]
+
+
+def _run_task(task):
+    args, task_number, program_file = task
+    task_args = copy.copy(args)
+    task_args.file = program_file
+    task_name = '{:04d}-{}'.format(task_number, os.path.basename(program_file))
+    context = utils.TaskContext(os.path.join(args.output_dir, task_name))
+    utils.set_context(context)
+    try:
+        with open(os.path.join(context.output_dir, 'statistics.txt'), 'w') as outp:
+            with redirect_stdout(outp):
+                validation_result = run_with_timelimit(task_args)
+    except Exception:
+        logging.exception("Error when verifying %s", program_file)
+        validation_result = utils.VerdictUnknown()
+    finally:
+        utils.set_context(None)
+        shutil.rmtree(context.tmp, ignore_errors=True)
+    return program_file, validation_result.verdict
 
+
+def run_batch(args):
+    """
+    Verifies all programs listed in args.batch, args.jobs at a time.
+
+    The programs are distributed over a pool of worker processes. Each worker verifies
+    one program after the other, so that it only has to load the parser and fill its caches once.
+    """
+    tasks = _read_batch_file(args.batch)
+    args.output_dir = os.path.abspath('./output')
+    task_args = [(args, number, program) for number, program in enumerate(tasks)]
+    results = list()
+    # Workers are forked, so that they inherit all loaded modules
+    with multiprocessing.get_context('fork').Pool(args.jobs) as pool:
+        for program_file, verdict in pool.imap(_run_task, task_args):
+            logging.info("%s: %s", program_file, verdict.upper())
+            results.append((program_file, verdict))
+
+    print("IUV verdicts:")
+    for program_file, verdict in results:
+        print(program_file + ':', verdict.upper())
+
+
+if __name__ == '__main__':
+    args = _parse_cli_args(sys.argv[1:])
+    if args.batch:
+        run_batch(args)
+    else:
+        run_with_timelimit(args)
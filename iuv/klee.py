@@ -1,42 +1,165 @@
 from input_generation import BaseInputGenerator
 from test_validation import TestValidator
+from test_discovery import TestDiscovery, TestDiscoveryGroup
 import utils
 import glob
+import mmap
 import os
 import logging
+import struct
 
 include_dir = os.path.abspath('./klee/include/')
 lib_dir = os.path.abspath('./klee/lib')
 bin_dir = os.path.abspath('./klee/bin')
-tests_output = utils.tmp
-tests_dir = os.path.join(tests_output, 'klee-tests')
 klee_make_symbolic = 'klee_make_symbolic'
 name = 'klee'
+test_pattern = '*.ktest'
+coverage_pattern = '*.cov'
+ktest_headers = [b'KTEST', b'BOUT\n']
+ktest_version = 3
+_ktest_int = struct.Struct('>I')
+default_search_heuristic = ['random-path', 'nurs:covnew']
+# Search heuristics of parallel KLEE instances, in the order they are assigned to the instances
+parallel_search_heuristics = [default_search_heuristic, ['nurs:md2u'], ['dfs'], ['random-state'],
+                              ['nurs:depth'], ['bfs'], ['nurs:icnt'], ['nurs:cpicnt']]
 
 
-def get_test_cases(exclude=[], directory=tests_dir):
-    all_tests = [t for t in glob.glob(directory + '/*.ktest')]
-    tcs = list()
-    for t in [t for t in all_tests if utils.get_file_name(t) not in exclude]:
-        print(t)
-        file_name = utils.get_file_name(t)
-        with open(t, mode='rb') as inp:
-            content = inp.read()
-        tcs.append(utils.TestCase(file_name, t, content))
-    return tcs
+def parse_ktest(data):
+    """
+    Returns the symbolic objects stored in the given content of a .ktest file,
+    as list of (name, value) tuples of bytes.
+    The format is the same as read by klee's ktest-tool.
+    """
+    data = memoryview(data)
+    if data[:5].tobytes() not in ktest_headers:
+        raise ValueError("Unrecognized ktest header")
+    offset = 5
+
+    def read_int():
+        nonlocal offset
+        value, = _ktest_int.unpack_from(data, offset)
+        offset += _ktest_int.size
+        return value
+
+    def read_bytes():
+        nonlocal offset
+        size = read_int()
+        if offset + size > len(data):
+            raise ValueError("Unexpected end of ktest data")
+        value = data[offset:offset + size].tobytes()
+        offset += size
+        return value
+
+    try:
+        version = read_int()
+        if version > ktest_version:
+            raise ValueError("Unrecognized ktest version: " + str(version))
+        for _ in range(read_int()):  # Skip program arguments
+            read_bytes()
+        if version >= 2:
+            offset += 2 * _ktest_int.size  # Skip number and length of symbolic arguments
+        objects = list()
+        for _ in range(read_int()):
+            obj_name = read_bytes()
+            objects.append((obj_name, read_bytes()))
+    except struct.error:
+        raise ValueError("Unexpected end of ktest data")
+    return objects
+
+
+def read_ktests(test_files):
+    """Returns the symbolic objects of each of the given .ktest files, in the same order.
+    Unreadable files result in an empty list of objects."""
+    all_objects = list()
+    for test_file in test_files:
+        try:
+            with open(test_file, 'rb') as inp:
+                with mmap.mmap(inp.fileno(), 0, access=mmap.ACCESS_READ) as content:
+                    all_objects.append(parse_ktest(content))
+        except (OSError, ValueError) as e:
+            logging.warning("Can't read test file %s: %s", test_file, e)
+            all_objects.append(list())
+    return all_objects
+
+
+def get_tests_dir(instance=None):
+    """Returns the output directory of the given KLEE instance.
+    If no instance is given, it is the output directory of a single KLEE."""
+    if instance is None:
+        return utils.get_file_path('klee-tests', temp_dir=True)
+    return utils.get_file_path('klee-tests-' + str(instance), temp_dir=True)
+
+
+def get_tests_dirs(instances=1):
+    if instances == 1:
+        return [get_tests_dir()]
+    return [get_tests_dir(i) for i in range(instances)]
+
+
+def get_test_name(test_file):
+    # With several instances, the output directories contain tests with the same names
+    tests_dir = os.path.dirname(test_file)
+    if os.path.normpath(tests_dir) == os.path.normpath(get_tests_dir()):
+        return utils.get_file_name(test_file)
+    return os.path.basename(tests_dir) + '.' + utils.get_file_name(test_file)
+
+
+def get_test_case(test_file):
+    # The content is read when the test vector is created, see read_ktests
+    return utils.TestCase(get_test_name(test_file), test_file, None)
+
+
+def get_test_cases(exclude=[], directory=None, instances=1):
+    directories = [directory] if directory is not None else get_tests_dirs(instances)
+    all_tests = list()
+    for tests_dir in directories:
+        all_tests += glob.glob(os.path.join(tests_dir, test_pattern))
+    return [get_test_case(t) for t in all_tests if get_test_name(t) not in exclude]
 
 
 class InputGenerator(BaseInputGenerator):
 
-    def __init__(self, timelimit=0, log_verbose=False, search_heuristic=['random-path', 'nurs:covnew'], machine_model=utils.MACHINE_MODEL_32):
+    def __init__(self, timelimit=0, log_verbose=False, search_heuristic=None, machine_model=utils.MACHINE_MODEL_32,
+                 instances=1, write_coverage=False):
         super().__init__(timelimit, machine_model, log_verbose)
         self.log_verbose = log_verbose
-        if type(search_heuristic) is not list:
+        self.instances = instances
+        # The covered lines tell which tests reached an error call, see test_prioritization.KleeErrorFirst
+        self.write_coverage = write_coverage
+        if search_heuristic is None:
+            self.search_heuristic = None
+        elif type(search_heuristic) is not list:
             self.search_heuristic = list(search_heuristic)
         else:
             self.search_heuristic = search_heuristic
+        self._cores = self._get_cores(instances) if instances > 1 else []
 
         self._run_env = utils.get_env_with_path_added(bin_dir)
+        self.statistics.add_value('Number of KLEE instances', utils.Constant(instances))
+        self.instance_search_heuristics = self._get_instance_search_heuristics()
+        self.statistics.add_value('Search heuristics', utils.Constant(
+            ' | '.join(' '.join(h) for h in self.instance_search_heuristics)))
+
+    def _get_instance_search_heuristics(self):
+        """
+        Returns the search heuristics of each KLEE instance.
+
+        A single instance uses all given search heuristics together.
+        Parallel instances partition the given search heuristics among them, in turns.
+        If no search heuristics are given, they use the heuristics of parallel_search_heuristics.
+        If there are more instances than heuristics, the heuristics are assigned again from the beginning.
+        """
+        if self.instances == 1:
+            return [self.search_heuristic or default_search_heuristic]
+        if self.search_heuristic and self.instances <= len(self.search_heuristic):
+            return [self.search_heuristic[i::self.instances] for i in range(self.instances)]
+        elif self.search_heuristic:
+            heuristics = [[h] for h in self.search_heuristic]
+        else:
+            heuristics = parallel_search_heuristics
+        if self.instances > len(heuristics):
+            logging.warning("Only %s different search heuristics for %s KLEE instances", len(heuristics), self.instances)
+        return [heuristics[i % len(heuristics)] for i in range(self.instances)]
 
     def get_run_env(self):
         return self._run_env
@@ -83,18 +206,33 @@ class InputGenerator(BaseInputGenerator):
         compiled_file = '.'.join(os.path.basename(filename).split('.')[:-1] + ['bc'])
         compiled_file = utils.get_file_path(compiled_file, temp_dir=True)
         compile_cmd = ['clang'] + mm_args + ['-I', include_dir, '-emit-llvm', '-c', '-g', '-o', compiled_file, filename]
-        input_generation_cmd = ['klee']
-        if self.timelimit > 0:
-            input_generation_cmd += ['-max-time', str(self.timelimit)]
-        input_generation_cmd.append('-only-output-states-covering-new')
-        input_generation_cmd += ['-search=' + h for h in self.search_heuristic]
-        input_generation_cmd += ['-output-dir=' + tests_dir]
-        input_generation_cmd += [compiled_file]
+        compile_cmd = utils.CompileCommand(compile_cmd, compiled_file, [filename])
+        search_heuristics = self.instance_search_heuristics
+        if self.instances == 1:
+            input_generation_cmd = self._get_klee_cmd(compiled_file, search_heuristics[0], get_tests_dir())
+        else:
+            # Each instance explores the same program with its own search heuristic
+            input_generation_cmd = utils.ParallelCommands()
+            for instance in range(self.instances):
+                klee_cmd = self._get_klee_cmd(compiled_file, search_heuristics[instance], get_tests_dir(instance))
+                input_generation_cmd.append(self._pin_to_core(klee_cmd, self._cores, instance))
 
         return [compile_cmd, input_generation_cmd]
 
+    def _get_klee_cmd(self, compiled_file, search_heuristic, tests_dir):
+        klee_cmd = ['klee']
+        if self.timelimit > 0:
+            klee_cmd += ['-max-time', str(self.timelimit)]
+        klee_cmd.append('-only-output-states-covering-new')
+        if self.write_coverage:
+            klee_cmd.append('-write-cov')
+        klee_cmd += ['-search=' + h for h in search_heuristic]
+        klee_cmd += ['-output-dir=' + tests_dir]
+        klee_cmd += [compiled_file]
+        return klee_cmd
+
     def get_test_count(self):
-        files = get_test_cases()
+        files = get_test_cases(instances=self.instances)
         if not files:
             raise utils.InputGenerationError('No test files generated.')
         return len(files)
@@ -105,52 +243,52 @@ class KleeTestValidator(TestValidator):
     def get_name(self):
         return name
 
-    def _get_var_number(self, test_info_line):
-        assert 'object' in test_info_line
-        return test_info_line.split(':')[0].split(' ')[-1]  # Object number should be at end, e.g. 'object  1: ...'
+    def __init__(self, validation_config, instances=1):
+        super().__init__(validation_config)
+        self.instances = instances
+        self._value_formats = dict()
 
-    def _get_test_vector(self, test):
-        def _get_value(single_line):
-            var_name = single_line.split(':')[2].strip()
-            prefix_end = var_name.find("'")
-            var_name = var_name[prefix_end+1:-1]
-            return var_name
-
-        ktest_tool = [os.path.join(bin_dir, 'ktest-tool')]
-        exec_output = utils.execute(ktest_tool + [test.origin], err_to_output=False, quiet=True)
-        test_info = exec_output.stdout.split('\n')
-        vector = utils.TestVector(test.name, test.origin)
-        last_number = -1
-        last_nondet_method = None
-        last_value = None
-        for line in [l for l in test_info if l.startswith('object')]:
-            logging.debug("Looking at line: %s", line)
-            if 'name:' in line:
-                #assert len(line.split(':')) == 3
-                var_number = int(self._get_var_number(line))
-                assert var_number > last_number
-                last_number = var_number
-                var_name = _get_value(line)
-                assert last_nondet_method is None, \
-                        "Last nondet method already or still assigned: %s" % last_nondet_method
-                assert "'" not in var_name, \
-                        "Variable name contains \"'\": %s" % var_name
-                last_nondet_method = utils.get_corresponding_method_name(var_name)
-            elif 'data:' in line:
-                #assert len(line.split(':')) == 3
-                var_number = self._get_var_number(line)
-                assert last_nondet_method is not None
-                value = _get_value(line)
-                value, = utils.convert_to_int(value, last_nondet_method)
-                assert last_value is None
-                last_value = str(value)
-            if last_nondet_method is not None and last_value is not None:
-                vector.add(last_value, last_nondet_method)
-                last_nondet_method = None
-                last_value = None
+    def _get_value_format(self, method_name):
+        if method_name not in self._value_formats:
+            method_type = utils.get_nondet_method(method_name)['type']
+            self._value_formats[method_name] = struct.Struct(utils.get_data_format(method_type))
+        return self._value_formats[method_name]
 
+    def _create_test_vector(self, test, objects):
+        vector = utils.TestVector(test.name, test.origin)
+        for obj_name, obj_value in objects:
+            var_name = obj_name.decode()
+            assert "'" not in var_name, \
+                "Variable name contains \"'\": %s" % var_name
+            nondet_method = utils.get_corresponding_method_name(var_name)
+            value, = self._get_value_format(nondet_method).unpack(obj_value)
+            vector.add(str(value), nondet_method)
         return vector
 
+    def _get_test_vector(self, test):
+        objects, = read_ktests([test.origin])
+        return self._create_test_vector(test, objects)
+
+    def get_test_vectors(self, test_cases):
+        """Returns the test vectors for the given test cases, reading their .ktest files in one batch."""
+        self.timer_vector_gen.start()
+        try:
+            all_objects = read_ktests([t.origin for t in test_cases])
+            return [self._create_test_vector(t, o) for t, o in zip(test_cases, all_objects)]
+        finally:
+            self.timer_vector_gen.stop()
+
     def get_test_cases(self, exclude=[]):
-        return get_test_cases(exclude)
+        return get_test_cases(exclude, instances=self.instances)
+
+    def create_test_discovery(self):
+        # KLEE writes the coverage of a test after the test, so tests are scored only once their coverage exists
+        pattern = coverage_pattern if self.scorer.requires_coverage else test_pattern
+        if self.instances == 1:
+            return TestDiscovery(get_tests_dir(), pattern)
+        return TestDiscoveryGroup([TestDiscovery(d, pattern) for d in get_tests_dirs(self.instances)])
+
+    def get_test_cases_from(self, test_files, exclude):
+        test_files = [os.path.splitext(t)[0] + '.ktest' for t in test_files]
+        return [get_test_case(t) for t in test_files if get_test_name(t) not in exclude]
 
@@ -0,0 +1,103 @@
+from test_validation import TestValidator
+from test_discovery import TestDiscoveryGroup
+import utils
+import logging
+
+name = 'portfolio'
+
+
+class PortfolioTestValidator(TestValidator):
+    """
+    Validates the tests of several input generators that run in parallel.
+
+    The tests of all generators are merged into one validation queue. Each generator has its own validator
+    that reads its tests; to keep the test names unique, they are prefixed with the name of that validator.
+    """
+
+    def __init__(self, validation_config, validators):
+        super().__init__(validation_config)
+        self.validators = validators
+        self._visited_tests = {v: set() for v in validators}
+        self._test_owners = dict()
+
+        self.successful_generator = utils.Constant()
+        self.statistics.add_value('Generator that found the error', self.successful_generator)
+        # Each test is scored by the order of the generator it comes from
+        self.test_order.value = ', '.join([v.get_name() + ': ' + v.test_order.value for v in validators])
+
+    def get_name(self):
+        return name
+
+    def _get_test_name(self, validator, test_name):
+        return validator.get_name() + '.' + test_name
+
+    def _get_owner(self, test_name):
+        return self._test_owners[test_name]
+
+    def _adopt(self, validator, test_case):
+        test_name = self._get_test_name(validator, test_case.name)
+        self._test_owners[test_name] = (validator, test_case)
+        return utils.TestCase(test_name, test_case.origin, test_case.content)
+
+    def get_test_cases(self, exclude=[]):
+        all_test_cases = list()
+        for validator in self.validators:
+            all_test_cases += [self._adopt(validator, t) for t in validator.get_test_cases()]
+        return [t for t in all_test_cases if t.name not in exclude]
+
+    def get_new_test_cases(self, exclude):
+        new_test_cases = list()
+        for validator in self.validators:
+            # Each validator only knows the names of its own tests
+            visited = self._visited_tests[validator]
+            for test_case in validator.get_new_test_cases(visited):
+                visited.add(test_case.name)
+                new_test_cases.append(self._adopt(validator, test_case))
+        return [t for t in new_test_cases if t.name not in exclude]
+
+    def create_test_discovery(self):
+        discoveries = list()
+        for validator in self.validators:
+            validator._test_discovery = validator.create_test_discovery()
+            if validator._test_discovery:
+                discoveries.append(validator._test_discovery)
+        return TestDiscoveryGroup(discoveries)
+
+    def score(self, program_file, test_vector):
+        validator, _ = self._get_owner(test_vector.name)
+        return validator.score(program_file, test_vector)
+
+    def _get_test_vector(self, test_case):
+        validator, original_test_case = self._get_owner(test_case.name)
+        test_vector = validator.get_test_vector(original_test_case)
+        test_vector.name = test_case.name
+        return test_vector
+
+    def get_test_vectors(self, test_cases):
+        self.timer_vector_gen.start()
+        try:
+            # Let each validator create the vectors of its own tests together, since some do that in one batch
+            test_vectors = dict()
+            for validator in self.validators:
+                own_tests = [t for t in test_cases if self._get_owner(t.name)[0] is validator]
+                if not own_tests:
+                    continue
+                own_vectors = validator.get_test_vectors([self._get_owner(t.name)[1] for t in own_tests])
+                for test_case, test_vector in zip(own_tests, own_vectors):
+                    test_vector.name = test_case.name
+                    test_vectors[test_case.name] = test_vector
+            return [test_vectors[t.name] for t in test_cases]
+        finally:
+            self.timer_vector_gen.stop()
+
+    def can_create_witness(self, test_vector):
+        validator, _ = self._get_owner(test_vector.name)
+        return validator.can_create_witness(test_vector)
+
+    def check_inputs(self, program_file, generator_thread, stop_event):
+        result = super().check_inputs(program_file, generator_thread, stop_event)
+        if result.is_positive() and result.test_vector is not None:
+            validator, _ = self._get_owner(result.test_vector.name)
+            self.successful_generator.value = validator.get_name()
+            logging.info("Error found with test of %s", validator.get_name())
+        return result
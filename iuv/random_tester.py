@@ -1,33 +1,75 @@
 import os
 import glob
+import time
 import utils
+import seed_generation
 from input_generation import BaseInputGenerator
 from test_validation import TestValidator
+from test_discovery import TestDiscovery
 
 name = "prtest"
 include_dir = os.path.abspath("./random/include")
 generator_harness = os.path.abspath("./random/random_tester.c")
-random_runner = os.path.abspath("./random/run.sh")
-
-
-def get_test_cases(exclude=[], directory=utils.tmp):
-    all_tests = [t for t in glob.glob(directory + '/vector[0-9]*.test')]
-    tcs = list()
-    for t in [t for t in all_tests if utils.get_file_name(t) not in exclude]:
-        with open(t, 'r') as inp:
-            content = inp.read()
-        tcs.append(utils.TestCase(utils.get_file_name(t), t, content))
-    return tcs
+test_pattern = 'vectors[0-9]*.test'
+vector_header = '# vector '
+
+
+def get_test_cases_of_file(test_file, errors_only=False):
+    """
+    Returns the test cases in the given file.
+    The random tester writes its tests in batches. Each test starts with a line '# vector <seed>',
+    where seed is the seed of the random values of the test. The test is named after that seed.
+    If the test reached the error method, the line ends with ' error'. If errors_only is set,
+    only these tests are returned.
+    """
+    with open(test_file, 'r') as inp:
+        content = inp.read()
+    test_cases = list()
+    for test in content.split(vector_header)[1:]:
+        header, _, test_content = test.partition('\n')
+        seed, _, marker = header.partition(' ')
+        if errors_only and marker != 'error':
+            continue
+        test_cases.append(utils.TestCase('vector' + seed, test_file, test_content))
+    return test_cases
+
+
+def get_test_cases(exclude=[], directory=None, errors_only=False):
+    if directory is None:
+        directory = utils.get_context().tmp
+    all_tests = list()
+    for test_file in glob.glob(os.path.join(directory, test_pattern)):
+        all_tests += get_test_cases_of_file(test_file, errors_only)
+    return [t for t in all_tests if t.name not in exclude]
 
 
 class InputGenerator(BaseInputGenerator):
 
+    def __init__(self, timelimit, machine_model, log_verbose, seed=None):
+        super().__init__(timelimit, machine_model, log_verbose)
+        # Test number i uses seed + i, so that each test can be reproduced
+        self.seed = seed if seed is not None else int(time.time() * 1e9) & 0xffffffff
+        self.statistics.add_value('Random seed', utils.Constant(self.seed))
+        self.seed_constants = list()
+        self.number_seed_constants = utils.Constant()
+        self.statistics.add_value('Number of seed constants', self.number_seed_constants)
+
     def get_run_env(self):
-        return utils.get_env()
+        env = utils.get_env()
+        env['PRTEST_SEED'] = str(self.seed)
+        # The engine uses these constants as values every now and then, see random_tester.c
+        env['PRTEST_CONSTANTS'] = ','.join(str(c) for c in self.seed_constants)
+        return env
 
     def get_name(self):
         return name
 
+    def _get_error_method_dummy(self):
+        # Let the engine know that the test reached the error, see random_tester.c
+        return 'void report_error();\n' \
+               + 'void ' + utils.error_method + '() {{ report_error(); fprintf(stderr, \"{0}\\n\"); exit(1); }}\n'.format(
+                   utils.error_string)
+
     def prepare(self, filecontent, nondet_methods_used):
         content = filecontent
         content += '\n'
@@ -61,19 +103,30 @@ class InputGenerator(BaseInputGenerator):
         compiled_file = utils.get_file_path(compiled_file, temp_dir=True)
         machinem_arg = self.machine_model.compile_parameter
         compile_cmd = ['gcc', '-std=gnu11', machinem_arg, '-I', include_dir, '-o', compiled_file, generator_harness, filename, '-lm']
-        input_generation_cmd = [random_runner, compiled_file]
+        compile_cmd = utils.CompileCommand(compile_cmd, compiled_file, [generator_harness, filename])
+        # The compiled program runs the tests by itself, see random_tester.c
+        input_generation_cmd = [compiled_file]
+
+        self.seed_constants = seed_generation.get_constants(self.program_file, self.machine_model)
+        self.number_seed_constants.value = len(self.seed_constants)
 
         return [compile_cmd, input_generation_cmd]
 
     def get_test_count(self):
-        files = get_test_cases()
-        if not files:
+        tests = get_test_cases(directory=self.working_dir or utils.get_context().tmp)
+        if not tests:
             raise utils.InputGenerationError('No test files generated.')
-        return len(files)
+        return len(tests)
 
 
 class RandomTestValidator(TestValidator):
 
+    def __init__(self, validation_config):
+        super().__init__(validation_config)
+        # The random tester reports which of its tests reached the error.
+        # If we trust it, only these tests have to be validated
+        self.errors_only = validation_config.use_inline_errors
+
     def get_name(self):
         return name
 
@@ -83,9 +136,9 @@ class RandomTestValidator(TestValidator):
 
     def _get_test_vector(self, test):
         test_info = [t for t in test.content.split('\n') if t]
-        vector = utils.TestVector(test.name, test.origin)
+        seed = test.name[len('vector'):]
+        vector = utils.TestVector(test.name, test.origin, vector_header + seed + '\n' + test.content)
         for idx, line in enumerate(test_info):
-            print(line)
             var_name = line.split(':')[0].strip()  # Line format is var: value
             nondet_method_name = utils.get_corresponding_method_name(var_name)
             value = line.split(':')[1].strip()  # is in C hex notation, e.g. '\x00\x00' (WITH the ''!)
@@ -94,6 +147,14 @@ class RandomTestValidator(TestValidator):
         return vector
 
     def get_test_cases(self, exclude=[]):
-        return get_test_cases(exclude)
+        return get_test_cases(exclude, self.working_dir or utils.get_context().tmp, self.errors_only)
 
+    def create_test_discovery(self):
+        # The random tester writes its tests to the working directory of the input generation
+        return TestDiscovery(self.working_dir or utils.get_context().tmp, test_pattern)
 
+    def get_test_cases_from(self, test_files, exclude):
+        test_cases = list()
+        for test_file in test_files:
+            test_cases += get_test_cases_of_file(test_file, self.errors_only)
+        return [t for t in test_cases if t.name not in exclude]
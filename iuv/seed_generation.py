@@ -0,0 +1,109 @@
+import logging
+
+import pycparser
+
+import utils
+
+# The harness reads one line per call to a nondet method, so each seed has to provide enough lines
+seed_length = 1000
+# Programs with many constants would otherwise get a corpus that is too large for AFL's first rounds
+max_constants = 32
+
+
+def get_integer_bounds(method_type, machine_model):
+    """Returns the smallest and the largest value of the given integer type.
+    If the type is no integer type, None is returned."""
+    words = [w for w in method_type.split() if w not in ('const', 'volatile', 'static')]
+    m_type = ' '.join(words)
+    if not words or '*' in m_type or any(w in words for w in ('void', 'float', 'double', 'struct', 'union', 'enum')):
+        return None
+    if m_type == '_Bool':
+        return 0, 1
+    if 'char' in words:
+        size = 1
+    else:
+        try:
+            size = machine_model.get_size(m_type)
+        except AssertionError:
+            if 'unsigned' not in words and 'signed' not in words:
+                return None
+            size = machine_model.int_size
+    bits = 8 * size
+    if 'unsigned' in words:
+        return 0, 2 ** bits - 1
+    return -2 ** (bits - 1), 2 ** (bits - 1) - 1
+
+
+def get_constants(program_file, machine_model):
+    """
+    Returns the integer constants that the given program compares its values to.
+    Constants of functions that call a nondet method come first, since they most likely decide
+    about the values of the nondet methods. Each constant is returned only once.
+    If the program can't be parsed, no constants are returned.
+    """
+    program_info = utils.get_program_info(program_file)
+    if program_info.seed_constants is not None:
+        return program_info.seed_constants
+
+    import ast_visitor
+
+    with open(program_file, 'r') as inp:
+        content = utils.rewrite_cproblems(inp.read())
+    nondet_methods = utils.get_nondet_methods(program_file) or []
+    collector = ast_visitor.ComparisonConstantCollector([m['name'] for m in nondet_methods])
+    try:
+        collector.visit(utils.parse_file_with_preprocessing(content, machine_model))
+    except pycparser.plyparser.ParseError as e:
+        logging.warning("Parse failure with pycparser while looking for seed constants: %s", e)
+        return []
+
+    # sorted is stable, so the constants keep their order in the program otherwise
+    constants = sorted(collector.constants, key=lambda c: c[0] not in collector.nondet_functions)
+    unique_constants = list()
+    for _, value in constants:
+        if value not in unique_constants:
+            unique_constants.append(value)
+    program_info.seed_constants = unique_constants[:max_constants]
+    logging.debug("Seed constants: %s", program_info.seed_constants)
+    return program_info.seed_constants
+
+
+def _get_seed(values):
+    """Returns a seed in the line-based input format of the harness that repeats the given values."""
+    return ''.join(str(values[i % len(values)]) + '\n' for i in range(seed_length))
+
+
+def get_seeds(program_file, machine_model):
+    """
+    Returns the initial test inputs for the given program, in the line-based input format of the harness.
+
+    Besides a seed with only zeros, there is a seed for each constant the program compares to,
+    for the values next to each constant and for the bounds of the types of the nondet methods.
+    Values that no integer nondet method of the program can return are left out.
+    If the program reads several values, the constants may be needed in combination,
+    so one more seed contains all constants in turns.
+    """
+    nondet_methods = utils.get_nondet_methods(program_file) or []
+    bounds = [get_integer_bounds(m['type'], machine_model) for m in nondet_methods if m['type'] != 'void']
+    bounds = [b for b in bounds if b is not None]
+    if not bounds:
+        return [_get_seed([0])]
+
+    def is_valid(value):
+        return any(lower <= value <= upper for lower, upper in bounds)
+
+    constants = [c for c in get_constants(program_file, machine_model) if is_valid(c)]
+    values = [0] + constants
+    for constant in constants:
+        values += [constant - 1, constant + 1]
+    for lower, upper in bounds:
+        values += [lower, upper, -1]
+
+    seed_values = list()
+    for value in values:
+        if is_valid(value) and value not in seed_values:
+            seed_values.append(value)
+    seeds = [_get_seed([v]) for v in seed_values]
+    if len(constants) > 1:
+        seeds.append(_get_seed(constants))
+    return seeds
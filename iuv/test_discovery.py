@@ -0,0 +1,292 @@
+import ctypes
+import ctypes.util
+import fnmatch
+import logging
+import os
+import re
+import select
+import struct
+from threading import Thread, Event, Condition
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+
+_inotify_event = struct.Struct('iIII')
+_libc = None
+
+
+def _get_libc():
+    global _libc
+    if _libc is None:
+        _libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+    return _libc
+
+
+def inotify_available():
+    try:
+        libc = _get_libc()
+        return hasattr(libc, 'inotify_init1') and hasattr(libc, 'inotify_add_watch')
+    except OSError:
+        return False
+
+
+class InotifyWatcher(object):
+    """Reports the names of files in a single directory that inotify reports an event for.
+    If the directory is removed, inotify removes the watch, and self.removed is set."""
+
+    def __init__(self, directory, mask):
+        libc = _get_libc()
+        self._fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        watch = libc.inotify_add_watch(self._fd, os.fsencode(directory), mask)
+        if watch < 0:
+            errno = ctypes.get_errno()
+            os.close(self._fd)
+            raise OSError(errno, os.strerror(errno), directory)
+        self.overflow = False
+        self.removed = False
+
+    def fileno(self):
+        return self._fd
+
+    def read_names(self):
+        """Returns the names of all files events are pending for.
+        If the event queue of the kernel overflowed, self.overflow is set."""
+        names = list()
+        while True:
+            try:
+                data = os.read(self._fd, 65536)
+            except BlockingIOError:
+                return names
+            offset = 0
+            while offset < len(data):
+                _, mask, _, length = _inotify_event.unpack_from(data, offset)
+                offset += _inotify_event.size
+                name = data[offset:offset + length].rstrip(b'\0')
+                offset += length
+                if mask & IN_Q_OVERFLOW:
+                    self.overflow = True
+                elif mask & IN_IGNORED:
+                    self.removed = True
+                elif name:
+                    names.append(os.fsdecode(name))
+
+    def close(self):
+        os.close(self._fd)
+
+
+class TestDiscovery(object):
+    """
+    Watches a directory for test files and queues each new test file for validation.
+
+    The watching runs in its own thread. It uses inotify if available, so that the cost of discovery
+    depends on the number of new test files only. Otherwise, it falls back to a low-frequency
+    check of the modification time of the directory and only lists it if it changed.
+
+    If report_changes is set, a test file is queued again every time it is modified.
+    This is meant for tools that append all tests to a single file.
+    """
+
+    def __init__(self, directory, pattern, report_changes=False, poll_interval=0.5):
+        self.directory = directory
+        if type(pattern) is str:
+            pattern = re.compile(fnmatch.translate(pattern))
+        self.pattern = pattern
+        self.report_changes = report_changes
+        self.poll_interval = poll_interval
+
+        self._known_files = dict()
+        self._directory_mtime = None
+        self._new_tests = list()
+        self._new_tests_available = Condition()
+        self._listeners = list()
+        self._stop_event = Event()
+        self._finished = False
+        self._wakeup_read, self._wakeup_write = os.pipe()
+        self._watcher = None
+        self._thread = Thread(target=self._run, name="test discovery for " + directory, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        if self._stop_event.is_set():
+            return
+        self._stop_event.set()
+        os.write(self._wakeup_write, b'\0')
+        if self._thread.is_alive():
+            self._thread.join()
+        if self._watcher:
+            self._watcher.close()
+            self._watcher = None
+        os.close(self._wakeup_read)
+        os.close(self._wakeup_write)
+
+    def finish(self):
+        """Stops watching and queues all test files that were not discovered, yet.
+        This should be called after the test generator finished."""
+        self.stop()
+        self._finished = True
+        self._directory_mtime = None
+        self._scan()
+
+    def is_finished(self):
+        return self._finished
+
+    def get_new_tests(self, timeout=0):
+        """Returns the paths of all queued test files, in order of discovery.
+        Waits up to timeout seconds for new test files, if none are queued."""
+        with self._new_tests_available:
+            if not self._new_tests and timeout:
+                self._new_tests_available.wait(timeout)
+            new_tests = self._new_tests
+            self._new_tests = list()
+        return new_tests
+
+    def wait(self, timeout):
+        """Waits until new test files are queued, for at most timeout seconds."""
+        with self._new_tests_available:
+            if not self._new_tests:
+                self._new_tests_available.wait(timeout)
+            return len(self._new_tests) > 0
+
+    def has_new_tests(self):
+        with self._new_tests_available:
+            return len(self._new_tests) > 0
+
+    def add_listener(self, listener):
+        """Registers a function that is called without arguments every time new test files are queued."""
+        self._listeners.append(listener)
+
+    def _queue(self, names):
+        new_tests = list()
+        for name in names:
+            if not self.pattern.match(name):
+                continue
+            path = os.path.join(self.directory, name)
+            if self.report_changes:
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                state = (stat.st_mtime_ns, stat.st_size)
+                if self._known_files.get(name) == state:
+                    continue
+                self._known_files[name] = state
+            elif name in self._known_files:
+                continue
+            else:
+                self._known_files[name] = None
+            new_tests.append(path)
+        if new_tests:
+            with self._new_tests_available:
+                self._new_tests += new_tests
+                self._new_tests_available.notify_all()
+            for listener in self._listeners:
+                listener()
+
+    def _scan(self):
+        try:
+            directory_mtime = os.stat(self.directory).st_mtime_ns
+        except FileNotFoundError:
+            return
+        # Appending to an existing file does not change the modification time of its directory
+        if directory_mtime == self._directory_mtime and not self.report_changes:
+            return
+        self._directory_mtime = directory_mtime
+        self._queue(sorted(os.listdir(self.directory)))
+
+    def _start_watcher(self):
+        if self.report_changes:
+            mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_MODIFY
+        else:
+            mask = IN_CLOSE_WRITE | IN_MOVED_TO
+        try:
+            self._watcher = InotifyWatcher(self.directory, mask)
+        except OSError as e:
+            logging.debug("Can't watch %s with inotify: %s", self.directory, e)
+            return
+        # Files created before the watch was established are not reported by inotify
+        self._scan()
+
+    def _run(self):
+        use_inotify = inotify_available()
+        while not self._stop_event.is_set():
+            if use_inotify and not self._watcher and os.path.isdir(self.directory):
+                self._start_watcher()
+                use_inotify = self._watcher is not None
+
+            if self._watcher:
+                ready, _, _ = select.select([self._watcher, self._wakeup_read], [], [])
+                if self._watcher in ready:
+                    self._queue(self._watcher.read_names())
+                    if self._watcher.overflow:
+                        self._watcher.overflow = False
+                        self._directory_mtime = None
+                        self._scan()
+                    if self._watcher.removed:
+                        # Generators may remove and recreate their output directory, e.g. when they restart.
+                        # The directory is watched again as soon as it exists, and scanned then
+                        logging.debug("Watched directory %s was removed", self.directory)
+                        self._watcher.close()
+                        self._watcher = None
+                        self._directory_mtime = None
+            else:
+                self._scan()
+                self._stop_event.wait(self.poll_interval)
+
+
+class TestDiscoveryGroup(object):
+    """Controls the test discoveries of several validators as one."""
+
+    def __init__(self, discoveries):
+        self.discoveries = discoveries
+        self._new_tests_available = Condition()
+        self.add_listener(self._notify)
+
+    def start(self):
+        for discovery in self.discoveries:
+            discovery.start()
+
+    def stop(self):
+        for discovery in self.discoveries:
+            discovery.stop()
+
+    def finish(self):
+        for discovery in self.discoveries:
+            discovery.finish()
+
+    def is_finished(self):
+        return all(d.is_finished() for d in self.discoveries)
+
+    def get_new_tests(self, timeout=0):
+        """Returns the paths of all test files queued by any of the discoveries.
+        Waits up to timeout seconds for new test files, if none are queued."""
+        if timeout:
+            self.wait(timeout)
+        new_tests = list()
+        for discovery in self.discoveries:
+            new_tests += discovery.get_new_tests()
+        return new_tests
+
+    def wait(self, timeout):
+        """Waits until any of the discoveries queued new test files, for at most timeout seconds."""
+        # The discoveries notify the condition after queueing, so checking them while holding it loses no wakeup
+        with self._new_tests_available:
+            return self._new_tests_available.wait_for(self.has_new_tests, timeout)
+
+    def has_new_tests(self):
+        return any(d.has_new_tests() for d in self.discoveries)
+
+    def add_listener(self, listener):
+        for discovery in self.discoveries:
+            discovery.add_listener(listener)
+
+    def _notify(self):
+        with self._new_tests_available:
+            self._new_tests_available.notify_all()
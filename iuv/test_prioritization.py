@@ -0,0 +1,123 @@
+import heapq
+import itertools
+import os
+from abc import ABCMeta, abstractmethod
+
+import utils
+
+
+class Scorer(object):
+    """
+    Scores test vectors to decide the order of their validation.
+    Vectors with a higher score are validated first.
+    """
+    __metaclass__ = ABCMeta
+
+    name = None
+    # Whether the scores depend on the coverage files of KLEE tests
+    requires_coverage = False
+
+    @abstractmethod
+    def score(self, program_file, test_vector):
+        pass
+
+
+class DiscoveryOrder(Scorer):
+    """Validates test vectors in the order they were found."""
+
+    name = 'fifo'
+
+    def score(self, program_file, test_vector):
+        return 0
+
+
+class NewestFirst(Scorer):
+    """Prefers the test vectors that were written last, since they come from the most recent search."""
+
+    name = 'newest'
+
+    def score(self, program_file, test_vector):
+        try:
+            return os.stat(test_vector.origin).st_mtime_ns
+        except OSError:
+            return 0
+
+
+class ShortestFirst(Scorer):
+    """Prefers test vectors with few values, since they are cheap to run and to validate."""
+
+    name = 'shortest'
+
+    def score(self, program_file, test_vector):
+        return -len(test_vector)
+
+
+class AflCoverageFirst(Scorer):
+    """Prefers AFL queue entries that AFL marked with '+cov', since they cover new branches."""
+
+    name = 'afl-cov'
+
+    def score(self, program_file, test_vector):
+        return 1 if '+cov' in test_vector.name else 0
+
+
+class KleeErrorFirst(Scorer):
+    """
+    Prefers KLEE tests whose path covered a call to the error method.
+
+    This requires that KLEE writes the covered lines of each test to a .cov file next to
+    the .ktest file (option -write-cov). KLEE writes that file after the .ktest file, so the KLEE validator
+    only reports a test once its .cov file exists. Tests without coverage information get the lowest score.
+    """
+
+    name = 'klee-error'
+    requires_coverage = True
+
+    def score(self, program_file, test_vector):
+        cov_file = os.path.splitext(test_vector.origin)[0] + '.cov'
+        try:
+            with open(cov_file, 'r') as inp:
+                # Each line has the format <file>:<line>
+                covered_lines = {int(l.rsplit(':', 1)[1]) for l in inp if ':' in l}
+        except (OSError, ValueError):
+            return 0
+        error_lines = utils.get_program_info(program_file).error_lines
+        return 1 if covered_lines.intersection(error_lines) else 0
+
+
+scorers = {s.name: s for s in (DiscoveryOrder, NewestFirst, ShortestFirst, AflCoverageFirst, KleeErrorFirst)}
+
+
+def get_scorer(name):
+    try:
+        return scorers[name]()
+    except KeyError:
+        raise utils.ConfigError("Unknown test order: {} (choose from {})".format(name, ', '.join(scorers)))
+
+
+class ValidationQueue(object):
+    """
+    Test vectors that wait for their validation, ordered by their score.
+    Vectors with the same score are taken in the order they were added.
+    """
+
+    def __init__(self):
+        self._heap = list()
+        self._counter = itertools.count()
+
+    def __len__(self):
+        return len(self._heap)
+
+    def add(self, test_vector, score):
+        heapq.heappush(self._heap, (-score, next(self._counter), test_vector))
+
+    def pop(self):
+        """Removes the test vector with the highest score from the queue and returns it."""
+        _, _, test_vector = heapq.heappop(self._heap)
+        return test_vector
+
+    def pop_all(self):
+        """Removes all test vectors from the queue and returns them, ordered by their score."""
+        test_vectors = [v for _, _, v in sorted(self._heap)]
+        self._heap = list()
+        return test_vectors
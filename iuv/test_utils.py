@@ -1,5 +1,9 @@
 import unittest
+import tempfile
+import pycparser.c_ast as a
 import utils
+import ast_visitor
+import seed_generation
 
 method_name = '__VERIFIER_nondet_int'
 bool_method_name = '__VERIFIER_nondet_bool'
@@ -7,8 +11,8 @@ class TestUtils(unittest.TestCase):
 
     @classmethod
     def setUpClass(cls):
-        utils.undefined_methods = [{'name': method_name, 'type': 'int', 'params': []},
-                                   {'name': bool_method_name, 'type': '_Bool', 'params': []}]
+        utils.get_context().undefined_methods = [{'name': method_name, 'type': 'int', 'params': []},
+                                                   {'name': bool_method_name, 'type': '_Bool', 'params': []}]
 
     def test_multicharacter_conversion(self):
         value = b'\x00\x00\x00\x00'
@@ -31,4 +35,95 @@ class TestUtils(unittest.TestCase):
         value = b'\x01'
         expected = 1
         actual, = utils.convert_to_int(value, bool_method_name)
-        self.assertEqual(actual, expected)
\ No newline at end of file
+        self.assertEqual(actual, expected)
+
+    def test_incremental_file_reader(self):
+        with tempfile.NamedTemporaryFile(mode='wb') as outp:
+            reader = utils.IncrementalFileReader(outp.name)
+            outp.write(b'first\nsec')
+            outp.flush()
+            self.assertEqual(reader.read_new_lines(), ['first'])
+            outp.write(b'ond\nthird')
+            outp.flush()
+            self.assertEqual(reader.read_new_lines(), ['second'])
+            self.assertEqual(reader.read_new_lines(final=True), ['third'])
+            self.assertEqual(reader.read_new_lines(final=True), [])
+
+    def test_test_vector_key(self):
+        def vector(*values):
+            test_vector = utils.TestVector('test', 'origin')
+            for value in values:
+                test_vector.add(value)
+            return test_vector
+
+        self.assertEqual(vector(b'a', b'b').get_key(), vector(b'a', b'b').get_key())
+        self.assertNotEqual(vector(b'a\0', b'b').get_key(), vector(b'a', b'\0b').get_key())
+        self.assertNotEqual(vector('1 ').get_key(), vector('1').get_key())
+
+    def test_integer_value(self):
+        self.assertEqual(ast_visitor.get_integer_value(a.Constant('int', '42')), 42)
+        self.assertEqual(ast_visitor.get_integer_value(a.Constant('int', '017')), 15)
+        self.assertEqual(ast_visitor.get_integer_value(a.Constant('unsigned int', '0x1fU')), 31)
+        self.assertEqual(ast_visitor.get_integer_value(a.Constant('long int', '0L')), 0)
+        self.assertEqual(ast_visitor.get_integer_value(a.Constant('char', "'a'")), 97)
+        self.assertEqual(ast_visitor.get_integer_value(a.UnaryOp('-', a.Constant('int', '5'))), -5)
+        self.assertIsNone(ast_visitor.get_integer_value(a.Constant('double', '1.5')))
+        self.assertIsNone(ast_visitor.get_integer_value(a.ID('x')))
+
+    def test_integer_bounds(self):
+        model = utils.MACHINE_MODEL_64
+        self.assertEqual(seed_generation.get_integer_bounds('int', model), (-2 ** 31, 2 ** 31 - 1))
+        self.assertEqual(seed_generation.get_integer_bounds('unsigned char', model), (0, 255))
+        self.assertEqual(seed_generation.get_integer_bounds('_Bool', model), (0, 1))
+        self.assertEqual(seed_generation.get_integer_bounds('unsigned long', model), (0, 2 ** 64 - 1))
+        self.assertIsNone(seed_generation.get_integer_bounds('double', model))
+        self.assertIsNone(seed_generation.get_integer_bounds('char *', model))
+
+    def test_seeds(self):
+        with tempfile.NamedTemporaryFile(mode='w', suffix='.c') as program:
+            program.write('int main() { return 0; }\n')
+            program.flush()
+            program_info = utils.get_program_info(program.name)
+            program_info.nondet_methods = [{'name': '__VERIFIER_nondet_uchar', 'type': 'unsigned char', 'params': []}]
+            program_info.seed_constants = [5, 300, 7]
+            seeds = seed_generation.get_seeds(program.name, utils.MACHINE_MODEL_64)
+
+        first_values = [s.split('\n', 1)[0] for s in seeds]
+        # 300 and -1 are no values of unsigned char
+        self.assertEqual(first_values[:-1], ['0', '5', '7', '4', '6', '8', '255'])
+        self.assertTrue(seeds[-1].startswith('5\n7\n5\n'))
+        self.assertTrue(all(s.count('\n') == seed_generation.seed_length for s in seeds))
+
+    def test_parse_c_integer(self):
+        self.assertEqual(utils._parse_c_integer('42'), 42)
+        self.assertEqual(utils._parse_c_integer('-42'), -42)
+        self.assertEqual(utils._parse_c_integer('+0x1F'), 31)
+        self.assertEqual(utils._parse_c_integer('017'), 15)
+        self.assertEqual(utils._parse_c_integer('0'), 0)
+        # strtoull stops at these, so the text harness reads them as long double or aborts
+        self.assertIsNone(utils._parse_c_integer('08'))
+        self.assertIsNone(utils._parse_c_integer('1.5'))
+        self.assertIsNone(utils._parse_c_integer('1 '))
+        self.assertIsNone(utils._parse_c_integer(''))
+
+    def test_binary_input_vector(self):
+        model = utils.MACHINE_MODEL_64
+        test_vector = utils.TestVector('test', 'origin')
+        test_vector.add('42', method_name)
+        test_vector.add('-1', method_name)
+        test_vector.add('0x101', bool_method_name)
+        self.assertEqual(utils.get_binary_input_vector(test_vector, model),
+                         b'\x2a\0\0\0' + b'\xff\xff\xff\xff' + b'\x01')
+
+        # Like strtoull, values out of range saturate
+        test_vector = utils.TestVector('test', 'origin')
+        test_vector.add(str(2 ** 70), method_name)
+        self.assertEqual(utils.get_binary_input_vector(test_vector, model), b'\xff\xff\xff\xff')
+
+        # Values without method, like AFL's, and values that are no integers are passed as text
+        test_vector = utils.TestVector('test', 'origin')
+        test_vector.add(b'\0*\0\0\0\x07')
+        self.assertIsNone(utils.get_binary_input_vector(test_vector, model))
+        test_vector = utils.TestVector('test', 'origin')
+        test_vector.add('1.5', method_name)
+        self.assertIsNone(utils.get_binary_input_vector(test_vector, model))
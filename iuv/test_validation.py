@@ -1,15 +1,33 @@
 from abc import abstractmethod, ABCMeta
 import witness_generation as wit_gen
 import harness_generation as harness_gen
+import artifact_cache
+import test_prioritization
 import logging
 import utils
 import os
-from time import sleep
-import re
-from utils import TRUE, FALSE, UNKNOWN, ERROR
+import queue
+import bisect
+import select
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+from threading import Condition, Event, Lock
+from time import sleep, monotonic
+from utils import TRUE, FALSE, UNKNOWN, ERROR, TIMEOUT
 
 valid_validators = ['cpachecker', 'uautomizer', 'cpa-w2t', 'fshell-w2t']
 
+# Number of bytes that are kept from the start and from the end of the output of a witness validator
+validator_output_size = 1024 * 1024
+
+
+def execute_validator(cmd, stop_flag=None, patterns=(), **kwargs):
+    """Runs the command of a witness validator. The validators report their verdict at the end of their output,
+    so only the start and the end of the output are kept. All other keyword arguments are passed to utils.execute."""
+    return utils.execute(cmd, quiet=True, err_to_output=True, stop_flag=stop_flag,
+                         output=utils.HeadTailOutput(validator_output_size, patterns), **kwargs)
+
 
 class ValidationConfig(object):
 
@@ -17,8 +35,17 @@ class ValidationConfig(object):
         self.machine_model = args.machine_model
 
         self.use_execution = args.execution_validation
+        self.use_fork_server = args.fork_server
+        self.use_binary_vectors = args.binary_vectors
+        self.validation_jobs = args.validation_jobs
+        if self.validation_jobs < 1:
+            raise utils.ConfigError("Number of validation jobs must be at least 1: " + str(self.validation_jobs))
         self.use_witness_validation = args.witness_validation
         self.witness_validators = args.validators if args.validators else []
+        self.validator_jobs = args.validator_jobs
+        if self.validator_jobs is not None and self.validator_jobs < 1:
+            raise utils.ConfigError("Number of jobs per validator must be at least 1: " + str(self.validator_jobs))
+        self.validator_memory = args.validator_memory
 
         self.use_klee_replay = False
         if args.klee_replay_validation:
@@ -41,6 +68,13 @@ class ValidationConfig(object):
         elif not self.use_witness_validation and not self.use_execution and not self.use_klee_replay:
             raise utils.ConfigError("No validation technique specified. Specify --execution or --witness-validation .")
 
+        # Point in time (of time.monotonic) at which the whole verification is stopped
+        self.deadline = monotonic() + args.timelimit if args.timelimit else None
+
+        self.use_inline_errors = args.inline_errors
+        if self.use_inline_errors and 'random' not in args.input_generators:
+            raise utils.ConfigError("Inline error detection only works with the random tester")
+
         self.convert_to_int = args.write_integers
         self.naive_verification = args.naive_verification
 
@@ -49,20 +83,22 @@ class TestValidator(object):
 
     __metaclass__ = ABCMeta
 
+    # Name of the test_prioritization.Scorer that decides the order of validation, if none is configured
+    default_test_order = test_prioritization.DiscoveryOrder.name
+
     def __init__(self, validation_config):
         self._nondet_var_map = None
         self.machine_model = validation_config.machine_model
         self.config = validation_config
         self.witness_creator = wit_gen.WitnessCreator()
         self.harness_creator = harness_gen.HarnessCreator()
+        self._execution_pool = None
+        self._test_discovery = None
+        # Working directory of the input generator whose tests are validated. If None, it is the current one
+        self.working_dir = None
 
         self.naive_verification = validation_config.naive_verification
 
-        # If a void appears in a line, there must be something between
-        # the void and the __VERIFIER_error() symbol - otherwise
-        # it is a function definition/declaration.
-        self.error_method_pattern = re.compile('((?!void).)*(void.*\S.*)?__VERIFIER_error\(\) *;.*')
-
         self.statistics = utils.Statistics('Test Validator ' + self.get_name())
         self.timer_validation = utils.Stopwatch()
         self.statistics.add_value('Time for validation', self.timer_validation)
@@ -83,21 +119,30 @@ class TestValidator(object):
         self.final_test_vector_size = utils.Constant()
         self.statistics.add_value("Size of successful test vector", self.final_test_vector_size)
 
+        # Keys of all test vectors that were executed or validated already
+        self._known_vectors = set()
+        self.counter_duplicate_vectors = utils.Counter()
+        self.statistics.add_value('Number of duplicate test vectors skipped', self.counter_duplicate_vectors)
+
+        # Test vectors that were killed after their time limit, to run again with a longer one
+        self._killed_vectors = list()
+        # Whether the input generation finished, so that no new tests are to be expected
+        self._generation_finished = False
+        self.counter_killed_vectors = utils.Counter()
+        self.statistics.add_value('Number of test vectors killed after timeout', self.counter_killed_vectors)
+        self.counter_retried_vectors = utils.Counter()
+        self.statistics.add_value('Number of test vectors retried with longer timeout', self.counter_retried_vectors)
+
+        self._validation_queue = test_prioritization.ValidationQueue()
+        self.test_order = utils.Constant()
+        self.statistics.add_value('Order of test validation', self.test_order)
+        self.set_test_order(self.default_test_order)
 
     def get_statistics(self):
         return self.statistics
 
     def get_error_lines(self, program_file):
-        with open(program_file, 'r') as inp:
-            content = inp.readlines()
-
-        err_lines = list()
-        for line_num, line in enumerate(content, start=1):
-            # Try to differentiate definition from call through the 'void' condition
-            if self.error_method_pattern.match(line):
-                err_lines.append(line_num)
-        assert err_lines  # Asser that there is at least one error call
-        return err_lines
+        return utils.get_program_info(program_file).error_lines
 
     @abstractmethod
     def get_name(self):
@@ -107,10 +152,30 @@ class TestValidator(object):
     def get_test_cases(self, exclude):
         pass
 
+    def set_test_order(self, order):
+        """Sets the order of validation to the one of the test_prioritization.Scorer with the given name."""
+        self.scorer = test_prioritization.get_scorer(order)
+        self.test_order.value = order
+
+    def score(self, program_file, test_vector):
+        """Returns the score of the given test vector. Vectors with a higher score are validated first."""
+        return self.scorer.score(program_file, test_vector)
+
+    def is_duplicate(self, test_vector):
+        """Returns whether a test vector with the same values was looked at before.
+        Otherwise, the test vector is remembered."""
+        key = test_vector.get_key()
+        if key in self._known_vectors:
+            self.counter_duplicate_vectors.inc()
+            logging.debug("Skipping duplicate test vector %s", test_vector.name)
+            return True
+        self._known_vectors.add(key)
+        return False
+
     def create_all_witnesses(self, program_file, visited_tests):
         created_content = []
-        new_test_cases = self.get_test_cases(visited_tests)
-        nondet_methods = utils.get_nondet_methods()
+        new_test_cases = self.get_new_test_cases(visited_tests)
+        nondet_methods = utils.get_nondet_methods(program_file)
         if len(new_test_cases) > 0:
             logging.info("Looking at %s test cases", len(new_test_cases))
         empty_case_handled = False
@@ -120,16 +185,21 @@ class TestValidator(object):
             assert test_name not in visited_tests
             visited_tests.add(test_name)
             test_vector = self.get_test_vector(test_case)
+            if test_vector and self.is_duplicate(test_vector):
+                continue
             if test_vector or not empty_case_handled:
                 if not test_vector:
                     test_vector = utils.TestVector(test_case.name, test_case.origin)
                     empty_case_handled = True
-                new_content = self.create_witness(program_file, test_case.name, test_vector, nondet_methods)
-                new_content['vector'] = test_vector
-                new_content['origin'] = test_case.origin
-                created_content.append(new_content)
+                self._validation_queue.add(test_vector, self.score(program_file, test_vector))
             else:
                 logging.info("Test vector was not generated for %s", test_case)
+        # Witnesses are validated in the order they are created
+        for test_vector in self._validation_queue.pop_all():
+            new_content = self.create_witness(program_file, test_vector.name, test_vector, nondet_methods)
+            new_content['vector'] = test_vector
+            new_content['origin'] = test_vector.origin
+            created_content.append(new_content)
         return created_content
 
     def create_witness(self, program_file, test_name, test_vector, nondet_methods):
@@ -143,18 +213,27 @@ class TestValidator(object):
         call to a CREST_x(..) function. Each of these transitions has the assumption,
         that the variable specified in the corresponding CREST_x(..) function has the current
         test value.
-        """
-        witness = self.witness_creator.create_witness(producer=self.get_name(),
-                                                      program_file=program_file,
-                                                      test_vector=test_vector,
-                                                      nondet_methods=nondet_methods,
-                                                      machine_model=self.machine_model,
-                                                      error_lines=self.get_error_lines(program_file))
 
+        The witness is written to its file directly. The returned dict contains the name of that file
+        and the size of the witness.
+        """
         witness_file = test_name + ".witness.graphml"
         witness_file = utils.get_file_path(witness_file)
 
-        return {'name': witness_file, 'content': witness}
+        with open(witness_file, 'w+') as outp:
+            witness_size = self.witness_creator.write_witness(outp,
+                                                              producer=self.get_name(),
+                                                              program_file=program_file,
+                                                              test_vector=test_vector,
+                                                              nondet_methods=nondet_methods,
+                                                              machine_model=self.machine_model,
+                                                              error_lines=self.get_error_lines(program_file))
+
+        return {'name': witness_file, 'size': witness_size}
+
+    def can_create_witness(self, test_vector):
+        # This currently won't work with AFL due to its string-style input
+        return 'afl' not in self.get_name().lower()
 
     def decide_final_verdict(self, final_result):
         if final_result.is_positive() or not self.naive_verification:
@@ -163,49 +242,109 @@ class TestValidator(object):
             return utils.VerdictTrue()
 
     def perform_witness_validation(self, program_file, generator_thread, stop_event):
-        validator = ValidationRunner(self.config.witness_validators)
+        validator = ValidationRunner(self.config.witness_validators,
+                                     jobs=self.config.validation_jobs,
+                                     jobs_per_validator=self.config.validator_jobs,
+                                     memory_budget=self.config.validator_memory)
+        try:
+            return self._validate_while_generating(lambda visited: self._m(program_file, validator, visited),
+                                                   generator_thread, stop_event)
+        finally:
+            validator.close()
+
+    def _validate_while_generating(self, validate, generator_thread, stop_event):
+        """Calls validate on new tests as long as the generator runs, and once more after it finished."""
         visited_tests = set()
-        result = list()
-        while generator_thread and generator_thread.is_alive() and not stop_event.is_set():
-            try:
-                result = self._m(program_file, validator, visited_tests)
-                if result.is_positive():
-                    return result
-                sleep(0.001)  # Sleep for 1 millisecond
-            except utils.InputGenerationError:  # Just capture here and retry as long as the thread is alive
-                pass
-        if not stop_event.is_set():
-            result = self._m(program_file, validator, visited_tests)
-        return self.decide_final_verdict(result)
+        result = utils.VerdictUnknown()
+        self._generation_finished = False
+        self._test_discovery = self.create_test_discovery()
+        if self._test_discovery:
+            self._test_discovery.start()
+        try:
+            while generator_thread and generator_thread.is_alive() and not stop_event.is_set():
+                try:
+                    result = validate(visited_tests)
+                    if result.is_positive():
+                        return result
+                    self._wait_for_new_tests()
+                except utils.InputGenerationError:  # Just capture here and retry as long as the thread is alive
+                    pass
+
+            if not stop_event.is_set():
+                if self._test_discovery:
+                    self._test_discovery.finish()
+                self._generation_finished = True
+                result = validate(visited_tests)
+            return self.decide_final_verdict(result)
+        finally:
+            if self._test_discovery:
+                self._test_discovery.stop()
+                self._test_discovery = None
+
+    def _wait_for_new_tests(self):
+        # Wake up regularly to notice when the generator finished
+        if self._test_discovery:
+            self._test_discovery.wait(timeout=0.1)
+        else:
+            sleep(0.1)
+
+    def create_test_discovery(self):
+        """
+        Returns a test_discovery.TestDiscovery that watches for new tests of this validator,
+        or None if new tests should be polled through get_test_cases.
+        """
+        return None
+
+    def get_test_cases_from(self, test_files, exclude):
+        """
+        Returns the test cases of the given, newly discovered test files.
+        Validators that create a test discovery should overwrite this with a method
+        that only looks at the given files.
+        """
+        return self.get_test_cases(exclude)
+
+    def get_new_test_cases(self, exclude):
+        if self._test_discovery:
+            new_test_files = self._test_discovery.get_new_tests()
+            # After the generator finished, validators get a last chance to return pending tests
+            if not new_test_files and not self._test_discovery.is_finished():
+                return []
+            return self.get_test_cases_from(new_test_files, exclude)
+        else:
+            return self.get_test_cases(exclude)
 
     def _m(self, program_file, validator, visited_tests):
         produced_witnesses = self.create_all_witnesses(program_file, visited_tests)
+        witnesses = dict()
         for witness in produced_witnesses:
             logging.debug('Looking at witness %s', witness['name'])
-            witness_name = witness['name']
-            content_to_write = witness['content']
-            self.counter_size_witnesses.inc(len(content_to_write))
-            with open(witness_name, 'w+') as outp:
-                outp.write(witness['content'])
-            self.timer_witness_validation.start()
-            self.timer_validation.start()
-            try:
-                verdicts = validator.run(program_file, witness_name)
-            finally:
-                self.timer_witness_validation.stop()
-                self.timer_validation.stop()
+            # Validators may run in a different working directory
+            witness_name = os.path.abspath(witness['name'])
+            self.counter_size_witnesses.inc(witness['size'])
+            witnesses[witness_name] = witness
 
+        def witness_validated(witness_name, verdicts):
             self.counter_handled_test_cases.inc()
             logging.info('Results for %s: %s', witness_name, str(verdicts))
-            if any(['false' in v.lower() for v in verdicts]):
-                self.final_test_vector_size.value = len(witness['vector'])
-                return utils.VerdictFalse(witness['origin'], witness['vector'], None, witness_name)
 
+        # The timers measure wall time of the whole batch, since the single runs overlap
+        self.timer_witness_validation.start()
+        self.timer_validation.start()
+        try:
+            violation = validator.find_violation(program_file, list(witnesses.keys()), witness_validated)
+        finally:
+            self.timer_witness_validation.stop()
+            self.timer_validation.stop()
+
+        if violation:
+            witness = witnesses[violation]
+            self.final_test_vector_size.value = len(witness['vector'])
+            return utils.VerdictFalse(witness['origin'], witness['vector'], None, violation)
         return utils.VerdictUnknown()
 
-    def create_all_test_vectors(self, program_file, visited_tests):
-        all_vectors = list()
-        new_test_cases = self.get_test_cases(visited_tests)
+    def queue_new_test_vectors(self, program_file, visited_tests):
+        """Adds the test vectors of all new tests to the validation queue."""
+        new_test_cases = self.get_new_test_cases(visited_tests)
         if len(new_test_cases) > 0:
             logging.info("Looking at %s test files", len(new_test_cases))
         for test_case in new_test_cases:
@@ -214,9 +353,16 @@ class TestValidator(object):
             assert test_name not in visited_tests
             assert os.path.exists(test_case.origin)
             visited_tests.add(test_name)
-            test_vector = self.get_test_vector(test_case)
-            all_vectors.append(test_vector)
-        return all_vectors
+        for test_vector in self.get_test_vectors(new_test_cases):
+            if test_vector is None:
+                self._validation_queue.add(test_vector, 0)
+            elif not self.is_duplicate(test_vector):
+                self._validation_queue.add(test_vector, self.score(program_file, test_vector))
+
+    def create_all_test_vectors(self, program_file, visited_tests):
+        """Returns the test vectors of all new tests, in the order they should be validated."""
+        self.queue_new_test_vectors(program_file, visited_tests)
+        return self._validation_queue.pop_all()
 
     def create_harness(self, program_file, test_name, test_vector, nondet_methods):
         harness = self.harness_creator.create_harness(nondet_methods=nondet_methods,
@@ -238,44 +384,111 @@ class TestValidator(object):
         finally:
             self.timer_vector_gen.stop()
 
-    def perform_execution_validation(self, program_file, generator_thread, stop_event):
-        validator = ExecutionRunnerTwo(self.config.machine_model, self.get_name())
-        visited_tests = set()
-        result = list()
-        while generator_thread and generator_thread.is_alive() and not stop_event.is_set():
-            try:
-                result = self._hs(program_file, validator, visited_tests)
-                if result.is_positive():
-                    return result
-                sleep(0.001)  # Sleep for 1 millisecond
-            except utils.InputGenerationError:  # Just capture here and retry as long as the thread is alive
-                pass
+    def get_test_vectors(self, test_cases):
+        return [self.get_test_vector(t) for t in test_cases]
 
-        if not stop_event.is_set():
-            result = self._hs(program_file, validator, visited_tests)
-        return self.decide_final_verdict(result)
+    def perform_execution_validation(self, program_file, generator_thread, stop_event):
+        validator = ExecutionRunnerTwo(self.config.machine_model, self.get_name(), self.config.use_fork_server,
+                                       self.config.deadline, self.config.use_binary_vectors)
+        if self.config.validation_jobs > 1:
+            self._execution_pool = ThreadPoolExecutor(max_workers=self.config.validation_jobs)
+        try:
+            return self._validate_while_generating(lambda visited: self._hs(program_file, validator, visited),
+                                                   generator_thread, stop_event)
+        finally:
+            if self._execution_pool:
+                self._execution_pool.shutdown()
+                self._execution_pool = None
+            validator.close()
+
+    def _handle_timeout(self, vector, verdicts, retry):
+        if TIMEOUT not in verdicts:
+            return
+        if retry:
+            logging.info("Test vector %s timed out again", vector.name)
+        else:
+            self.counter_killed_vectors.inc()
+            self._killed_vectors.append(vector)
 
     def _hs(self, program_file, validator, visited_tests):
-        test_vectors = self.create_all_test_vectors(program_file, visited_tests)
-
-        for vector in test_vectors:
+        if self._execution_pool:
+            test_vectors = self.create_all_test_vectors(program_file, visited_tests)
+            result = self._hs_parallel(program_file, validator, test_vectors)
+            if result.is_positive() or not self._killed_vectors or not self._generation_finished:
+                return result
+            # All vectors ran and no new ones will come, so the killed ones get more time now
+            test_vectors, self._killed_vectors = self._killed_vectors, list()
+            self.counter_retried_vectors.inc(len(test_vectors))
+            return self._hs_parallel(program_file, validator, test_vectors, retry=True)
+
+        self.queue_new_test_vectors(program_file, visited_tests)
+        while self._validation_queue or self._killed_vectors:
+            # Killed vectors only get more time if no other vector waits for its run
+            retry = not self._validation_queue
+            if retry:
+                vector = self._killed_vectors.pop(0)
+                self.counter_retried_vectors.inc()
+            else:
+                vector = self._validation_queue.pop()
             self.timer_execution_validation.start()
             self.timer_validation.start()
             try:
-                verdicts = validator.run(program_file, vector)
+                verdicts = validator.run(program_file, vector, retry=retry)
             finally:
                 self.timer_execution_validation.stop()
                 self.timer_validation.stop()
             self.counter_handled_test_cases.inc()
 
             logging.debug('Results for %s: %s', vector, str(verdicts))
+            self._handle_timeout(vector, verdicts, retry)
             if any([v == FALSE for v in verdicts]):
                 self.final_test_vector_size.value = len(vector)
                 return utils.VerdictFalse(vector, vector)
+            if self._test_discovery:
+                # Tests that were found in the meantime may be more promising than the queued ones
+                self.queue_new_test_vectors(program_file, visited_tests)
+        return utils.VerdictUnknown()
+
+    def _hs_parallel(self, program_file, validator, test_vectors, retry=False):
+        if not test_vectors:
+            return utils.VerdictUnknown()
+        found_error = Event()
+
+        def run_vector(vector):
+            if found_error.is_set():
+                return None
+            return validator.run(program_file, vector, stop_flag=found_error, retry=retry)
+
+        # The timers measure wall time of the whole batch, since the single runs overlap
+        self.timer_execution_validation.start()
+        self.timer_validation.start()
+        try:
+            futures = {self._execution_pool.submit(run_vector, v): v for v in test_vectors}
+            for future in as_completed(futures):
+                verdicts = future.result()
+                if verdicts is None:
+                    continue
+                self.counter_handled_test_cases.inc()
+                vector = futures[future]
+
+                logging.debug('Results for %s: %s', vector, str(verdicts))
+                self._handle_timeout(vector, verdicts, retry)
+                if any([v == FALSE for v in verdicts]):
+                    # Stop all outstanding work: pending vectors are not started anymore
+                    # and running executions are killed
+                    found_error.set()
+                    for f in futures:
+                        f.cancel()
+                    wait(futures)
+                    self.final_test_vector_size.value = len(vector)
+                    return utils.VerdictFalse(vector, vector)
+        finally:
+            self.timer_execution_validation.stop()
+            self.timer_validation.stop()
         return utils.VerdictUnknown()
 
     def _k(self, program_file, validator, visited_tests):
-        test_cases = self.get_test_cases(visited_tests)
+        test_cases = self.get_new_test_cases(visited_tests)
 
         for test in test_cases:
             self.timer_execution_validation.start()
@@ -294,24 +507,13 @@ class TestValidator(object):
 
     def perform_klee_replay_validation(self, program_file, generator_thread, stop_event):
         validator = KleeReplayRunner(self.config.machine_model)
-
-        visited_tests = set()
-        result = list()
-        while generator_thread and generator_thread.is_alive() and not stop_event.is_set():
-            try:
-                result = self._k(program_file, validator, visited_tests)
-                if result.is_positive():
-                    return result
-                sleep(0.001)  # Sleep for 1 millisecond
-            except utils.InputGenerationError:  # Just capture here and retry as long as the thread is alive
-                pass
-
-        if not stop_event.is_set():
-            result = self._k(program_file, validator, visited_tests)
-        return self.decide_final_verdict(result)
+        return self._validate_while_generating(lambda visited: self._k(program_file, validator, visited),
+                                               generator_thread, stop_event)
 
     def check_inputs(self, program_file, generator_thread, stop_event):
         logging.debug('Checking inputs for file %s', program_file)
+        # Validators that only see the program and a witness use this machine model
+        utils.get_program_info(program_file, self.machine_model)
         result = utils.VerdictUnknown()
 
         if self.config.use_klee_replay:
@@ -330,15 +532,12 @@ class TestValidator(object):
             test_vector = result.test_vector
             if test_vector is None:
                 test_vector = self.get_test_vector(result.test)
-            # This currently won't work with AFL due to its string-style input
-            if result.witness is None and 'afl' not in self.get_name().lower():
-                nondet_methods = utils.get_nondet_methods()
+            if result.witness is None and self.can_create_witness(test_vector):
+                nondet_methods = utils.get_nondet_methods(program_file)
                 witness = self.create_witness(program_file, result.test.origin, test_vector, nondet_methods)
-                with open(witness['name'], 'w+') as outp:
-                    outp.write(witness['content'])
                 result.witness = witness['name']
             if result.harness is None:
-                nondet_methods = utils.get_nondet_methods()
+                nondet_methods = utils.get_nondet_methods(program_file)
                 harness = self.create_harness(program_file, result.test_vector.origin, test_vector, nondet_methods)
                 with open(harness['name'], 'wb+') as outp:
                     outp.write(harness['content'])
@@ -347,12 +546,31 @@ class TestValidator(object):
         return result
 
 
+# Guards the creation of object files of programs under test
+_program_objects_lock = Lock()
+
+
 class ExecutionRunner(object):
+    """
+    Compiles the program under test with a test harness and runs it.
+
+    The program is compiled to an object file once per machine model and C dialect, and each harness
+    is compiled on its own and linked with that object. Nondet methods that the program calls, but the harness
+    doesn't define, get stubs. Harnesses that need declarations of the program, e.g. the types of its
+    nondet methods, are compiled together with the program, instead; if linking failed for every C dialect,
+    this is done right away for the following harnesses.
+    The C dialect that the program compiled with is remembered and tried first next time.
+    """
+
+    c_dialects = ['gnu11', 'gnu90']
+    # The harness only declares what it needs if the program doesn't
+    harness_headers = ['stdio.h', 'stdlib.h', 'string.h']
 
     def __init__(self, machine_model):
         self.machine_model = machine_model
+        self.harness_generator = harness_gen.HarnessCreator()
 
-    def _get_compile_cmd(self, program_file, harness_file, output_file, c_version='gnu11'):
+    def _get_compile_cmd(self, program_file, harness_file, output_file, c_version='gnu11', objects=[]):
         mm_arg = self.machine_model.compile_parameter
         cmd = ['gcc']
         cmd += ['-std={}'.format(c_version),
@@ -360,34 +578,117 @@ class ExecutionRunner(object):
                 '-D__alias__(x)=',
                 '-o', output_file,
                 '-include', program_file,
-                harness_file,
-                '-lm']
+                harness_file]
+        cmd += objects
+        cmd += ['-lm']
 
         return cmd
 
-    def _get_run_cmd(self, executable):
-        return [executable]
-
-    def compile(self, program_file, harness_file):
-        output_file = utils.get_file_path('a.out', temp_dir=True)
-        compile_cmd = self._get_compile_cmd(program_file, harness_file, output_file)
-        compile_result = utils.execute(compile_cmd, quiet=True)
-
-        if compile_result.returncode != 0:
-            compile_cmd = self._get_compile_cmd(program_file, harness_file, output_file, 'gnu90')
-            compile_result = utils.execute(compile_cmd, quiet=True, err_to_output=False)
+    def _get_program_compile_cmd(self, program_file, output_file, c_version):
+        return ['gcc', '-std={}'.format(c_version), self.machine_model.compile_parameter, '-D__alias__(x)=',
+                '-c', '-o', output_file, program_file]
+
+    def _get_link_cmd(self, harness_file, program_object, output_file, c_version, objects=[]):
+        cmd = ['gcc', '-std={}'.format(c_version), self.machine_model.compile_parameter, '-D__alias__(x)=']
+        for header in self.harness_headers:
+            cmd += ['-include', header]
+        cmd += ['-o', output_file, harness_file, program_object]
+        cmd += objects
+        cmd += ['-lm']
+        return cmd
 
-            if compile_result.returncode != 0:
-                raise utils.CompileError("Compilation failed for harness {}".format(harness_file))
-                return None
+    def _get_program_object(self, program_file, c_version):
+        """Returns the object file of the program under test for the given C dialect,
+        or None if the program doesn't compile with it."""
+        program_info = utils.get_program_info(program_file)
+        key = (self.machine_model.name, c_version)
+        with _program_objects_lock:
+            if key not in program_info.objects:
+                program_name = os.path.splitext(utils.get_file_name(program_file))[0]
+                object_name = '{}.{}.{}.o'.format(program_name, self.machine_model.witness_key, c_version)
+                object_file = utils.get_file_path(object_name, temp_dir=True)
+                compile_cmd = self._get_program_compile_cmd(program_file, object_file, c_version)
+                compile_result = artifact_cache.execute_cached(compile_cmd, object_file, [program_file], quiet=True,
+                                                               err_to_output=False)
+                program_info.objects[key] = object_file if compile_result.returncode == 0 else None
+            return program_info.objects[key]
+
+    def _get_nondet_stubs(self, program_file, program_object, c_version):
+        """Returns the object file with stubs for the nondet methods that the given object of the program
+        calls, or None if it calls none."""
+        program_info = utils.get_program_info(program_file)
+        key = (self.machine_model.name, c_version, 'stubs')
+        with _program_objects_lock:
+            if key not in program_info.objects:
+                program_info.objects[key] = self._compile_nondet_stubs(program_object)
+            return program_info.objects[key]
+
+    def _compile_nondet_stubs(self, program_object):
+        nm_result = utils.execute(['nm', '-u', program_object], quiet=True, err_to_output=False)
+        if nm_result.returncode != 0:
+            return None
+        # Each line has the format 'U <symbol>'
+        symbols = [l.split()[-1] for l in nm_result.stdout.splitlines() if l.strip()]
+        nondet_methods = sorted(s for s in symbols if s.startswith('__VERIFIER_nondet_'))
+        if not nondet_methods:
+            return None
+        stubs_file = os.path.splitext(program_object)[0] + '.stubs.c'
+        with open(stubs_file, 'wb') as outp:
+            outp.write(self.harness_generator.create_nondet_stubs(nondet_methods))
+        stubs_object = os.path.splitext(stubs_file)[0] + '.o'
+        compile_cmd = ['gcc', self.machine_model.compile_parameter, '-c', '-o', stubs_object, stubs_file]
+        compile_result = artifact_cache.execute_cached(compile_cmd, stubs_object, [stubs_file], quiet=True,
+                                                       err_to_output=False)
+        return stubs_object if compile_result.returncode == 0 else None
+
+    def _get_c_dialects(self, program_file):
+        # The dialect that worked last is tried first, but it may not work for every machine model
+        c_dialect = utils.get_program_info(program_file).c_dialect
+        return sorted(self.c_dialects, key=lambda d: d != c_dialect)
+
+    def compile(self, program_file, harness_file, objects=[], output_name='a.out'):
+        output_file = utils.get_file_path(output_name, temp_dir=True)
+        program_info = utils.get_program_info(program_file)
+        if program_info.links_with_harness is not False:
+            link_attempted = False
+            for c_version in self._get_c_dialects(program_file):
+                program_object = self._get_program_object(program_file, c_version)
+                if program_object is None:
+                    continue
+                link_attempted = True
+                stubs_object = self._get_nondet_stubs(program_file, program_object, c_version)
+                link_objects = objects + ([stubs_object] if stubs_object else [])
+                compile_cmd = self._get_link_cmd(harness_file, program_object, output_file, c_version, link_objects)
+                input_files = [harness_file, program_object] + link_objects
+                compile_result = artifact_cache.execute_cached(compile_cmd, output_file, input_files, quiet=True,
+                                                               err_to_output=False)
+                if compile_result.returncode == 0:
+                    program_info.links_with_harness = True
+                    program_info.c_dialect = c_version
+                    return output_file
+            if link_attempted:
+                program_info.links_with_harness = False
+
+        for c_version in self._get_c_dialects(program_file):
+            compile_cmd = self._get_compile_cmd(program_file, harness_file, output_file, c_version, objects)
+            input_files = [program_file, harness_file] + objects
+            compile_result = artifact_cache.execute_cached(compile_cmd, output_file, input_files, quiet=True,
+                                                           err_to_output=False)
+            if compile_result.returncode == 0:
+                program_info.c_dialect = c_version
+                return output_file
+
+        raise utils.CompileError("Compilation failed for harness {}".format(harness_file))
 
-        return output_file
+    def _get_run_cmd(self, executable):
+        return [executable]
 
     def run(self, program_file, harness_file):
         executable = self.compile(program_file, harness_file)
         if executable:
             run_cmd = self._get_run_cmd(executable)
-            run_result = utils.execute(run_cmd, quiet=True, err_to_output=False)
+            run_result = utils.execute(run_cmd, quiet=True, err_to_output=False, output=utils.DiscardOutput(),
+                                       err_output=utils.DiscardOutput([utils.error_string]))
 
             if utils.found_err(run_result):
                 return [FALSE]
@@ -397,42 +698,177 @@ class ExecutionRunner(object):
             return [ERROR]
 
 
+class AdaptiveTimeout(object):
+    """
+    Time limit for single runs of test vectors that adapts to the run times of the runs that completed.
+
+    Until min_samples runs completed, initial_limit is used. Afterwards, the limit is factor times
+    the given percentile of the run times, but at least min_limit and at most max_limit.
+    Runs that were killed before max_limit may be retried with max_limit. No limit exceeds the time until the deadline.
+    """
+
+    def __init__(self, initial_limit=5, max_limit=5, factor=4, percentile=0.95, min_limit=0.1, min_samples=10,
+                 deadline=None):
+        self.initial_limit = initial_limit
+        self.max_limit = max_limit
+        self.factor = factor
+        self.percentile = percentile
+        self.min_limit = min_limit
+        self.min_samples = min_samples
+        self.deadline = deadline
+        self._run_times = list()
+        self._lock = Lock()
+
+    def add_run_time(self, run_time):
+        with self._lock:
+            bisect.insort(self._run_times, run_time)
+
+    def _cap(self, limit):
+        if self.deadline is None:
+            return limit
+        # A limit of 0 would mean no limit at all
+        return max(min(limit, self.deadline - monotonic()), 0.01)
+
+    def get_limit(self):
+        with self._lock:
+            if len(self._run_times) < self.min_samples:
+                return self._cap(self.initial_limit)
+            index = min(int(self.percentile * len(self._run_times)), len(self._run_times) - 1)
+            limit = self.factor * self._run_times[index]
+        return self._cap(min(max(limit, self.min_limit), self.max_limit))
+
+    def get_retry_limit(self):
+        return self._cap(self.max_limit)
+
+
 class ExecutionRunnerTwo(ExecutionRunner):
 
-    def __init__(self, machine_model, producer_name):
+    def __init__(self, machine_model, producer_name, fork_server=False, deadline=None, binary_vectors=False):
         super().__init__(machine_model)
         self.harness = None
+        self.binary_harness = None
         self.producer = producer_name
-        self.harness_generator = harness_gen.HarnessCreator()
-
-    def get_executable_harness(self, program_file):
-        if not self.harness:
-            self.harness = self._create_executable_harness(program_file)
-        return self.harness
-
-    def _create_executable_harness(self, program_file):
-        nondet_methods = utils.get_nondet_methods()
-        harness_content = self.harness_generator.create_harness(nondet_methods, utils.error_method)
-        harness_file = 'harness.c'
+        self.use_fork_server = fork_server
+        self.use_binary_vectors = binary_vectors
+        self.timeout = AdaptiveTimeout(deadline=deadline)
+        self._fork_servers = list()
+        # Idle fork servers per executable
+        self._idle_fork_servers = dict()
+        self._harness_lock = Lock()
+
+    def get_executable_harness(self, program_file, binary_vectors=False):
+        """Returns the executable harness that reads test vectors as text, or in the binary format
+        of utils.get_binary_input_vector if binary_vectors is set."""
+        with self._harness_lock:
+            if binary_vectors:
+                if not self.binary_harness:
+                    self.binary_harness = self._create_executable_harness(program_file, binary_vectors=True)
+                return self.binary_harness
+            if not self.harness:
+                self.harness = self._create_executable_harness(program_file)
+            return self.harness
+
+    def _create_executable_harness(self, program_file, binary_vectors=False):
+        nondet_methods = utils.get_nondet_methods(program_file)
+        harness_content = self.harness_generator.create_harness(nondet_methods, utils.error_method,
+                                                                fork_server=self.use_fork_server,
+                                                                binary_vectors=binary_vectors)
+        if binary_vectors:
+            harness_file = utils.get_file_path('binary_harness.c', temp_dir=True)
+            output_name = 'binary_harness'
+        else:
+            harness_file = utils.get_file_path('harness.c', temp_dir=True)
+            output_name = 'a.out'
         with open(harness_file, 'wb+') as outp:
             outp.write(harness_content)
-        return self.compile(program_file, harness_file)
+        if self.use_fork_server:
+            return self.compile(program_file, harness_file, [self._compile_fork_server()], output_name)
+        else:
+            return self.compile(program_file, harness_file, output_name=output_name)
+
+    def _compile_fork_server(self):
+        fork_server_file = utils.get_file_path('fork_server.c', temp_dir=True)
+        with open(fork_server_file, 'wb+') as outp:
+            outp.write(self.harness_generator.create_fork_server())
+        object_file = utils.get_file_path('fork_server.o', temp_dir=True)
+        compile_cmd = ['gcc', '-std=gnu11', self.machine_model.compile_parameter, '-c', '-o', object_file, fork_server_file]
+        compile_result = artifact_cache.execute_cached(compile_cmd, object_file, [fork_server_file], quiet=True)
+        if compile_result.returncode != 0:
+            raise utils.CompileError("Compilation failed for fork server {}".format(fork_server_file))
+        return object_file
 
-    def run(self, program_file, test_vector):
-        executable = self.get_executable_harness(program_file)
-        input_vector = utils.get_input_vector(test_vector)
+    def _acquire_fork_server(self, executable):
+        # Each fork server handles one vector at a time, so concurrent runs use separate servers
+        idle_fork_servers = self._idle_fork_servers.setdefault(executable, queue.Queue())
+        try:
+            return idle_fork_servers.get_nowait()
+        except queue.Empty:
+            fork_server = utils.ForkServer(executable)
+            self._fork_servers.append(fork_server)
+            return fork_server
+
+    def run(self, program_file, test_vector, stop_flag=None, retry=False):
+        """Runs the given test vector and returns the verdicts of the run.
+        If retry is set, the vector was killed after its time limit before and gets a longer one."""
+        input_vector = None
+        if self.use_binary_vectors:
+            input_vector = utils.get_binary_input_vector(test_vector, self.machine_model)
+        if input_vector is not None:
+            executable = self.get_executable_harness(program_file, binary_vectors=True)
+        else:
+            # Vectors that can't be written in the binary format are passed as text
+            executable = self.get_executable_harness(program_file)
+            input_vector = utils.get_input_vector(test_vector)
+        timelimit = self.timeout.get_retry_limit() if retry else self.timeout.get_limit()
+
+        start_time = monotonic()
+        if executable and self.use_fork_server:
+            fork_server = self._acquire_fork_server(executable)
+            try:
+                run_result = fork_server.execute(input_vector, timelimit=timelimit, stop_flag=stop_flag)
+            except utils.ExecutionError as e:
+                logging.warning(e.msg)
+                return [ERROR]
+            finally:
+                self._idle_fork_servers[executable].put(fork_server)
 
-        if executable:
+            if run_result.returncode is None:
+                return [ERROR]
+            elif utils.found_err(run_result):
+                return [FALSE]
+            else:
+                return self._get_unknown_verdicts(run_result, start_time, stop_flag, timelimit, retry)
+        elif executable:
             run_cmd = self._get_run_cmd(executable)
-            run_result = utils.execute(run_cmd, quiet=True, err_to_output=False, input_str=input_vector, timelimit=5)
+            run_result = utils.execute(run_cmd, quiet=True, err_to_output=False, input_str=input_vector,
+                                       timelimit=timelimit, stop_flag=stop_flag, output=utils.DiscardOutput(),
+                                       err_output=utils.DiscardOutput([utils.error_string]))
 
             if utils.found_err(run_result):
                 return [FALSE]
             else:
-                return [UNKNOWN]
+                return self._get_unknown_verdicts(run_result, start_time, stop_flag, timelimit, retry)
         else:
             return [ERROR]
 
+    def _get_unknown_verdicts(self, run_result, start_time, stop_flag, timelimit, retry):
+        if run_result.timed_out:
+            # A retry would not get more time than this run had
+            if retry or timelimit < self.timeout.get_retry_limit():
+                return [UNKNOWN, TIMEOUT]
+            logging.info("Test vector timed out after %ss", timelimit)
+            return [UNKNOWN]
+        # Runs that were stopped from outside didn't show how long they take
+        if not stop_flag or not stop_flag.is_set():
+            self.timeout.add_run_time(monotonic() - start_time)
+        return [UNKNOWN]
+
+    def close(self):
+        for fork_server in self._fork_servers:
+            fork_server.stop()
+        self._fork_servers = list()
+        self._idle_fork_servers = dict()
+
 
 class KleeReplayRunner(object):
 
@@ -476,7 +912,8 @@ class KleeReplayRunner(object):
         curr_env = utils.get_env()
         curr_env['KTEST_FILE'] = test_case.origin
 
-        result = utils.execute([self.executable], env=curr_env, err_to_output=False)
+        result = utils.execute([self.executable], env=curr_env, err_to_output=False, output=utils.DiscardOutput(),
+                               err_output=utils.DiscardOutput([utils.error_string]))
 
         if utils.found_err(result):
             return [FALSE]
@@ -485,19 +922,32 @@ class KleeReplayRunner(object):
 
 
 class ValidationRunner(object):
-
-    def __init__(self, validators):
+    """
+    Runs witness validators on witnesses.
+
+    Multiple validations may run concurrently, across witnesses and validators:
+    at most jobs validations in total, at most jobs_per_validator validations of the same validator,
+    and only as many validations as fit into memory_budget (in MB), according to the memory usage
+    estimated for each validator. A validation is always started if no other one is running.
+    """
+
+    def __init__(self, validators, jobs=1, jobs_per_validator=None, memory_budget=None):
+        self.jobs = jobs
+        self.jobs_per_validator = jobs_per_validator
+        self.memory_budget = memory_budget
         self.validators = list()
         validators_used = set()
+        # All CPAchecker-based validators share the state of their Java VM setup
+        self.cpachecker_jvm = CPAcheckerJvm()
         for val in [v.lower() for v in validators]:
             if val == 'cpachecker' and 'cpachecker' not in validators_used:
-                self.validators.append(CPAcheckerValidator())
+                self.validators.append(CPAcheckerValidator(self.cpachecker_jvm))
                 validators_used.add('cpachecker')
             elif val == 'uautomizer' and 'uautomizer' not in validators_used:
                 self.validators.append(UAutomizerValidator())
                 validators_used.add('uautomizer')
             elif val == 'cpa-w2t' and 'cpa-w2t' not in validators_used:
-                self.validators.append(CpaW2t())
+                self.validators.append(CpaW2t(self.cpachecker_jvm))
                 validators_used.add('cpa-w2t')
             elif val == 'fshell-w2t' and 'fshell-w2t' not in validators_used:
                 self.validators.append(FShellW2t())
@@ -505,6 +955,10 @@ class ValidationRunner(object):
             else:
                 raise utils.ConfigError('Invalid validator list: ' + validators)
 
+    def close(self):
+        """Stops the Java VMs that were kept for further validations."""
+        self.cpachecker_jvm.close()
+
     def run(self, program_file, witness_file):
         results = []
         for validator in self.validators:
@@ -514,18 +968,97 @@ class ValidationRunner(object):
 
         return results
 
+    def _can_start(self, validator, running, used_memory):
+        total_running = sum(running.values())
+        if total_running >= self.jobs:
+            return False
+        if self.jobs_per_validator and running[validator] >= self.jobs_per_validator:
+            return False
+        return not self.memory_budget or total_running == 0 \
+            or used_memory + validator.memory_usage <= self.memory_budget
+
+    def find_violation(self, program_file, witness_files, on_validated=None):
+        """
+        Validates the given witnesses with all validators and returns the first witness file
+        that a validator confirmed as violation, or None if there is none.
+        As soon as a violation is confirmed, no further validations are started and running ones are killed.
+
+        on_validated is called with a witness file and its verdicts whenever the validation
+        of a witness is complete.
+        """
+        pending = [(w, v) for w in witness_files for v in self.validators]
+        if not pending:
+            return None
+        verdicts = {w: list() for w in witness_files}
+        running = {v: 0 for v in self.validators}
+        used_memory = 0
+        finished = list()
+        violation = None
+        found_violation = Event()
+        state_changed = Condition()
+
+        def validate(witness_file, validator):
+            result = None
+            error = None
+            try:
+                logging.debug("Running %s on %s", validator, witness_file)
+                result = validator.validate(program_file, witness_file, stop_flag=found_violation)
+            except Exception as e:
+                error = e
+            with state_changed:
+                finished.append((witness_file, validator, result, error))
+                state_changed.notify_all()
+
+        with ThreadPoolExecutor(max_workers=self.jobs) as pool, state_changed:
+            try:
+                while True:
+                    while finished:
+                        witness_file, validator, result, error = finished.pop(0)
+                        running[validator] -= 1
+                        used_memory -= validator.memory_usage
+                        if error:
+                            raise error
+                        if found_violation.is_set():
+                            continue  # Run was killed
+                        verdicts[witness_file].append(result)
+                        if 'false' in result.lower():
+                            violation = witness_file
+                            found_violation.set()
+                            pending.clear()
+                        if (violation == witness_file or len(verdicts[witness_file]) == len(self.validators)) \
+                                and on_validated:
+                            on_validated(witness_file, verdicts[witness_file])
+
+                    if not pending and not any(running.values()):
+                        break
+                    startable = [j for j in pending if self._can_start(j[1], running, used_memory)]
+                    if startable:
+                        witness_file, validator = startable[0]
+                        pending.remove(startable[0])
+                        running[validator] += 1
+                        used_memory += validator.memory_usage
+                        pool.submit(validate, witness_file, validator)
+                    else:
+                        state_changed.wait()
+            finally:
+                # Make sure that no validation keeps running if we return early
+                found_violation.set()
+
+        return violation
+
 
 class Validator(object):
 
     __metaclass__ = ABCMeta
 
+    # Estimated maximum memory usage of a single validation, in MB
+    memory_usage = 1000
+
     def __init__(self, tool_name):
         self.tool = utils.import_tool(tool_name)
 
-    def validate(self, program_file, witness_file):
-        # err_to_output=True is important so that messages to stderr are in correct relation to messages to stdout!
-        # This may be important for determining the run result.
-        cmd_result = utils.execute(self._get_cmd(program_file, witness_file), quiet=True, err_to_output=True)
+    def validate(self, program_file, witness_file, stop_flag=None):
+        cmd_result = self._execute(self._get_cmd(program_file, witness_file), stop_flag)
 
         returncode = cmd_result.returncode
         # Execute returns a negative returncode -N if the process was killed by signal N
@@ -545,40 +1078,366 @@ class Validator(object):
         validation_result = self.tool.determine_result(returncode, returnsignal, tool_output, isTimeout=False)
         return validation_result
 
+    def _execute(self, cmd, stop_flag=None):
+        # err_to_output=True is important so that messages to stderr are in correct relation to messages to stdout!
+        # This may be important for determining the run result.
+        return execute_validator(cmd, stop_flag)
+
+    def _get_machine_model(self, program_file, witness_file):
+        machine_model = utils.get_program_info(program_file).machine_model
+        if not machine_model:
+            machine_model = utils.get_machine_model(witness_file)
+        return machine_model
+
     @abstractmethod
     def _get_cmd(self, program_file, witness_file):
         pass
 
 
-class CPAcheckerValidator(Validator):
+# Source of the Java class that keeps CPAchecker resident, see CPAcheckerService
+cpachecker_service_source = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir,
+                                         'validators', 'cpachecker-service', 'CPAcheckerService.java')
+
+
+class CPAcheckerService(object):
+    """
+    Resident Java VM that runs CPAchecker on one witness after another.
+
+    The VM runs the class compiled from cpachecker_service_source with the classpath of cpa.sh.
+    Each run writes its output to a file of its own, which is read like the output of cpa.sh.
+    The VM exits after a run that ran out of memory, after max_requests runs, and if its heap
+    stays more than max_heap_fraction full after a run. If the VM crashed or exited,
+    the next run starts a new one.
+    """
+
+    max_requests = 50
+    max_heap_fraction = 0.5
+    # Time in seconds that the Java VM may take to load CPAchecker
+    start_timelimit = 60
+
+    def __init__(self, java, class_dir, cpachecker_dir, vm_options):
+        self.java = java
+        self.class_dir = class_dir
+        self.cpachecker_dir = cpachecker_dir
+        self.vm_options = list(vm_options)
+        self._process = None
+
+    def is_running(self):
+        return self._process is not None and self._process.poll() is None
+
+    def _get_classpath(self):
+        classpath = [self.class_dir]
+        for entry in ['bin', 'cpachecker.jar', os.path.join('lib', '*'), os.path.join('lib', 'java', 'runtime', '*')]:
+            classpath.append(os.path.join(self.cpachecker_dir, entry))
+        return os.pathsep.join(classpath)
+
+    def start(self):
+        cmd = [self.java] + self.vm_options + ['-cp', self._get_classpath(), 'CPAcheckerService',
+                                               str(self.max_requests), str(self.max_heap_fraction)]
+        log_file = utils.get_file_path('cpachecker-service.log', temp_dir=True)
+        logging.info("Starting CPAchecker service: %s", " ".join(cmd))
+        try:
+            with open(log_file, 'ab') as log:
+                self._process = subprocess.Popen(cmd,
+                                                 stdin=subprocess.PIPE,
+                                                 stdout=subprocess.PIPE,
+                                                 stderr=log
+                                                 )
+        except OSError as e:
+            raise utils.ExecutionError("CPAchecker service did not start: " + str(e))
+        ready, _, _ = select.select([self._process.stdout], [], [], self.start_timelimit)
+        if not ready or self._process.stdout.readline().strip() != b'ready':
+            self.stop()
+            raise utils.ExecutionError("CPAchecker service did not start, see " + log_file)
+
+    def stop(self):
+        """Stops the Java VM and returns its exit code."""
+        if self._process is None:
+            return None
+        # The service exits as soon as its input is closed
+        try:
+            self._process.stdin.close()
+        except OSError:
+            pass
+        try:
+            returncode = self._process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            returncode = utils.shut_down(self._process)
+        self._process.stdout.close()
+        self._process = None
+        return returncode
+
+    def execute(self, arguments, stop_flag=None):
+        """Runs CPAchecker with the given arguments and returns the ExecutionResult of this run,
+        as if cpa.sh had been run."""
+        if not self.is_running():
+            self.start()
+
+        fd, output_file = tempfile.mkstemp(prefix='cpachecker-', suffix='.log', dir=utils.get_context().tmp)
+        os.close(fd)
+        try:
+            request = '\t'.join([output_file] + list(arguments)) + '\n'
+            logging.info("CPAchecker service: %s", " ".join(arguments))
+
+            process = self._process
+
+            def kill():
+                process.kill()
+
+            if stop_flag:
+                utils.stop_flag_watcher.register(stop_flag, kill)
+            try:
+                process.stdin.write(request.encode())
+                process.stdin.flush()
+                reply = process.stdout.readline().split()
+            except BrokenPipeError:
+                reply = []
+            finally:
+                if stop_flag:
+                    utils.stop_flag_watcher.unregister(stop_flag, kill)
+
+            if len(reply) == 2 and reply[0] in (b'done', b'restart'):
+                returncode = int(reply[1])
+                if reply[0] == b'restart':
+                    self.stop()
+            else:
+                # The Java VM ended during the run, like a cpa.sh process would have
+                returncode = self.stop()
+
+            output = utils.HeadTailOutput(validator_output_size)
+            with open(output_file, 'rb') as inp:
+                for data in iter(lambda: inp.read(64 * 1024), b''):
+                    output.write(data)
+            stdout = output.get_output().decode(errors='replace')
+        finally:
+            os.remove(output_file)
+        logging.debug(stdout)
+        return utils.ExecutionResult(returncode, stdout, None)
+
+
+class CPAcheckerJvm(object):
+    """
+    Runs CPAchecker so that consecutive runs profit from the runs before.
+
+    Runs of cpa.sh can be handed to resident Java VMs (see CPAcheckerService), so that the VM is started
+    and CPAchecker is loaded and compiled by the JIT only once. Each resident VM handles one run at a time,
+    so concurrent runs use separate VMs. If the service can't be compiled or started, it isn't used anymore.
+
+    All other runs need a Java VM of their own. To reduce the startup cost of these VMs, the first run dumps
+    the classes it loaded into a class-data sharing archive, and all later runs map this archive
+    instead of loading and verifying the classes again.
+    If the Java VM does not support dynamic archives, or if a run crashes while using the archive,
+    the archive is dropped and the run is repeated without it.
+    """
+
+    vm_start_errors = ['Unrecognized VM option', 'Could not create the Java Virtual Machine']
 
     def __init__(self):
+        self.archive = utils.get_file_path('cpachecker.jsa', temp_dir=True)
+        self.use_archive = True
+        self._dumping_archive = False
+        self.use_service = True
+        self._service_classes = None
+        self._services = list()
+        # Idle services per list of Java VM options
+        self._idle_services = dict()
+        self._lock = Lock()
+
+    def prepare(self, executable):
+        """Copies the configuration of CPAchecker to the working directory, if not done, yet."""
+        import shutil
+        with self._lock:
+            config_copy_dir = utils.get_file_path('config', temp_dir=True)
+            if not os.path.exists(config_copy_dir):
+                cpa_directory = os.path.join(os.path.dirname(executable), '..')
+                copy_dir = os.path.join(cpa_directory, 'config')
+                shutil.copytree(copy_dir, config_copy_dir)
+
+    def _get_vm_argument(self):
+        with self._lock:
+            if not self.use_archive:
+                return None
+            if os.path.exists(self.archive):
+                return '-XX:SharedArchiveFile=' + self.archive
+            if self._dumping_archive:
+                return None  # Another run creates the archive right now
+            self._dumping_archive = True
+            return '-XX:ArchiveClassesAtExit=' + self.archive
+
+    def _drop_archive(self, reason):
+        logging.info("Not using class-data sharing for CPAchecker anymore: %s", reason)
+        with self._lock:
+            self.use_archive = False
+            if os.path.exists(self.archive):
+                os.remove(self.archive)
+
+    @staticmethod
+    def _get_java():
+        return os.environ.get('JAVA', 'java')
+
+    @staticmethod
+    def _get_service_arguments(cmd):
+        """
+        Splits the given command of cpa.sh into the options of the Java VM, as cpa.sh would set them,
+        and the arguments of CPAchecker. Returns None if the command can't be run by the service.
+        """
+        heap_size = '1200M'
+        stack_size = '1024k'
+        assertions = '-ea'
+        vm_options = os.environ.get('JAVA_VM_ARGUMENTS', '').split()
+        for variable in ['TMPDIR', 'TEMP', 'TMP']:
+            if os.environ.get(variable):
+                vm_options.append('-Djava.io.tmpdir=' + os.environ[variable])
+                break
+        arguments = list()
+        cmd_arguments = iter(cmd[1:] + os.environ.get('CPACHECKER_ARGUMENTS', '').split())
+        for arg in cmd_arguments:
+            if arg == '-heap':
+                heap_size = next(cmd_arguments)
+            elif arg == '-stack':
+                stack_size = next(cmd_arguments)
+            elif arg == '-disable-java-assertions':
+                assertions = '-da'
+            elif arg in ('-debug', '-generateReport'):
+                return None
+            elif '\t' in arg or '\n' in arg:
+                return None  # Requests to the service are tab-separated lines
+            else:
+                arguments.append(arg)
+        vm_options = ['-Xss' + stack_size, '-XX:+PerfDisableSharedMem'] + vm_options \
+            + ['-Xmx' + heap_size, assertions]
+        return vm_options, arguments
+
+    def _compile_service(self):
+        """Compiles the service to the working directory and returns the directory of its class,
+        or None if that is not possible."""
+        import shutil
+        java = shutil.which(self._get_java())
+        javac = shutil.which(os.path.join(os.path.dirname(java), 'javac')) if java else None
+        if not javac:
+            javac = shutil.which('javac')
+        if not javac:
+            logging.info("Not running CPAchecker as service: no Java compiler found")
+            return None
+        class_dir = utils.get_file_path('cpachecker-service', temp_dir=True)
+        os.makedirs(class_dir, exist_ok=True)
+        compile_result = utils.execute([javac, '-nowarn', '-d', class_dir, cpachecker_service_source], quiet=True)
+        if compile_result.returncode != 0:
+            logging.info("Not running CPAchecker as service: compilation of %s failed", cpachecker_service_source)
+            return None
+        return class_dir
+
+    def _acquire_service(self, executable, vm_options):
+        with self._lock:
+            if not self.use_service:
+                return None
+            if self._service_classes is None:
+                self._service_classes = self._compile_service()
+                if self._service_classes is None:
+                    self.use_service = False
+                    return None
+            idle_services = self._idle_services.setdefault(tuple(vm_options), queue.Queue())
+            try:
+                return idle_services.get_nowait()
+            except queue.Empty:
+                cpachecker_dir = os.path.join(os.path.dirname(os.path.realpath(executable)), os.pardir)
+                service = CPAcheckerService(self._get_java(), self._service_classes, cpachecker_dir, vm_options)
+                self._services.append(service)
+                return service
+
+    def _drop_services(self, reason):
+        logging.info("Not running CPAchecker as service anymore: %s", reason)
+        with self._lock:
+            self.use_service = False
+            services = self._services
+            self._services = list()
+            self._idle_services = dict()
+        for service in services:
+            service.stop()
+
+    def execute(self, cmd, stop_flag=None, resident=False):
+        """Runs the given command of CPAchecker. If resident is set, the command is a call of cpa.sh,
+        which may be run by a CPAcheckerService."""
+        service_arguments = self._get_service_arguments(cmd) if resident else None
+        if service_arguments:
+            vm_options, arguments = service_arguments
+            service = self._acquire_service(cmd[0], vm_options)
+            if service:
+                try:
+                    return service.execute(arguments, stop_flag)
+                except utils.ExecutionError as e:
+                    self._drop_services(e.msg)
+                finally:
+                    with self._lock:
+                        if self.use_service:
+                            self._idle_services[tuple(vm_options)].put(service)
+        return self._execute_process(cmd, stop_flag)
+
+    def _execute_process(self, cmd, stop_flag=None):
+        vm_argument = self._get_vm_argument()
+        if not vm_argument:
+            return execute_validator(cmd, stop_flag)
+
+        env = os.environ.copy()
+        env['JAVA_VM_ARGUMENTS'] = ' '.join([env.get('JAVA_VM_ARGUMENTS', ''), vm_argument]).strip()
+        try:
+            cmd_result = execute_validator(cmd, stop_flag, patterns=self.vm_start_errors, env=env)
+        finally:
+            if vm_argument.startswith('-XX:ArchiveClassesAtExit'):
+                with self._lock:
+                    self._dumping_archive = False
+
+        if stop_flag and stop_flag.is_set():
+            return cmd_result
+        if cmd_result.matches:
+            self._drop_archive("Java VM does not support option " + vm_argument)
+            return execute_validator(cmd, stop_flag)
+        elif cmd_result.returncode is not None and cmd_result.returncode < 0 \
+                and vm_argument.startswith('-XX:SharedArchiveFile'):
+            self._drop_archive("CPAchecker was killed by signal " + str(-cmd_result.returncode))
+            return execute_validator(cmd, stop_flag)
+        return cmd_result
+
+    def close(self):
+        with self._lock:
+            services = self._services
+            self._services = list()
+            self._idle_services = dict()
+        for service in services:
+            service.stop()
+
+
+class CPAcheckerValidator(Validator):
+
+    memory_usage = utils.cpachecker_heap_size
+
+    def __init__(self, jvm=None):
         super().__init__('cpachecker')
         self.executable = None  # executable will compile CPAchecker when called, so only do this if we really validate
-        self.cpa_directory = None
+        self.jvm = jvm if jvm else CPAcheckerJvm()
+
+    def _execute(self, cmd, stop_flag=None):
+        return self.jvm.execute(cmd, stop_flag, resident=True)
 
     def _get_cmd(self, program_file, witness_file):
         if not self.executable:
-            import shutil
             self.executable = self.tool.executable()
-            self.cpa_directory = os.path.join(os.path.dirname(self.executable), '..')
-            config_copy_dir = utils.get_file_path('config', temp_dir=True)
-            if not os.path.exists(config_copy_dir):
-                copy_dir = os.path.join(self.cpa_directory, 'config')
-                shutil.copytree(copy_dir, config_copy_dir)
+            self.jvm.prepare(self.executable)
         return [self.executable] + \
-               utils.get_cpachecker_options(witness_file) +\
+               utils.get_cpachecker_options(witness_file, self._get_machine_model(program_file, witness_file)) +\
                ['-witnessValidation', program_file]
 
 
 class UAutomizerValidator(Validator):
 
+    memory_usage = 12000  # Ultimate starts its Java VM with -Xmx12G
+
     def __init__(self):
         super().__init__('ultimateautomizer')
         self.executable = self.tool.executable()
 
     def _get_cmd(self, program_file, witness_file):
-        machine_model = utils.get_machine_model(witness_file)
+        machine_model = self._get_machine_model(program_file, witness_file)
         if machine_model.is_32:
             machine_model = '32bit'
         elif machine_model.is_64:
@@ -596,15 +1455,21 @@ class UAutomizerValidator(Validator):
 
 class CpaW2t(Validator):
 
-    def __init__(self):
+    memory_usage = utils.cpachecker_heap_size
+
+    def __init__(self, jvm=None):
         super().__init__('cpa-witness2test')
         self.executable = None  # executable will compile CPAchecker when called, so only do this if we really validate
+        self.jvm = jvm if jvm else CPAcheckerJvm()
+
+    def _execute(self, cmd, stop_flag=None):
+        return self.jvm.execute(cmd, stop_flag)
 
     def _get_cmd(self, program_file, witness_file):
         if not self.executable:
             self.executable = self.tool.executable()
         return [self.executable] + \
-               utils.get_cpachecker_options(witness_file) +\
+               utils.get_cpachecker_options(witness_file, self._get_machine_model(program_file, witness_file)) +\
                ['-witness2test', program_file]
 
 
@@ -616,7 +1481,7 @@ class FShellW2t(Validator):
         self.repo = os.path.dirname(os.path.abspath(self.executable))
 
     def _get_cmd(self, program_file, witness_file):
-        machine_model = utils.get_machine_model(witness_file)
+        machine_model = self._get_machine_model(program_file, witness_file)
         machine_model = machine_model.compile_parameter
 
         return [self.executable,
@@ -625,12 +1490,8 @@ class FShellW2t(Validator):
                 machine_model,
                 program_file]
 
-    def validate(self, program_file, witness_file):
-        """Overwrites Validator.validate(...)."""
-        # FShell-w2t only works if it is run from its repository. Because of this,
-        # we always have to change directories, first.
-        old_dir = os.path.abspath('.')
-        os.chdir(self.repo)
-        result = super().validate(program_file, witness_file)
-        os.chdir(old_dir)  # And we change directories back to the original one
-        return result
\ No newline at end of file
+    def _execute(self, cmd, stop_flag=None):
+        """Overwrites Validator._execute(...)."""
+        # FShell-w2t only works if it is run from its repository.
+        # The working directory of the whole process must not change, since validations run concurrently.
+        return execute_validator(cmd, stop_flag, cwd=self.repo)
\ No newline at end of file
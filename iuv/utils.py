@@ -6,10 +6,12 @@ import hashlib
 import tempfile
 import pycparser
 import re
-from struct import unpack
+import select
+import selectors
+from struct import unpack, pack, calcsize
 import codecs
 
-from threading import Thread
+from threading import Thread, Lock
 from math import floor
 import signal
 
@@ -685,6 +687,43 @@ class TestCase(object):
         return self.name + "(" + self.origin + ")"
 
 
+class IncrementalFileReader(object):
+    """Reads the complete lines that were appended to a file since the last read."""
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self._offset = 0
+        self._incomplete_line = b''
+
+    def reset(self):
+        self._offset = 0
+        self._incomplete_line = b''
+
+    def read_new_lines(self, final=False):
+        """
+        Returns the lines that were completed since the last call, without line endings.
+        A trailing line without line ending is kept back until it is completed, so that
+        lines that are currently written are not read in parts. If final is set,
+        it is returned, too.
+        If the file was truncated since the last read, this raises a ValueError.
+        """
+        if not os.path.exists(self.file_name):
+            return []
+        with open(self.file_name, 'rb') as inp:
+            inp.seek(0, os.SEEK_END)
+            if inp.tell() < self._offset:
+                raise ValueError("File {} was truncated".format(self.file_name))
+            inp.seek(self._offset)
+            data = inp.read()
+        self._offset += len(data)
+        lines = (self._incomplete_line + data).split(b'\n')
+        self._incomplete_line = lines.pop()
+        if final and self._incomplete_line:
+            lines.append(self._incomplete_line)
+            self._incomplete_line = b''
+        return [l.decode() for l in lines]
+
+
 class ConfigError(Exception):
 
     def __init__(self, msg=None, cause=None):
@@ -713,13 +752,22 @@ class CompileError(Exception):
         self.cause = cause
 
 
+class ExecutionError(Exception):
+
+    def __init__(self, msg=None, cause=None):
+        self.msg = msg
+        self.cause = cause
+
+
 class ExecutionResult(object):
     """Results of a subprocess execution."""
 
-    def __init__(self, returncode, stdout, stderr):
+    def __init__(self, returncode, stdout, stderr, matches=(), timed_out=False):
         self._returncode = returncode
         self._stdout = stdout
         self._stderr = stderr
+        self._matches = set(matches)
+        self._timed_out = timed_out
 
     @property
     def returncode(self):
@@ -733,6 +781,16 @@ class ExecutionResult(object):
     def stderr(self):
         return self._stderr
 
+    @property
+    def matches(self):
+        """The patterns that were looked for and found in the output."""
+        return self._matches
+
+    @property
+    def timed_out(self):
+        """Whether the process was killed because it exceeded its time limit."""
+        return self._timed_out
+
 
 class Verdict(object):
     """Results of a test validation, either witness validation or test execution validation currently."""
@@ -766,11 +824,28 @@ class VerdictUnknown(Verdict):
         super().__init__(UNKNOWN)
 
 
+class CompileCommand(list):
+    """Command that creates output_file from the given input files.
+    The output of such a command can be reused from the artifact cache."""
+
+    def __init__(self, cmd, output_file, input_files):
+        super().__init__(cmd)
+        self.output_file = output_file
+        self.input_files = input_files
+
+
+class ParallelCommands(list):
+    """Commands that run at the same time. The next command starts after all of them finished."""
+    pass
+
+
 class TestVector(object):
 
-    def __init__(self, name, origin_file):
+    def __init__(self, name, origin_file, content=None):
         self.name = name
         self.origin = origin_file
+        # Only set if the origin file holds several tests: the content of this test alone
+        self.content = content
         self.vector = list()
 
     def add(self, value, method=None):
@@ -782,6 +857,20 @@ class TestVector(object):
     def __str__(self):
         return self.origin + " (" + str(self.vector) + " )"
 
+    def get_key(self):
+        """Returns a hash of the values and method names of this vector.
+        Vectors with the same key lead to the same execution of the program."""
+        key = hashlib.sha1()
+        for instantiation in self.vector:
+            value = instantiation['value']
+            if type(value) is not bytes:
+                value = str(value).encode()
+            method = instantiation['name'] if instantiation['name'] else ''
+            for field in (method.encode(), value):
+                # The length prefix keeps the boundaries of fields that contain any bytes
+                key.update(len(field).to_bytes(8, 'little') + field)
+        return key.digest()
+
 
 def shut_down(process):
     process.send_signal(signal.SIGKILL)
@@ -790,47 +879,494 @@ def shut_down(process):
     return returncode
 
 
-def execute(command, quiet=False, env=None, err_to_output=True, stop_flag=None, input_str=None, timelimit=None):
+class StopFlagWatcher(object):
+    """
+    Runs kill functions as soon as the stop flag they were registered for is set.
+
+    For each stop flag, one thread blocks on the flag while kill functions are registered for it.
+    The thread ends after the flag was set or after its last kill function was unregistered.
+    """
+
+    def __init__(self, idle_timeout=1):
+        self.idle_timeout = idle_timeout
+        self._lock = Lock()
+        self._kill_functions = dict()
+
+    def register(self, stop_flag, kill):
+        with self._lock:
+            kill_functions = self._kill_functions.get(stop_flag)
+            if kill_functions is None:
+                kill_functions = self._kill_functions[stop_flag] = set()
+                Thread(target=self._watch, args=(stop_flag,), name="stop flag watcher", daemon=True).start()
+            kill_functions.add(kill)
+
+    def unregister(self, stop_flag, kill):
+        with self._lock:
+            kill_functions = self._kill_functions.get(stop_flag)
+            if kill_functions is not None:
+                kill_functions.discard(kill)
+
+    def _watch(self, stop_flag):
+        while True:
+            # The timeout only serves to end the thread when nothing is registered anymore,
+            # setting the flag wakes the thread up immediately
+            stopped = stop_flag.wait(self.idle_timeout)
+            with self._lock:
+                kill_functions = self._kill_functions[stop_flag]
+                if stopped:
+                    for kill in kill_functions:
+                        kill()
+                if stopped or not kill_functions:
+                    del self._kill_functions[stop_flag]
+                    return
+
+
+stop_flag_watcher = StopFlagWatcher()
+
+
+def _kill(process):
+    try:
+        process.send_signal(signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+class OutputCapture(object):
+    """
+    Receives the output of an executed process while the process is running.
+    Subclasses decide which part of the output is kept.
+
+    Independent of that, the capture looks for the given patterns in the complete output,
+    so that a pattern is also found if the part of the output that contains it is not kept.
+    Each found pattern is added to matches.
+    """
+
+    def __init__(self, patterns=()):
+        self.patterns = list(patterns)
+        self.matches = set()
+        self._encoded_patterns = [(p, p.encode() if type(p) is str else p) for p in self.patterns]
+        # A pattern may be split across two chunks of output
+        self._overlap = max([len(e) for _, e in self._encoded_patterns], default=1) - 1
+        self._previous_end = b''
+
+    def write(self, data):
+        if len(self.matches) < len(self.patterns):
+            window = self._previous_end + data
+            for pattern, encoded_pattern in self._encoded_patterns:
+                if encoded_pattern in window:
+                    self.matches.add(pattern)
+            self._previous_end = window[-self._overlap:] if self._overlap else b''
+        self._keep(data)
+
+    def _keep(self, data):
+        pass
+
+    def get_output(self):
+        """Returns the kept output as bytes."""
+        return b''
+
+    def close(self):
+        pass
+
+
+class DiscardOutput(OutputCapture):
+    """Keeps none of the output."""
+    pass
+
+
+class FullOutput(OutputCapture):
+    """Keeps the complete output in a temporary file."""
+
+    def __init__(self, patterns=()):
+        super().__init__(patterns)
+        self._file = tempfile.TemporaryFile()
+
+    def _keep(self, data):
+        self._file.write(data)
+
+    def get_output(self):
+        self._file.seek(0)
+        return self._file.read()
+
+    def close(self):
+        self._file.close()
+
+
+class HeadTailOutput(OutputCapture):
+    """Keeps the first and the last size bytes of the output.
+    If output between them is dropped, this is marked in the output."""
+
+    def __init__(self, size, patterns=()):
+        super().__init__(patterns)
+        self.size = size
+        self._head = bytearray()
+        self._tail = bytearray()
+        self._dropped = False
+
+    def _keep(self, data):
+        if len(self._head) < self.size:
+            head_part = data[:self.size - len(self._head)]
+            self._head += head_part
+            data = data[len(head_part):]
+        self._tail += data
+        if len(self._tail) > self.size:
+            del self._tail[:len(self._tail) - self.size]
+            self._dropped = True
+
+    def get_output(self):
+        if self._dropped:
+            return bytes(self._head) + b'\n[...]\n' + bytes(self._tail)
+        return bytes(self._head + self._tail)
+
+
+class RotatingFileOutput(OutputCapture):
+    """
+    Writes the output to the given file. If the file grows larger than max_size bytes,
+    it is renamed to file_name.1 (and that one to file_name.2, up to backup_count files) and a new file is started.
+    Nothing is kept in memory, so get_output returns no output.
+    """
+
+    def __init__(self, file_name, max_size, backup_count=1, patterns=()):
+        super().__init__(patterns)
+        self.file_name = file_name
+        self.max_size = max_size
+        self.backup_count = backup_count
+        self._file = open(file_name, 'wb')
+
+    def _rotate(self):
+        self._file.close()
+        for number in range(self.backup_count - 1, 0, -1):
+            backup = '{}.{}'.format(self.file_name, number)
+            if os.path.exists(backup):
+                os.replace(backup, '{}.{}'.format(self.file_name, number + 1))
+        if self.backup_count > 0:
+            os.replace(self.file_name, self.file_name + '.1')
+        self._file = open(self.file_name, 'wb')
+
+    def _keep(self, data):
+        if self._file.tell() + len(data) > self.max_size and self._file.tell() > 0:
+            self._rotate()
+        self._file.write(data)
+
+    def close(self):
+        self._file.close()
+
+
+output_capture_modes = ['full', 'discard', 'file', 'headtail']
+# Mode and size (in KB) of the capture of the output of input generators
+output_capture_mode = 'full'
+output_capture_size = 1024
+
+
+def create_output_capture(file_name, patterns=()):
+    """Returns a new capture for the output of a long-running tool, according to the configured output capture mode.
+    In mode 'file', the output is written to the given file."""
+    size = output_capture_size * 1024
+    if output_capture_mode == 'full':
+        return FullOutput(patterns)
+    elif output_capture_mode == 'discard':
+        return DiscardOutput(patterns)
+    elif output_capture_mode == 'file':
+        return RotatingFileOutput(file_name, size, patterns=patterns)
+    elif output_capture_mode == 'headtail':
+        return HeadTailOutput(size, patterns)
+    else:
+        raise AssertionError("Unhandled output capture mode: " + output_capture_mode)
+
+
+def _open_pidfd(process):
+    try:
+        return os.pidfd_open(process.pid)
+    except (AttributeError, OSError):
+        return None
+
+
+class _OutputReader(object):
+    """Passes the data of output streams of a process to their captures as soon as it is available."""
+
+    def __init__(self, captures):
+        self._selector = selectors.DefaultSelector()
+        for stream, capture in captures:
+            self._selector.register(stream, selectors.EVENT_READ, capture)
+
+    def is_open(self):
+        return len(self._selector.get_map()) > 0
+
+    def read(self, timeout=None, exit_fd=None):
+        """Waits up to timeout seconds for output and reads the available output.
+        Returns whether exit_fd became readable."""
+        if exit_fd is not None:
+            self._selector.register(exit_fd, selectors.EVENT_READ)
+        try:
+            exited = False
+            for key, _ in self._selector.select(timeout):
+                if key.fd == exit_fd:
+                    exited = True
+                    continue
+                data = os.read(key.fd, 65536)
+                if data:
+                    key.data.write(data)
+                else:
+                    self._selector.unregister(key.fileobj)
+            return exited
+        finally:
+            if exit_fd is not None:
+                self._selector.unregister(exit_fd)
+
+    def read_available(self):
+        """Reads all output that is available without waiting.
+        Output of other processes that inherited the output streams may come later and is ignored."""
+        # A pipe holds a limited amount of data, so that a few reads get all of it.
+        # Reading more would follow processes that still write to the streams
+        for _ in range(16):
+            if not self.is_open() or not self._selector.select(0):
+                break
+            self.read(0)
+
+    def close(self):
+        self._selector.close()
+
+
+def _get_remaining_time(deadline):
+    if deadline is None:
+        return None
+    return max(deadline - time.monotonic(), 0)
+
+
+def _wait_and_capture(process, reader, timelimit):
+    """Captures the output of the process until it terminates, but at most timelimit seconds.
+    Returns the return code of the process, or None if the time limit expired."""
+    deadline = time.monotonic() + timelimit if timelimit else None
+    pidfd = _open_pidfd(process)
+    try:
+        while pidfd is not None or reader.is_open():
+            remaining = _get_remaining_time(deadline)
+            if remaining == 0:
+                return None
+            if reader.read(remaining, pidfd):
+                break
+    finally:
+        if pidfd is not None:
+            os.close(pidfd)
+    # Without a pidfd, the end of the output is the first sign of the termination of the process
+    try:
+        return process.wait(timeout=_get_remaining_time(deadline))
+    except subprocess.TimeoutExpired:
+        return None
+
+
+def execute(command, quiet=False, env=None, err_to_output=True, stop_flag=None, input_str=None, timelimit=None, cwd=None,
+            output=None, err_output=None):
+    """
+    Runs the given command and returns its ExecutionResult.
+
+    The output of the process is passed to the OutputCapture output, and its error output to
+    the OutputCapture err_output, if err_to_output is not set. By default, all output is kept.
+    The patterns of both captures that were found are available as matches of the result.
+    """
     log_method = logging.debug if quiet else logging.info
 
     logging.info(" ".join(command))
 
-    p = subprocess.Popen(command,
-                         stdin=subprocess.PIPE if input_str else None,
-                         stdout=subprocess.PIPE,
-                         stderr=subprocess.STDOUT if err_to_output else subprocess.PIPE,
-                         universal_newlines=False,
-                         env=env
-                         )
-
-    output = None
-    err_output = None
-    if stop_flag:
-        stopwatch = Stopwatch()
-        stopwatch.start()
-        returncode = p.poll()
-        while returncode is None:
-            if stop_flag.is_set() or (timelimit and stopwatch.curr_s() > timelimit):
-                returncode = shut_down(p)
-            else:
-                time.sleep(0.001)
-                returncode = p.poll()
-        output, err_output = p.communicate()
-    else:
+    if output is None:
+        output = FullOutput()
+    if err_to_output:
+        err_output = None
+    elif err_output is None:
+        err_output = FullOutput()
+
+    # Input goes through a temporary file, so that it never has to be held in a pipe
+    input_file = None
+    if input_str:
+        if type(input_str) is not bytes:
+            input_str = input_str.encode()
+        input_file = tempfile.TemporaryFile()
+        input_file.write(input_str)
+        input_file.seek(0)
+    try:
+        p = subprocess.Popen(command,
+                             stdin=input_file,
+                             stdout=subprocess.PIPE,
+                             stderr=subprocess.STDOUT if err_to_output else subprocess.PIPE,
+                             universal_newlines=False,
+                             env=env,
+                             cwd=cwd
+                             )
+        captures = [(p.stdout, output)]
+        if err_output is not None:
+            captures.append((p.stderr, err_output))
+        reader = _OutputReader(captures)
+
+        def kill():
+            _kill(p)
+
+        if stop_flag:
+            stop_flag_watcher.register(stop_flag, kill)
         try:
-            if input_str and type(input_str) is not bytes:
-                input_str = input_str.encode()
-            output, err_output = p.communicate(input=input_str, timeout=timelimit if timelimit else None)
-            returncode = p.poll()
-        except subprocess.TimeoutExpired:
+            returncode = _wait_and_capture(p, reader, timelimit)
+        finally:
+            if stop_flag:
+                stop_flag_watcher.unregister(stop_flag, kill)
+        timed_out = returncode is None
+        if timed_out:
             logging.info("Timeout of %s s expired. Killing process.", timelimit)
             returncode = shut_down(p)
+        reader.read_available()
+        reader.close()
+        p.stdout.close()
+        if p.stderr:
+            p.stderr.close()
+
+        stdout = output.get_output()
+        matches = set(output.matches)
+        stderr = None
+        if err_output is not None:
+            stderr = err_output.get_output()
+            matches |= err_output.matches
+    finally:
+        if input_file is not None:
+            input_file.close()
+        for capture in (output, err_output):
+            if capture is not None:
+                capture.close()
     # Decode output, but we can't decode error output, since it may contain undecodable bytes.
-    output = output.decode() if output else ''
-    log_method(output)
-    logging.debug(err_output)
+    stdout = stdout.decode(errors='replace') if stdout else ''
+    log_method(stdout)
+    logging.debug(stderr)
+
+    return ExecutionResult(returncode, stdout, stderr, matches, timed_out)
+
+
+class ForkServer(object):
+    """Resident harness process that forks one child per test vector.
+
+    The executable has to be linked with the fork server created by
+    HarnessCreator.create_fork_server().
+    """
+
+    def __init__(self, executable):
+        self.executable = executable
+        self._process = None
+        self._ctl_fd = None
+        self._status_fd = None
+
+    def is_running(self):
+        return self._process is not None and self._process.poll() is None
 
-    return ExecutionResult(returncode, output, err_output)
+    def start(self):
+        ctl_read, ctl_write = os.pipe()
+        status_read, status_write = os.pipe()
+        env = get_env()
+        env[fork_server_ctl_var] = str(ctl_read)
+        env[fork_server_status_var] = str(status_write)
+        logging.info("Starting fork server %s", self.executable)
+        self._process = subprocess.Popen([self.executable],
+                                         stdin=subprocess.DEVNULL,
+                                         stdout=subprocess.DEVNULL,
+                                         stderr=subprocess.DEVNULL,
+                                         pass_fds=(ctl_read, status_write),
+                                         env=env
+                                         )
+        os.close(ctl_read)
+        os.close(status_write)
+        self._ctl_fd = ctl_write
+        self._status_fd = status_read
+
+        if self._read_message(timelimit=5) is None:
+            self.stop()
+            raise ExecutionError("Fork server {} did not start".format(self.executable))
+
+    def stop(self):
+        if self._process is None:
+            return
+        # The server terminates as soon as its control pipe is closed
+        for fd in (self._ctl_fd, self._status_fd):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        try:
+            self._process.wait(timeout=1)
+        except subprocess.TimeoutExpired:
+            shut_down(self._process)
+        self._process = None
+
+    def _read_message(self, timelimit=None):
+        if timelimit is not None:
+            ready, _, _ = select.select([self._status_fd], [], [], timelimit)
+            if not ready:
+                return None
+        message = b''
+        while len(message) < 4:
+            data = os.read(self._status_fd, 4 - len(message))
+            if not data:
+                raise EOFError("Fork server closed status pipe")
+            message += data
+        return unpack('<I', message)[0]
+
+    def _write_vector(self, input_vector):
+        message = pack('<I', len(input_vector)) + input_vector
+        while message:
+            written = os.write(self._ctl_fd, message)
+            message = message[written:]
+
+    def _wait_for_child(self, child_pid, timelimit, stop_flag):
+        if stop_flag is None:
+            return self._read_message(timelimit)
+
+        def kill():
+            try:
+                os.kill(child_pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+        stop_flag_watcher.register(stop_flag, kill)
+        try:
+            return self._read_message(timelimit)
+        finally:
+            stop_flag_watcher.unregister(stop_flag, kill)
+
+    def execute(self, input_vector, timelimit=None, stop_flag=None):
+        """Runs the program on the given input and returns the ExecutionResult of this run.
+        Output of the program is not captured, but error_string is reported as match
+        if the program called the error method. If the fork server fails, the returncode is None."""
+        if not self.is_running():
+            self.start()
+        if input_vector is None:
+            input_vector = b''
+        elif type(input_vector) is not bytes:
+            input_vector = input_vector.encode()
+
+        try:
+            self._write_vector(input_vector)
+            child_pid = self._read_message(timelimit)
+            if child_pid is None:
+                raise EOFError("No child started within {} s".format(timelimit))
+            status = self._wait_for_child(child_pid, timelimit, stop_flag)
+            timed_out = status is None
+            if timed_out:
+                logging.info("Timeout of %s s expired. Killing process.", timelimit)
+                try:
+                    os.kill(child_pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+                status = self._read_message(timelimit=5)
+                if status is None:
+                    raise EOFError("Killed child {} did not terminate".format(child_pid))
+            error_reached = self._read_message(timelimit=5)
+            if error_reached is None:
+                raise EOFError("No report for child {}".format(child_pid))
+        except (OSError, EOFError) as e:
+            logging.warning("Fork server failed: %s. Restarting it for the next run.", e)
+            self.stop()
+            return ExecutionResult(None, '', None)
+
+        if os.WIFSIGNALED(status):
+            returncode = -os.WTERMSIG(status)
+        else:
+            returncode = os.WEXITSTATUS(status)
+        matches = [error_string] if error_reached else []
+        return ExecutionResult(returncode, '', None, matches=matches, timed_out=timed_out)
 
 
 def flatten(list_of_lists):
@@ -850,6 +1386,74 @@ def get_hash(filename):
     return sha1.hexdigest()
 
 
+class ProgramInfo(object):
+    """
+    Information about a program under test that does not change as long as the program file does not change.
+    Each information is computed at most once. Use get_program_info to get the instance shared by all
+    components that work on a program.
+    """
+
+    # If a void appears in a line, there must be something between
+    # the void and the __VERIFIER_error() symbol - otherwise
+    # it is a function definition/declaration.
+    error_method_pattern = re.compile('((?!void).)*(void.*\S.*)?__VERIFIER_error\(\) *;.*')
+
+    def __init__(self, program_file, file_state):
+        self.program_file = program_file
+        self.file_state = file_state
+        self.machine_model = None
+        self.nondet_methods = None
+        self.seed_constants = None
+        # C dialect that the program compiles with, and its object files per machine model and C dialect
+        self.c_dialect = None
+        self.objects = dict()
+        # Whether the harness compiles without the declarations of the program
+        self.links_with_harness = None
+        self._hash = None
+        self._error_lines = None
+
+    @property
+    def hash(self):
+        if self._hash is None:
+            self._hash = get_hash(self.program_file)
+        return self._hash
+
+    @property
+    def error_lines(self):
+        if self._error_lines is None:
+            with open(self.program_file, 'r') as inp:
+                content = inp.readlines()
+
+            err_lines = list()
+            for line_num, line in enumerate(content, start=1):
+                # Try to differentiate definition from call through the 'void' condition
+                if self.error_method_pattern.match(line):
+                    err_lines.append(line_num)
+            assert err_lines  # Assert that there is at least one error call
+            self._error_lines = err_lines
+        return self._error_lines
+
+
+_program_infos = dict()
+_program_infos_lock = Lock()
+
+
+def get_program_info(program_file, machine_model=None):
+    """Returns the ProgramInfo for the given program file.
+    If a machine model is given, it is remembered as the machine model of the program."""
+    program_file = os.path.abspath(program_file)
+    stat = os.stat(program_file)
+    file_state = (stat.st_mtime_ns, stat.st_size)
+    with _program_infos_lock:
+        info = _program_infos.get(program_file)
+        if info is None or info.file_state != file_state:
+            info = ProgramInfo(program_file, file_state)
+            _program_infos[program_file] = info
+        if machine_model:
+            info.machine_model = machine_model
+    return info
+
+
 def get_machine_model(witness_file):
     with open(witness_file, 'r') as inp:
         for line in inp.readlines():
@@ -870,8 +1474,9 @@ def import_tool(tool_name):
     return __import__(tool_module, fromlist=['Tool']).Tool()
 
 
-def get_cpachecker_options(witness_file):
-    machine_model = get_machine_model(witness_file)
+def get_cpachecker_options(witness_file, machine_model=None):
+    if not machine_model:
+        machine_model = get_machine_model(witness_file)
     if machine_model.is_32:
         machine_model = '-32'
     elif machine_model.is_64:
@@ -882,7 +1487,7 @@ def get_cpachecker_options(witness_file):
     return [
         '-setprop', 'witness.checkProgramHash=false',
         '-disable-java-assertions',
-        '-heap', '4000M',
+        '-heap', str(cpachecker_heap_size) + 'M',
         '-setprop', 'cfa.simplifyCfa=false',
         '-setprop', 'cfa.allowBranchSwapping=false',
         '-setprop', 'cpa.predicate.ignoreIrrelevantVariables=false',
@@ -900,9 +1505,9 @@ def get_cpachecker_options(witness_file):
 
 def get_file_path(filename, temp_dir=True):
     if temp_dir:
-        prefix = tmp
+        prefix = get_context().tmp
     else:
-        prefix = output_dir
+        prefix = get_context().output_dir
     return os.path.join(prefix, filename)
 
 
@@ -958,6 +1563,100 @@ def get_input_vector(test_vector, escape_newline=False):
     return input_vector
 
 
+_c_integer_pattern = re.compile(r'([+-]?)(?:0[xX]([0-9a-fA-F]+)|(0[0-7]*)|([1-9][0-9]*))')
+
+
+def _parse_c_integer(value):
+    """Returns the integer that strtoll/strtoull with base 0 read from the given string, or None
+    if they don't read the whole string. Integers out of the range of these functions are returned as they are."""
+    match = _c_integer_pattern.fullmatch(value)
+    if not match:
+        return None
+    sign, hex_digits, oct_digits, dec_digits = match.groups()
+    if hex_digits:
+        number = int(hex_digits, 16)
+    elif oct_digits:
+        number = int(oct_digits, 8)
+    else:
+        number = int(dec_digits)
+    return -number if sign == '-' else number
+
+
+def get_binary_format(value_type, machine_model):
+    """Returns the struct format of values of the given type in binary test vectors.
+    If values of the type can't be written to binary test vectors, None is returned."""
+    words = [w for w in value_type.split() if w not in ('const', 'volatile')]
+    m_type = ' '.join(words)
+    if not words or '*' in m_type or any(w in words for w in ('void', 'struct', 'union', 'enum')):
+        return None
+    if m_type == 'float':
+        return '<f'
+    elif m_type == 'double':
+        return '<d'
+    elif 'double' in words:
+        # long double has no counterpart in python
+        return None
+    elif m_type in ('_Bool', 'bool') or 'char' in words:
+        size = 1
+    else:
+        try:
+            size = machine_model.get_size(m_type)
+        except AssertionError:
+            if 'unsigned' not in words and 'signed' not in words:
+                return None
+            size = machine_model.int_size
+    return {1: '<B', 2: '<H', 4: '<I', 8: '<Q'}[size]
+
+
+def _pack_binary_value(value, data_format):
+    """Returns the bytes that the text harness reads for the given value, if it reads the value as integer,
+    and None otherwise."""
+    if type(value) is bytes:
+        try:
+            value = value.decode()
+        except UnicodeDecodeError:
+            return None
+    number = _parse_c_integer(value)
+    if number is None:
+        # The text harness reads other values as long double, which can't be reproduced reliably
+        return None
+    # The text harness reads integers with strtoull, which saturates, and takes the leading bytes
+    # of the result as the value, even for floating-point types
+    if abs(number) >= 1 << 64:
+        number = (1 << 64) - 1
+    size = calcsize(data_format)
+    return (number % (1 << (8 * size))).to_bytes(size, 'little')
+
+
+def get_binary_input_vector(test_vector, machine_model):
+    """
+    Returns the input of the given test vector for the harness created with binary_vectors set, or None
+    if the vector can't be written in that format.
+
+    Each value has the size of the type of its nondet method, in little endian, so that the harness
+    reads it with a single fread. This requires that the nondet method of each value is known
+    and that each value is an integer. The harness reads the same values as the text harness
+    reads from the input of get_input_vector.
+    """
+    nondet_methods = {m['name']: m for m in get_context().undefined_methods or []}
+    data_formats = dict()
+    input_vector = list()
+    for item in test_vector.vector:
+        method = nondet_methods.get(item['name'])
+        if method is None:
+            return None
+        if method['name'] not in data_formats:
+            data_formats[method['name']] = get_binary_format(method['type'], machine_model)
+        data_format = data_formats[method['name']]
+        if data_format is None:
+            return None
+        value = _pack_binary_value(item['value'], data_format)
+        if value is None:
+            return None
+        input_vector.append(value)
+    return b''.join(input_vector)
+
+
 def convert_dec_to_hex(dec_value, byte_number=None):
     hex_value = hex(int(dec_value))
     pure_hex = hex_value[2:]
@@ -1088,13 +1787,46 @@ def rewrite_cproblems(content):
     return prepared_content
 
 
+def _get_source_key(kind, file_content, *components):
+    import artifact_cache
+    content_hash = hashlib.sha1(file_content.encode()).hexdigest()
+    return artifact_cache.ArtifactCache.get_key(kind, content_hash, *components)
+
+
+def _get_preprocessing_key(kind, file_content, machine_model, includes):
+    return _get_source_key(kind, file_content, machine_model.name, *[os.path.abspath(i) for i in includes])
+
+
 def parse_file_with_preprocessing(file_content, machine_model, includes=[]):
-    preprocessed_content = preprocess(file_content, machine_model, includes)
-    ast = parser.parse(preprocessed_content)
+    """Returns the AST of the given content after preprocessing.
+    The AST is kept for later calls of the current task with the same arguments, so it must not be changed."""
+    parse_results = get_context().parse_results
+    key = _get_preprocessing_key('ast', file_content, machine_model, includes)
+    ast = parse_results.get(key)
+    if ast is None:
+        preprocessed_content = preprocess(file_content, machine_model, includes)
+        ast = parser.parse(preprocessed_content)
+        # An AST is much larger than the content it is created from, so it is not stored in the artifact cache
+        parse_results[key] = ast
     return ast
 
 
 def preprocess(file_content, machine_model, includes=[]):
+    """
+    Returns the preprocessed content. Results are cached for the content, machine model and include directories:
+    in the current task, and in the artifact cache if one is configured.
+    The C dialect that preprocessing works with is remembered, so that it is tried first next time.
+    """
+    import artifact_cache
+    parse_results = get_context().parse_results
+    key = _get_preprocessing_key('preprocessed', file_content, machine_model, includes)
+    preprocessed_content = parse_results.get(key)
+    if preprocessed_content is None:
+        preprocessed_content = artifact_cache.load(key, remember=False)
+    if preprocessed_content is not None:
+        parse_results[key] = preprocessed_content
+        return preprocessed_content
+
     mm_arg = machine_model.compile_parameter
 
     # -E : only preprocess
@@ -1107,45 +1839,74 @@ def preprocess(file_content, machine_model, includes=[]):
                       mm_arg]
     for inc in includes:
         preprocess_cmd += ['-I', inc]
-    final_cmd = preprocess_cmd + ['-std=gnu11', '-lm', '-']
-    p = execute(final_cmd, err_to_output=False, input_str=file_content, quiet=True)
-    if p.returncode != 0:
-        final_cmd = preprocess_cmd + ['-std=gnu90', '-lm', '-']
+    dialect_key = _get_preprocessing_key('c-dialect', file_content, machine_model, includes)
+    known_dialect = artifact_cache.load(dialect_key)
+    dialects = ['gnu11', 'gnu90']
+    if known_dialect in dialects:
+        dialects.remove(known_dialect)
+        dialects.insert(0, known_dialect)
+    for dialect in dialects:
+        final_cmd = preprocess_cmd + ['-std=' + dialect, '-lm', '-']
         p = execute(final_cmd, err_to_output=False, input_str=file_content, quiet=True)
+        if p.returncode == 0:
+            artifact_cache.store(dialect_key, dialect)
+            artifact_cache.store(key, p.stdout, remember=False)
+            parse_results[key] = p.stdout
+            break
     return p.stdout
 
 
-undefined_methods = None
-
+def get_nondet_methods(program_file=None):
+    """Returns the nondet methods of the given program, if they are known,
+    and the nondet methods of the last analyzed program, otherwise."""
+    if program_file:
+        nondet_methods = get_program_info(program_file).nondet_methods
+        if nondet_methods is not None:
+            return nondet_methods
+    return get_context().undefined_methods
 
-def get_nondet_methods():
-    return undefined_methods
 
-
-def find_nondet_methods(file_content, svcomp_only):
-    global undefined_methods
-    if undefined_methods is None:
-        logging.debug("Finding undefined methods")
+def find_nondet_methods(file_content, svcomp_only, machine_model=None):
+    """Finds the nondet methods of the given program, or program content, with the given machine model.
+    If no machine model is given, the 32 bit model is used."""
+    context = get_context()
+    if context.undefined_methods is None:
+        program_info = None
         if os.path.exists(file_content):
+            program_info = get_program_info(file_content)
+            if program_info.nondet_methods is not None:
+                context.undefined_methods = program_info.nondet_methods
+                return context.undefined_methods
+        logging.debug("Finding undefined methods")
+        if program_info:
             with open(file_content, 'r') as inp:
                 file_content = inp.read()
             file_content = rewrite_cproblems(file_content)
         if not svcomp_only:
             try:
-                undefined_methods = _find_undefined_methods(file_content)
+                context.undefined_methods = _find_undefined_methods(file_content, machine_model or MACHINE_MODEL_32)
             except pycparser.plyparser.ParseError as e:
                 logging.warning("Parse failure with pycparser while parsing: %s", e)
-                undefined_methods = _find_nondet_methods(file_content)
+                context.undefined_methods = _find_nondet_methods(file_content)
         else:
-            undefined_methods = _find_nondet_methods(file_content)
-        logging.debug("Undefined methods: %s", undefined_methods)
-    return undefined_methods
+            context.undefined_methods = _find_nondet_methods(file_content)
+        if program_info:
+            program_info.nondet_methods = context.undefined_methods
+        logging.debug("Undefined methods: %s", context.undefined_methods)
+    return context.undefined_methods
 
 
-def _find_undefined_methods(file_content):
+def _find_undefined_methods(file_content, machine_model):
+    import artifact_cache
     import ast_visitor
 
-    ast = parse_file_with_preprocessing(file_content, MACHINE_MODEL_32)
+    key = _get_preprocessing_key('undefined-methods', file_content, machine_model, [])
+    undefined_functions = artifact_cache.load(key)
+    if undefined_functions is not None:
+        # Callers may change the returned methods, so they must not change the cached ones
+        return [dict(f) for f in undefined_functions]
+
+    ast = parse_file_with_preprocessing(file_content, machine_model)
 
     func_decl_collector = ast_visitor.FuncDeclCollector()
     func_def_collector = ast_visitor.FuncDefCollector()
@@ -1169,6 +1930,7 @@ def _find_undefined_methods(file_content):
             undef_func_names.add(f['name'])
             undefined_functions.append(f)
 
+    artifact_cache.store(key, [dict(f) for f in undefined_functions])
     return undefined_functions
 
 
@@ -1236,20 +1998,17 @@ def get_corresponding_method_name(sym_var_name):
     return name
 
 
-def convert_to_int(value, method_name):
+def get_nondet_method(method_name):
+    undefined_methods = get_context().undefined_methods
     assert undefined_methods is not None
-    if type(value) is str and value.startswith('\'') and value.endswith('\''):
-        value = value[1:-1]
-    value = codecs.decode(value, 'unicode_escape').encode('latin1')
     corresponding_method_singleton_list = [m for m in undefined_methods if m['name'] == method_name]
     if len(corresponding_method_singleton_list) == 0:
         raise AssertionError("Didn't find {} in list of undefined methods: {}".format(method_name, undefined_methods))
-    corresponding_method = corresponding_method_singleton_list[0]
-    # The type of the symbolic variable may be different from the method return type,
-    # but must be ultimately cast to the method return type,
-    # so this is fine - unless we have undefined behavior prior to this point due to a downcast of the variable type.
-    # In that case, hope is already lost.
-    value_type = corresponding_method['type']
+    return corresponding_method_singleton_list[0]
+
+
+def get_data_format(value_type):
+    """Returns the struct format that values of the given type are stored in by klee."""
     data_format = '<'  # Klee output uses little endian format
     if value_type == 'char' or value_type == 'signed char':
 
@@ -1282,6 +2041,19 @@ def convert_to_int(value, method_name):
     else:
         logging.debug('Converting type %s using type unsigned long ', value_type)
         data_format += 'Q'
+    return data_format
+
+
+def convert_to_int(value, method_name):
+    if type(value) is str and value.startswith('\'') and value.endswith('\''):
+        value = value[1:-1]
+    value = codecs.decode(value, 'unicode_escape').encode('latin1')
+    corresponding_method = get_nondet_method(method_name)
+    # The type of the symbolic variable may be different from the method return type,
+    # but must be ultimately cast to the method return type,
+    # so this is fine - unless we have undefined behavior prior to this point due to a downcast of the variable type.
+    # In that case, hope is already lost.
+    data_format = get_data_format(corresponding_method['type'])
     logging.debug("Converting value %s according to data format %s", value, data_format)
     return unpack(data_format, value)
 
@@ -1387,26 +2159,60 @@ class StatisticsPool(object):
 
 
 error_string = "Error found."
-error_return = 107
+fork_server_ctl_var = 'TBF_FORK_SERVER_CTL'
+fork_server_status_var = 'TBF_FORK_SERVER_STATUS'
 error_method = '__VERIFIER_error'
 spec_file = os.path.abspath('./ReachSafety.prp')
-output_dir = os.path.abspath('./output')
-tmp = tempfile.mkdtemp()
+cpachecker_heap_size = 4000  # in MB
 nondet_pattern = re.compile('__VERIFIER_nondet_.+?\(\)')
 
 FALSE = 'false'
 UNKNOWN = 'unknown'
 TRUE = 'true'
 ERROR = 'error'
+# A test vector that was killed because it exceeded its time limit
+TIMEOUT = 'timeout'
 
 MACHINE_MODEL_32 = MachineModel(32, "32 bit linux", 2, 4, 4, 8, 4, 8, 12, '-m32')
 MACHINE_MODEL_64 = MachineModel(64, "64 bit linux", 2, 4, 8, 8, 4, 8, 16, '-m64')
 
-if not os.path.exists(output_dir):
-    os.mkdir(output_dir)
+
+class TaskContext(object):
+    """
+    State of the analysis of a single program: the directory for temporary files,
+    the directory for results, and the nondet methods found in the program.
+    One process can analyze several programs one after the other, each in its own context.
+    """
+
+    def __init__(self, output_dir=None):
+        self.tmp = tempfile.mkdtemp()
+        self.output_dir = os.path.abspath(output_dir if output_dir else './output')
+        if not os.path.exists(self.output_dir):
+            os.makedirs(self.output_dir)
+        self.undefined_methods = None
+        # Preprocessed contents and ASTs of the programs of this task, see parse_file_with_preprocessing
+        self.parse_results = dict()
+
+
+_context = None
+
+
+def get_context():
+    """Returns the context of the current task. If no context was set, a new one is created."""
+    global _context
+    if _context is None:
+        _context = TaskContext()
+    return _context
+
+
+def set_context(context):
+    global _context
+    _context = context
 
 
 def found_err(run_result):
+    if error_string in run_result.matches:
+        return True
     return run_result.stderr and error_string.encode() in run_result.stderr
 
 
@@ -1,93 +1,133 @@
-from xml.etree import ElementTree as ET
-import xml.dom.minidom as minidom
+import io
+from xml.sax.saxutils import escape
 import utils
 
 
+class GraphMLWriter(object):
+    """
+    Writes XML elements to a text stream as soon as they are created.
+
+    If indent is given, each element is written on its own line and nested elements are
+    indented by that many spaces. The number of characters written so far is available as size.
+    """
+
+    def __init__(self, outp, indent=None):
+        self._outp = outp
+        self._indent = indent
+        self._open_elements = list()
+        self.size = 0
+
+    def _write(self, text):
+        self._outp.write(text)
+        self.size += len(text)
+
+    def _write_line(self, text):
+        if self._indent is None:
+            self._write(text)
+        else:
+            self._write(' ' * (self._indent * len(self._open_elements)) + text + '\n')
+
+    @staticmethod
+    def _get_tag(name, attributes):
+        return name + ''.join([' {}="{}"'.format(k, escape(str(v), {'"': '&quot;'})) for k, v in attributes])
+
+    def write_declaration(self):
+        self._write_line('<?xml version="1.0" ?>')
+
+    def start(self, name, *attributes):
+        """Writes the start tag of a new element. Attributes are (name, value) tuples."""
+        self._write_line('<' + self._get_tag(name, attributes) + '>')
+        self._open_elements.append(name)
+
+    def end(self):
+        """Writes the end tag of the innermost element that is not closed, yet."""
+        name = self._open_elements.pop()
+        self._write_line('</' + name + '>')
+
+    def element(self, name, *attributes, text=None):
+        """Writes a complete element without children."""
+        if text is None:
+            self._write_line('<' + self._get_tag(name, attributes) + '/>')
+        else:
+            self._write_line('<' + self._get_tag(name, attributes) + '>' + escape(str(text)) + '</' + name + '>')
+
+
 class WitnessCreator(object):
 
     def __init__(self):
         self._node_id_counter = -1
 
-    def _create_witness_header(self, program_file):
-        graphml = ET.Element('graphml')
-        graphml.set('xmlns', 'http://graphml.graphdrawing.org/xmlns')
-        graphml.set('xmlns:xsi', 'http://www.w3.org/2001/XMLSchema-instance')
-
-        key = ET.SubElement(graphml, 'key')
-        key.set('attr.name', 'originFileName')
-        key.set('attr.type', 'string')
-        key.set('for', 'edge')
-        key.set('id', 'originfile')
-        default_key = ET.SubElement(key, 'default')
-        default_key.text = program_file
+    def _write_witness_header(self, writer, program_file):
+        writer.start('graphml',
+                     ('xmlns', 'http://graphml.graphdrawing.org/xmlns'),
+                     ('xmlns:xsi', 'http://www.w3.org/2001/XMLSchema-instance'))
 
-        return graphml
+        writer.start('key', ('attr.name', 'originFileName'), ('attr.type', 'string'), ('for', 'edge'),
+                     ('id', 'originfile'))
+        writer.element('default', text=program_file)
+        writer.end()
 
-    def _create_data_element(self, keyname, text):
-        data_el = ET.Element('data')
-        data_el.text = str(text)
-        data_el.set('key', str(keyname))
-        return data_el
+    def _write_data_element(self, writer, keyname, text):
+        writer.element('data', ('key', keyname), text=text)
 
     def _next_node_id(self):
         self._node_id_counter += 1
         return 'A' + str(self._node_id_counter)
 
-    def _create_node(self, entry=False, violation=False):
-        node = ET.Element('node')
-        node.set('id', self._next_node_id())
-        if entry:
-            node.append(self._create_data_element('entry', 'true'))
-        if violation:
-            node.append(self._create_data_element('violation', 'true'))
-        return node
+    def _write_node(self, writer, node_id=None, entry=False, violation=False):
+        if node_id is None:
+            node_id = self._next_node_id()
+        if entry or violation:
+            writer.start('node', ('id', node_id))
+            if entry:
+                self._write_data_element(writer, 'entry', 'true')
+            if violation:
+                self._write_data_element(writer, 'violation', 'true')
+            writer.end()
+        else:
+            writer.element('node', ('id', node_id))
+        return node_id
 
     def _reset_node_id(self):
         self._node_id_counter = -1
 
-    def _create_edge(self, source, target, assumption=None, startline=None, assumption_scope=None):
-        edge = ET.Element('edge')
-        edge.set('source', source)
-        edge.set('target', target)
+    def _write_edge(self, writer, source, target, assumption=None, startline=None, assumption_scope=None,
+                    result_function=None):
+        writer.start('edge', ('source', source), ('target', target))
         if startline:
-            edge.append(self._create_data_element('startline', startline))
+            self._write_data_element(writer, 'startline', startline)
         if assumption:
-            edge.append(self._create_data_element('assumption', assumption))
+            self._write_data_element(writer, 'assumption', assumption)
         if assumption_scope:
-            edge.append(self._create_data_element('assumption.scope', assumption_scope))
+            self._write_data_element(writer, 'assumption.scope', assumption_scope)
+        if result_function:
+            self._write_data_element(writer, 'assumption.resultfunction', result_function)
+        writer.end()
 
-        return edge
-
-    def _create_graph_head(self, producer, program_file, machine_model):
-        graph = ET.Element('graph')
-        graph.set('edgedefault', 'directed')
+    def _write_graph_head(self, writer, producer, program_file, machine_model):
+        writer.start('graph', ('edgedefault', 'directed'))
 
         # Create data elements that describe witness
-        graph.append(self._create_data_element('witness-type', 'violation_witness'))
-        graph.append(self._create_data_element('sourcecodelang', 'C'))
-        graph.append(self._create_data_element('producer', producer))
-        graph.append(self._create_data_element('specification', 'CHECK( init(main()), LTL(G ! call(__VERIFIER_error())) )'))
-        #graph.append(self._create_data_element('testfile', test_file))
+        self._write_data_element(writer, 'witness-type', 'violation_witness')
+        self._write_data_element(writer, 'sourcecodelang', 'C')
+        self._write_data_element(writer, 'producer', producer)
+        self._write_data_element(writer, 'specification', 'CHECK( init(main()), LTL(G ! call(__VERIFIER_error())) )')
+        #self._write_data_element(writer, 'testfile', test_file)
         #timestamp = utils.get_time()
-        #graph.append(self._create_data_element('creationtime', timestamp))
-        graph.append(self._create_data_element('programfile', program_file))
-        filehash = utils.get_hash(program_file)
-        graph.append(self._create_data_element('programhash', filehash))
-        graph.append(self._create_data_element('architecture', machine_model.witness_key))
-
-        return graph
+        #self._write_data_element(writer, 'creationtime', timestamp)
+        self._write_data_element(writer, 'programfile', program_file)
+        filehash = utils.get_program_info(program_file).hash
+        self._write_data_element(writer, 'programhash', filehash)
+        self._write_data_element(writer, 'architecture', machine_model.witness_key)
 
-    def _create_automaton(self, graph, test_vector, nondet_methods, error_lines):
+    def _write_automaton(self, writer, test_vector, nondet_methods, error_lines):
         # Create entry node
-        previous_node = self._create_node(entry=True)
-
-        graph.append(previous_node)
+        previous_node = self._write_node(writer, entry=True)
 
         for instantiation in test_vector.vector:
             if not instantiation['value']:
                 continue
-            target_node = self._create_node()
-            graph.append(target_node)
+            target_node = self._write_node(writer)
             if instantiation['name']:
                 possible_methods = [instantiation['name']]
             else:
@@ -95,41 +135,38 @@ class WitnessCreator(object):
 
             for nondet_method in possible_methods:
                 assumption = '\\result == ' + instantiation['value'] + ';'
-                new_edge = self._create_edge(previous_node.get('id'), target_node.get('id'), assumption)
-                new_edge.append(self._create_data_element('assumption.resultfunction', nondet_method))
-                graph.append(new_edge)
+                self._write_edge(writer, previous_node, target_node, assumption, result_function=nondet_method)
             previous_node = target_node
 
         # Add transition to violation node if line representing error location is reached
-        target_node = self._create_node(violation=True)
-        graph.append(target_node)
+        target_node = self._write_node(writer, violation=True)
         for error_line in error_lines:
-            new_edge = self._create_edge(previous_node.get('id'), target_node.get('id'), startline=error_line)
-            graph.append(new_edge)
+            self._write_edge(writer, previous_node, target_node, startline=error_line)
 
         # Add transition to sink node if an additional nondet call is performed
-        sink_node = self._create_node()
-        sink_node.set('id', 'sink')
-        graph.append(sink_node)
+        sink_node = self._write_node(writer, node_id='sink')
         for nondet_method in nondet_methods:
             assumption = '\\result == 0;'  # dummy assumption
-            new_edge = self._create_edge(previous_node.get('id'), sink_node.get('id'), assumption)
-            new_edge.append(self._create_data_element('assumption.resultfunction', nondet_method))
-            graph.append(new_edge)
-
-        return graph
+            self._write_edge(writer, previous_node, sink_node, assumption, result_function=nondet_method)
 
-    def _create_graph(self, producer, program_file, test_vector, nondet_methods, machine_model, error_lines):
-        graph = self._create_graph_head(producer, program_file, machine_model)
-        return self._create_automaton(graph, test_vector, nondet_methods, error_lines)
-
-    def create_witness(self, producer, program_file, test_vector, nondet_methods, machine_model, error_lines):
+    def write_witness(self, outp, producer, program_file, test_vector, nondet_methods, machine_model, error_lines,
+                      indent=4):
+        """Writes the witness for the given test vector to the given text stream
+        and returns the number of characters written."""
         self._reset_node_id()
-        witness = self._create_witness_header(program_file)
+        writer = GraphMLWriter(outp, indent)
+        writer.write_declaration()
+        self._write_witness_header(writer, program_file)
         nondet_method_names = [m['name'] for m in nondet_methods]
-        graph = self._create_graph(producer, program_file, test_vector, nondet_method_names, machine_model, error_lines)
-        witness.append(graph)
-
-        xml_string = ET.tostring(witness, 'utf-8')
-        minidom_parsed_xml = minidom.parseString(xml_string)
-        return minidom_parsed_xml.toprettyxml(indent=(4 * ' '))
+        self._write_graph_head(writer, producer, program_file, machine_model)
+        self._write_automaton(writer, test_vector, nondet_method_names, error_lines)
+        writer.end()  # graph
+        writer.end()  # graphml
+        return writer.size
+
+    def create_witness(self, producer, program_file, test_vector, nondet_methods, machine_model, error_lines,
+                       indent=4):
+        outp = io.StringIO()
+        self.write_witness(outp, producer, program_file, test_vector, nondet_methods, machine_model, error_lines,
+                           indent)
+        return outp.getvalue()
@@ -1,2 +1,3 @@
 #include<stdlib.h>
 void input(void * var, size_t var_size, const char * var_name);
+void report_error();
@@ -1,27 +1,257 @@
+#define _GNU_SOURCE
 #include<stdio.h>
 #include<stdlib.h>
 #include<string.h>
+#include<errno.h>
 #include<time.h>
+#include<signal.h>
+#include<unistd.h>
+#include<sys/mman.h>
+#include<sys/wait.h>
+#ifdef __linux__
+#include<sys/prctl.h>
+#endif
 
-unsigned int get_rand_seed() {
-  struct timespec curr_time;
-  clock_gettime(CLOCK_REALTIME, &curr_time);
-  return curr_time.tv_nsec;
+/*
+ * Random testing engine.
+ *
+ * Before the main method of the program under test runs, the engine takes over the process
+ * and forks one child per test. Each child returns to the program and runs it with fresh random inputs,
+ * while it records the inputs in a buffer that it shares with the engine.
+ * The engine collects the vectors of all children and writes them in batches to files vectors<N>.test.
+ * Each file is written under a temporary name first and renamed when complete.
+ *
+ * If the program under test calls report_error(), the header of its vector is marked with 'error'
+ * and the current batch is written immediately, so that the vector can be validated right away.
+ *
+ * Environment variables:
+ *   PRTEST_SEED      seed of the first test. Test number i uses seed PRTEST_SEED + i.
+ *   PRTEST_TESTS     number of tests to run. If not given, tests are run until the engine is killed.
+ *   PRTEST_TIMEOUT   time limit for a single test, in seconds. Default: 1
+ *   PRTEST_CONSTANTS comma-separated list of integer constants of the program under test.
+ *                    Each input takes one of these with a probability of 1/CONSTANT_CHANCE instead of random bits.
+ */
+
+#define VECTOR_BUFFER_SIZE (1 << 20)
+#define MAX_BATCH_SIZE 1000
+#define MAX_BATCH_TIME_NS 100000000L
+#define MAX_CONSTANTS 256
+#define CONSTANT_CHANCE 4
+
+struct vector_buffer {
+  size_t length;
+  int overflow;
+  int error_reached;
+  char data[];
+};
+
+static struct vector_buffer * vector_buffer = NULL;
+static unsigned long long rand_state;
+static unsigned long long constants[MAX_CONSTANTS];
+static size_t constant_count = 0;
+
+/* splitmix64 */
+static unsigned long long next_rand() {
+  unsigned long long z = (rand_state += 0x9e3779b97f4a7c15ULL);
+  z = (z ^ (z >> 30)) * 0xbf58476d1ce4e5b9ULL;
+  z = (z ^ (z >> 27)) * 0x94d049bb133111ebULL;
+  return z ^ (z >> 31);
+}
+
+static void append_to_vector(const char * text, size_t length) {
+  if (vector_buffer->overflow || vector_buffer->length + length > VECTOR_BUFFER_SIZE - sizeof(struct vector_buffer)) {
+    vector_buffer->overflow = 1;
+    return;
+  }
+  memcpy(vector_buffer->data + vector_buffer->length, text, length);
+  vector_buffer->length += length;
+}
+
+void report_error() {
+  if (vector_buffer != NULL) {
+    vector_buffer->error_reached = 1;
+  }
 }
 
 void input(void * var, size_t var_size, const char * var_name) {
-  srand(get_rand_seed());
-  FILE *vector = fopen("vector.test", "a+");
-  size_t int_size = sizeof(int);
-  unsigned char * new_val = malloc(var_size);
+  static const char hex_digits[] = "0123456789abcdef";
+  unsigned char * new_val = var;
+  char line[256];
+  size_t length = snprintf(line, sizeof(line) - 1, "%s: 0x", var_name);
+  unsigned long long rand_bits = 0;
 
-  fprintf(vector, "%s: 0x", var_name);
-  for (int i = 0; i < var_size; i++) {
-    new_val[var_size - i] = (char) (rand() & 255);
-    fprintf(vector, "%.2x", new_val[var_size - i]);
+  if (length + 2 * var_size + 1 >= sizeof(line)) {
+    vector_buffer->overflow = 1;
+    return;
   }
-  memcpy(new_val, var, var_size);
+  if (constant_count > 0 && next_rand() % CONSTANT_CHANCE == 0) {
+    unsigned long long constant = constants[next_rand() % constant_count];
+    /* The constant is truncated to the size of the variable, or sign-extended if the variable is larger */
+    for (size_t i = 0; i < var_size; i++) {
+      if (i < sizeof(constant)) {
+        new_val[i] = (unsigned char) ((constant >> (8 * i)) & 255);
+      } else {
+        new_val[i] = (long long) constant < 0 ? 255 : 0;
+      }
+    }
+  } else {
+    for (size_t i = 0; i < var_size; i++) {
+      if (i % sizeof(rand_bits) == 0) {
+        rand_bits = next_rand();
+      }
+      new_val[i] = (unsigned char) (rand_bits & 255);
+      rand_bits >>= 8;
+    }
+  }
+  /* The value is written with its most significant byte first */
+  for (size_t i = var_size; i > 0; i--) {
+    line[length++] = hex_digits[new_val[i - 1] >> 4];
+    line[length++] = hex_digits[new_val[i - 1] & 15];
+  }
+  line[length++] = '\n';
+  append_to_vector(line, length);
+}
+
+static unsigned long long get_env_value(const char * name, unsigned long long default_value) {
+  const char * value = getenv(name);
+  if (value == NULL || *value == '\0') {
+    return default_value;
+  }
+  return strtoull(value, NULL, 10);
+}
+
+static void read_constants() {
+  const char * value = getenv("PRTEST_CONSTANTS");
+  char * parse_end;
+
+  while (value != NULL && *value != '\0' && constant_count < MAX_CONSTANTS) {
+    /* Negative constants wrap around, which gives the same bits as their two's complement */
+    constants[constant_count] = strtoull(value, &parse_end, 10);
+    if (parse_end == value) {
+      break;
+    }
+    constant_count++;
+    value = *parse_end == ',' ? parse_end + 1 : parse_end;
+  }
+}
+
+static long long get_time_ns() {
+  struct timespec curr_time;
+  clock_gettime(CLOCK_MONOTONIC, &curr_time);
+  return curr_time.tv_sec * 1000000000LL + curr_time.tv_nsec;
+}
+
+struct batch {
+  char * data;
+  size_t length;
+  size_t capacity;
+  unsigned int vector_count;
+  unsigned int file_count;
+  long long start_time;
+};
+
+static void add_to_batch(struct batch * batch, const char * text, size_t length) {
+  if (batch->length + length > batch->capacity) {
+    while (batch->length + length > batch->capacity) {
+      batch->capacity = batch->capacity ? 2 * batch->capacity : VECTOR_BUFFER_SIZE;
+    }
+    batch->data = realloc(batch->data, batch->capacity);
+    if (batch->data == NULL) {
+      perror("realloc");
+      exit(2);
+    }
+  }
+  memcpy(batch->data + batch->length, text, length);
+  batch->length += length;
+}
+
+static void write_batch(struct batch * batch) {
+  char file_name[64];
+  FILE * output;
+
+  if (batch->vector_count == 0) {
+    return;
+  }
+  output = fopen("vectors.test.tmp", "w");
+  if (output == NULL) {
+    perror("fopen");
+    exit(2);
+  }
+  fwrite(batch->data, 1, batch->length, output);
+  fclose(output);
+  snprintf(file_name, sizeof(file_name), "vectors%u.test", batch->file_count);
+  rename("vectors.test.tmp", file_name);
+
+  batch->file_count++;
+  batch->length = 0;
+  batch->vector_count = 0;
+  batch->start_time = get_time_ns();
+}
+
+static void run_tests() {
+  unsigned long long seed = get_env_value("PRTEST_SEED", (unsigned long long) get_time_ns());
+  unsigned long long test_count = get_env_value("PRTEST_TESTS", 0);
+  unsigned int timeout = get_env_value("PRTEST_TIMEOUT", 1);
+  struct batch batch = {NULL, 0, 0, 0, 0, get_time_ns()};
+  char header[64];
+  pid_t parent_pid = getpid();
+
+  read_constants();
+
+  vector_buffer = mmap(NULL, VECTOR_BUFFER_SIZE, PROT_READ | PROT_WRITE, MAP_SHARED | MAP_ANONYMOUS, -1, 0);
+  if (vector_buffer == MAP_FAILED) {
+    perror("mmap");
+    exit(2);
+  }
+
+  for (unsigned long long test = 0; test_count == 0 || test < test_count; test++) {
+    int status;
+    pid_t child;
+
+    vector_buffer->length = 0;
+    vector_buffer->overflow = 0;
+    vector_buffer->error_reached = 0;
+    fflush(NULL);
+    child = fork();
+    if (child < 0) {
+      perror("fork");
+      exit(2);
+    } else if (child == 0) {
+#ifdef __linux__
+      prctl(PR_SET_PDEATHSIG, SIGKILL);
+      if (getppid() != parent_pid) {
+        _exit(0);
+      }
+#endif
+      alarm(timeout);
+      rand_state = seed + test;
+      return;  /* Run the program under test */
+    }
+
+    while (waitpid(child, &status, 0) < 0) {
+      if (errno != EINTR) {
+        perror("waitpid");
+        exit(2);
+      }
+    }
+    /* A vector that didn't fit into the buffer is incomplete and can't be replayed */
+    if (!vector_buffer->overflow) {
+      size_t length = snprintf(header, sizeof(header), "# vector %llu%s\n", seed + test,
+                               vector_buffer->error_reached ? " error" : "");
+      add_to_batch(&batch, header, length);
+      add_to_batch(&batch, vector_buffer->data, vector_buffer->length);
+      batch.vector_count++;
+    }
+    if (vector_buffer->error_reached || batch.vector_count >= MAX_BATCH_SIZE
+        || get_time_ns() - batch.start_time >= MAX_BATCH_TIME_NS) {
+      write_batch(&batch);
+    }
+  }
+  write_batch(&batch);
+  exit(0);
+}
 
-  fprintf(vector, "\n");
-  fclose(vector);
+__attribute__((constructor))
+static void start_engine() {
+  run_tests();
 }
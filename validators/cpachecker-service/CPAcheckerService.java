@@ -0,0 +1,130 @@
+import java.io.BufferedReader;
+import java.io.FileDescriptor;
+import java.io.FileOutputStream;
+import java.io.InputStreamReader;
+import java.io.PrintStream;
+import java.lang.reflect.InvocationTargetException;
+import java.lang.reflect.Method;
+import java.nio.charset.StandardCharsets;
+import java.security.Permission;
+import java.util.Arrays;
+
+/**
+ * Resident Java VM that runs CPAchecker on one request after another.
+ *
+ * <p>Each request is a line on stdin: the file to write the output of CPAchecker to, followed by the
+ * command-line arguments of CPAchecker, all separated by tabs. CPAchecker runs through its usual main
+ * class, so its output is the same as the output of cpa.sh. Calls of System.exit by CPAchecker are
+ * trapped. After each request, a line 'done STATUS' is written to stdout, where STATUS is the exit
+ * status of the run.
+ *
+ * <p>If a run ran out of memory, if the used heap stays above the given fraction of the maximum heap
+ * after the run, or if the given number of requests was handled, the reply is 'restart STATUS' and
+ * the service exits, so that the next request starts with a fresh Java VM.
+ *
+ * <p>If System.exit can't be trapped, the service exits with status 1 before it reports that it is
+ * ready.
+ *
+ * <p>Arguments: the maximum number of requests, and the fraction of the maximum heap.
+ */
+public final class CPAcheckerService {
+
+  private static final String MAIN_CLASS = "org.sosy_lab.cpachecker.cmdline.CPAMain";
+
+  private static final class ExitTrappedException extends SecurityException {
+    private static final long serialVersionUID = 1L;
+    final int status;
+
+    ExitTrappedException(int status) {
+      super("System.exit(" + status + ") trapped");
+      this.status = status;
+    }
+  }
+
+  private static final class ExitTrap extends SecurityManager {
+    @Override
+    public void checkExit(int status) {
+      throw new ExitTrappedException(status);
+    }
+
+    @Override
+    public void checkPermission(Permission perm) {}
+
+    @Override
+    public void checkPermission(Permission perm, Object context) {}
+  }
+
+  private CPAcheckerService() {}
+
+  public static void main(String[] args) throws Exception {
+    int maxRequests = Integer.parseInt(args[0]);
+    double maxHeapFraction = Double.parseDouble(args[1]);
+
+    PrintStream replies =
+        new PrintStream(new FileOutputStream(FileDescriptor.out), true, StandardCharsets.UTF_8.name());
+    PrintStream originalErr = System.err;
+    // Stdout carries the replies, so any other output goes to stderr
+    System.setOut(originalErr);
+    BufferedReader requests =
+        new BufferedReader(new InputStreamReader(System.in, StandardCharsets.UTF_8));
+    Method main = Class.forName(MAIN_CLASS).getMethod("main", String[].class);
+
+    try {
+      System.setSecurityManager(new ExitTrap());
+    } catch (UnsupportedOperationException | SecurityException e) {
+      // Without the trap, the first run would end the Java VM, so the service is not usable
+      originalErr.println("Can't trap System.exit: " + e);
+      System.exit(1);
+    }
+    replies.println("ready");
+
+    String request;
+    int handledRequests = 0;
+    while ((request = requests.readLine()) != null) {
+      String[] fields = request.split("\t", -1);
+      String[] cpacheckerArgs = Arrays.copyOfRange(fields, 1, fields.length);
+      int status = 0;
+      boolean restart = false;
+
+      try (PrintStream output =
+          new PrintStream(new FileOutputStream(fields[0]), true, StandardCharsets.UTF_8.name())) {
+        System.setOut(output);
+        System.setErr(output);
+        try {
+          main.invoke(null, (Object) cpacheckerArgs);
+        } catch (InvocationTargetException e) {
+          Throwable cause = e.getCause();
+          if (cause instanceof ExitTrappedException) {
+            status = ((ExitTrappedException) cause).status;
+          } else {
+            cause.printStackTrace(output);
+            status = 1;
+            restart = cause instanceof OutOfMemoryError;
+          }
+        } catch (OutOfMemoryError e) {
+          e.printStackTrace(output);
+          status = 1;
+          restart = true;
+        } finally {
+          System.setOut(originalErr);
+          System.setErr(originalErr);
+        }
+      }
+
+      handledRequests++;
+      Runtime runtime = Runtime.getRuntime();
+      System.gc();
+      long usedHeap = runtime.totalMemory() - runtime.freeMemory();
+      restart |= handledRequests >= maxRequests
+          || usedHeap > maxHeapFraction * runtime.maxMemory();
+      replies.println((restart ? "restart " : "done ") + status);
+      if (restart) {
+        break;
+      }
+    }
+    // Threads that CPAchecker left running must not keep the Java VM alive.
+    // The trap would also stop halt, so it is removed first.
+    System.setSecurityManager(null);
+    Runtime.getRuntime().halt(0);
+  }
+}